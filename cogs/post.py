@@ -7,11 +7,17 @@ from services.posting import (
     create_embed_and_send,
     error_description as _error_description,
     fetch_and_validate_image,
+    fetch_and_validate_pages,
     find_character_threads,
     find_forum_by_name,
+    parse_pages,
+    post_batch,
     tags_model_pass,
+    tags_model_pass_many,
     tags_pixiv_pass,
 )
+from services.rest import Priority
+from services.status import StatusCoalescer
 from view import AutoPostView
 
 
@@ -54,21 +60,24 @@ async def _start_status_message(ctx: commands.Context, initial_step: str) -> dis
     return await ctx.send(embed=embed)
 
 
-def _make_status_updater(message: discord.Message, command_name: str):
-    """Return an async callable(step_text) that edits the status message."""
-    async def update(step: str) -> None:
-        try:
-            await message.edit(embed=_status_embed(step, command_name))
-        except discord.HTTPException:
-            # A status-update glitch should never break the command.
-            pass
-    return update
+def _make_status_updater(bot, message: discord.Message, command_name: str) -> StatusCoalescer:
+    """Return an async callable(step_text) that edits the status message.
+
+    Steps are coalesced (services/status.py) and the edits go through the
+    bot's RestScheduler behind the actual posts. Call its settle() before
+    replacing the status embed for good.
+    """
+    async def edit(step: str) -> None:
+        embed = _status_embed(step, command_name)
+        await bot.rest.run(f"channel:{message.channel.id}", Priority.STATUS, lambda: message.edit(embed=embed))
+    return StatusCoalescer(edit)
 
 
 def _build_confirmation_embed(
     characters: str | None,
     selected_forum: discord.ForumChannel | None,
     last_error: Exception | None,
+    pages: str | None = None,
 ) -> discord.Embed:
     if last_error is None:
         embed = discord.Embed(
@@ -90,6 +99,8 @@ def _build_confirmation_embed(
     forum_desc = selected_forum.mention if selected_forum else "Please select a forum channel."
     embed.add_field(name="Characters", value=chara_desc, inline=False)
     embed.add_field(name="Forum", value=forum_desc, inline=False)
+    if pages is not None:
+        embed.add_field(name="Images", value=pages, inline=False)
     return embed
 
 
@@ -103,10 +114,13 @@ class PostingCog(commands.Cog):
         error: Exception,
         *,
         status_message: discord.Message | None = None,
+        update: StatusCoalescer | None = None,
     ) -> None:
         """Render an error embed in the status/deferred message (or send a fresh message if neither exists)."""
         self.bot.logger.error("Posting command error", exc_info=error)
         embed = _build_error_embed(error, ctx.command)
+        if update is not None:
+            await update.settle()
         if status_message is not None:
             try:
                 await status_message.edit(embed=embed, view=None, attachments=[])
@@ -122,7 +136,7 @@ class PostingCog(commands.Cog):
         await ctx.send(embed=embed)
 
     @commands.hybrid_command(name="autopost")
-    async def auto_post(self, ctx: commands.Context, link: str, image_num: int | None = None):
+    async def auto_post(self, ctx: commands.Context, link: str, image_num: int | None = None, pages: str | None = None):
         """
         Post art to one of the art forum channels
 
@@ -134,18 +148,25 @@ class PostingCog(commands.Cog):
             Pixiv or Twitter link to image.
         image_num: str
             Optional argument to select specific image from multiple ones in a post.
+        pages: str
+            Optional list or range of images to post together, e.g. 1-3,5 or all.
         """
         await ctx.defer()
         message = await _start_status_message(ctx, "🔗 Reading link...")
-        update = _make_status_updater(message, ctx.command.qualified_name)
+        update = _make_status_updater(self.bot, message, ctx.command.qualified_name)
+
+        if pages is not None:
+            return await self._auto_post_batch(ctx, message, update, link, pages)
 
         try:
-            post_data, hq_image, image_name, hashes, embed_fallback, platform = await fetch_and_validate_image(
+            post_data, hq_image, image_name, analysis, embed_fallback, platform = await fetch_and_validate_image(
                 self.bot, link, ctx.guild, image_num, on_status=update,
             )
 
             # Run ML model for character/series detection (works for all platforms)
-            charas_model, series, safety = await tags_model_pass(self.bot, hq_image, image_name, on_status=update)
+            charas_model, series, safety = await tags_model_pass(
+                self.bot, hq_image, image_name, on_status=update, analysis=analysis,
+            )
             characters = ",".join(charas_model)
 
             # For Pixiv, also check Pixiv tags for additional character/series info
@@ -158,7 +179,7 @@ class PostingCog(commands.Cog):
             # Finding forum channel based on detected series and safety
             selected_forum = find_forum_by_name(ctx.guild, series, safety)
         except Exception as e:
-            return await self._send_error(ctx, e, status_message=message)
+            return await self._send_error(ctx, e, status_message=message, update=update)
 
         last_error: Exception | None = None
 
@@ -171,6 +192,7 @@ class PostingCog(commands.Cog):
                 timeout=300,
             )
             embed = _build_confirmation_embed(characters, selected_forum, last_error)
+            await update.settle()
             await message.edit(embed=embed, view=view)
             view.message = message
 
@@ -185,16 +207,17 @@ class PostingCog(commands.Cog):
                     color=discord.Color.red(),
                     timestamp=datetime.datetime.now(),
                 )
+                await update.settle()
                 await message.edit(embed=cancel_embed, view=None)
                 return
 
             try:
-                threads, _, _ = await find_character_threads(selected_forum, characters, on_status=update)
+                threads, _, _ = await find_character_threads(selected_forum, characters, on_status=update, rest=self.bot.rest)
                 hq_image.seek(0)
                 img = hq_image.read()
                 thread_links, post_id = await create_embed_and_send(
                     self.bot, link, post_data, threads, ctx.author.name, ctx.guild.id, selected_forum.name,
-                    embed_fallback, img, image_name, hashes, image_num, platform,
+                    embed_fallback, img, image_name, analysis.hashes, image_num, platform,
                     on_status=update,
                 )
 
@@ -207,6 +230,7 @@ class PostingCog(commands.Cog):
                 success_embed.add_field(name="Threads & Links", value=thread_links)
                 if post_id is not None:
                     success_embed.set_footer(text=f"Post ID: {post_id} — use /deletepost to remove from database")
+                await update.settle()
                 await message.edit(embed=success_embed, view=None)
                 return
             except Exception as e:
@@ -215,6 +239,95 @@ class PostingCog(commands.Cog):
                 # Loop continues: the next iteration rebuilds the embed with the
                 # error notice and re-enables the view with a Retry button.
 
+    async def _auto_post_batch(self, ctx: commands.Context, message: discord.Message, update, link: str, pages: str):
+        """/autopost with `pages`: one fetch, one tagging session, one confirmation
+        and one thread lookup for every selected image."""
+        try:
+            post_data, images, skipped, platform = await fetch_and_validate_pages(
+                self.bot, link, ctx.guild, parse_pages(pages), on_status=update,
+            )
+
+            charas_model, series, safety = await tags_model_pass_many(self.bot, images, on_status=update)
+            characters = ",".join(charas_model)
+
+            if platform == "pixiv":
+                charas_pixiv, series_pixiv = tags_pixiv_pass(self.bot.config, post_data)
+                characters = ",".join(charas_model | charas_pixiv)
+                if series_pixiv:
+                    series = series_pixiv
+
+            selected_forum = find_forum_by_name(ctx.guild, series, safety)
+        except Exception as e:
+            return await self._send_error(ctx, e, status_message=message, update=update)
+
+        page_list = ", ".join(str(image.page) for image in images)
+        if skipped:
+            page_list += "\n**Skipped (already posted):**\n" + "\n".join(f"- {entry}" for entry in skipped)
+
+        last_error: Exception | None = None
+        posted_links: list[str] = []
+        post_ids: list[int] = []
+
+        while True:
+            view = AutoPostView(
+                ctx.author,
+                characters=characters,
+                selected_forum=selected_forum,
+                retry=last_error is not None,
+                timeout=300,
+            )
+            embed = _build_confirmation_embed(characters, selected_forum, last_error, pages=page_list)
+            await update.settle()
+            await message.edit(embed=embed, view=view)
+            view.message = message
+
+            await view.wait()
+            characters = view.characters
+            selected_forum = view.selected_forum
+
+            if not view.confirmed:
+                cancel_embed = discord.Embed(
+                    title="Autopost Cancelled",
+                    description="The poster has cancelled the post or it has timed out.",
+                    color=discord.Color.red(),
+                    timestamp=datetime.datetime.now(),
+                )
+                if posted_links:
+                    cancel_embed.add_field(name="Already posted", value="\n".join(posted_links)[:1024])
+                await update.settle()
+                await message.edit(embed=cancel_embed, view=None)
+                return
+
+            try:
+                threads, _, _ = await find_character_threads(selected_forum, characters, on_status=update, rest=self.bot.rest)
+                # post_batch drops each image once it's posted, so a retry resumes.
+                links, ids = await post_batch(
+                    self.bot, link, post_data, threads, ctx.author.name, ctx.guild.id, selected_forum.name,
+                    images, platform, on_status=update,
+                )
+                posted_links += links
+                post_ids += ids
+            except Exception as e:
+                self.bot.logger.error("Posting command error", exc_info=e)
+                last_error = e
+                page_list = ", ".join(str(image.page) for image in images)
+                continue
+
+            success_embed = discord.Embed(
+                title="Successfully posted!",
+                description=f"Your art has been posted in {selected_forum.jump_url}",
+                color=discord.Color.green(),
+                timestamp=datetime.datetime.now(),
+            )
+            success_embed.add_field(name="Threads & Links", value="\n".join(posted_links)[:1024])
+            if skipped:
+                success_embed.add_field(name="Skipped (already posted)", value="\n".join(skipped)[:1024], inline=False)
+            if post_ids:
+                success_embed.set_footer(text=f"Post IDs: {', '.join(map(str, post_ids))} — use /deletepost to remove from database")
+            await update.settle()
+            await message.edit(embed=success_embed, view=None)
+            return
+
     @commands.hybrid_command(name="post")
     async def post(self, ctx: commands.Context, forum_channel: discord.channel.ForumChannel, characters: str, link: str, image_num: int | None = None):
         """
@@ -235,23 +348,23 @@ class PostingCog(commands.Cog):
         """
         await ctx.defer()
         message = await _start_status_message(ctx, "🔗 Reading link...")
-        update = _make_status_updater(message, ctx.command.qualified_name)
+        update = _make_status_updater(self.bot, message, ctx.command.qualified_name)
 
         try:
-            post_data, hq_image, image_name, hashes, embed_fallback, platform = await fetch_and_validate_image(
+            post_data, hq_image, image_name, analysis, embed_fallback, platform = await fetch_and_validate_image(
                 self.bot, link, ctx.guild, image_num, on_status=update,
             )
 
-            threads, _, _ = await find_character_threads(forum_channel, characters.strip(), on_status=update)
+            threads, _, _ = await find_character_threads(forum_channel, characters.strip(), on_status=update, rest=self.bot.rest)
 
             img = hq_image.read()
             thread_links, post_id = await create_embed_and_send(
                 self.bot, link, post_data, threads, ctx.author.name, ctx.guild.id, forum_channel.name,
-                embed_fallback, img, image_name, hashes, image_num, platform,
+                embed_fallback, img, image_name, analysis.hashes, image_num, platform,
                 on_status=update,
             )
         except Exception as e:
-            return await self._send_error(ctx, e, status_message=message)
+            return await self._send_error(ctx, e, status_message=message, update=update)
 
         embed = discord.Embed(
             title="Successfully posted!",
@@ -262,6 +375,7 @@ class PostingCog(commands.Cog):
         embed.add_field(name="Threads & Links", value=thread_links)
         if post_id is not None:
             embed.set_footer(text=f"Post ID: {post_id} — use /deletepost to remove from database")
+        await update.settle()
         await message.edit(embed=embed)
 
     @post.error
@@ -290,6 +404,8 @@ class PostingCog(commands.Cog):
                         "\nThe bot will download and upload the selected image as a new embed if allowed by the server upload limit. Otherwise, an external embed service (like Phixiv) will be used."), inline=False)
         embed.add_field(name="{image_num}", value=("This is an optional argument. Use it for when a post has multiple images and you want to select a specific one."
                         "\nMust be a number (Ex. 2 for 2nd image in the post)."), inline=False)
+        embed.add_field(name="{pages} (/autopost)", value=("Optional. Post several images of a post at once, with a single confirmation."
+                        "\nList pages and ranges split by commas (Ex: `1-3,5`), or `all`. Images that were already posted are skipped."), inline=False)
         embed.add_field(name="Note on Tags", value=("Please note that if a character thread has a tag, the default behaviour is to find a group thread for that tag."
                         "\nIf that causes issues with posting, please ping Maren about it."), inline=False)
         await ctx.send(embed=embed)
@@ -21,7 +21,7 @@ class SyncCog(commands.Cog):
                 synced = []
             else:
                 #ctx.bot.tree.clear_commands(guild=None)
-                synced = await ctx.bot.tree.sync()
+                synced = await ctx.bot.sync_commands(force=True)
 
             await ctx.send(
                 f"Synced {len(synced)} commands {'globally' if spec is None else 'to the current guild.'}"
@@ -7,6 +7,8 @@ from discord.ext import commands, tasks
 
 from utils.tag_extract import run_update
 
+CONFIG_WATCH_SECONDS = float(os.getenv("CONFIG_WATCH_SECONDS", "10"))  # 0 disables
+
 
 class Tasks(commands.Cog):
     """Periodically pings the tagger spaces to prevent them from sleeping."""
@@ -16,10 +18,14 @@ class Tasks(commands.Cog):
         self.logger = logging.getLogger(self.__class__.__name__)
         self.gradio_keepalive.start()
         self.char_map_refresh.start()
+        if CONFIG_WATCH_SECONDS > 0:
+            self.config_watch.change_interval(seconds=CONFIG_WATCH_SECONDS)
+            self.config_watch.start()
 
     def cog_unload(self) -> None:
         self.gradio_keepalive.cancel()
         self.char_map_refresh.cancel()
+        self.config_watch.cancel()
 
     @tasks.loop(hours=23)
     async def gradio_keepalive(self) -> None:
@@ -73,6 +79,17 @@ class Tasks(commands.Cog):
     async def before_char_map_refresh(self) -> None:
         await self.bot.wait_until_ready()
 
+    @tasks.loop(seconds=10)
+    async def config_watch(self) -> None:
+        """Pick up config files edited outside the bot (stat per file; only changed files are re-read)."""
+        try:
+            changed = self.bot.config.reload()
+        except Exception as e:
+            self.logger.error(f"Config reload failed: {e}")
+            return
+        if changed:
+            self.logger.info(f"Reloaded config: {', '.join(changed)}")
+
     @staticmethod
     def _create_1x1_png() -> bytes:
         """Return the raw bytes of a minimal 1×1 red PNG image."""
@@ -149,7 +149,7 @@ class ThreadCog(commands.Cog):
             List of tags to add to the thread. Case-insensitive and comma seperated.
         """
         series = series.strip().lower()
-        safety_levels = set(self.bot.config.safety_map.values())
+        safety_levels = self.bot.config.safety_levels
         target_names = {f"{series}-{safety}" for safety in safety_levels}
 
         forum_channels = [
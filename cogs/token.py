@@ -10,6 +10,28 @@ class TokenCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
+    # Keep the userscript API's poster cache (services/posters.py) current.
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        self.bot.posters.member_updated(after)
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+        self.bot.posters.member_joined(member)
+
+    @commands.Cog.listener()
+    async def on_raw_member_remove(self, payload: discord.RawMemberRemoveEvent):
+        self.bot.posters.member_removed(payload.guild_id, payload.user.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role):
+        self.bot.posters.guild_changed(role.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        self.bot.posters.guild_changed(guild.id)
+
     @commands.hybrid_command(name="token")
     @commands.guild_only()
     async def token(self, ctx: commands.Context):
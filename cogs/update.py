@@ -10,6 +10,15 @@ class UpdateCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
+    def _replace_config(self, filename: str, json_data: bytes) -> None:
+        """Validate and atomically replace a config file, then reload what changed."""
+        json.loads(json_data)
+        path = self.bot.config.base_path / filename
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(json_data)
+        tmp.replace(path)
+        self.bot.config.reload()
+
     @commands.hybrid_group(name="update")
     @commands.guild_only()
     @commands.is_owner()
@@ -40,9 +49,7 @@ class UpdateCog(commands.Cog):
             await ctx.send("❌ Invalid file type. Please upload a `.json` file.")
             return
         try:
-            json_data = await json_file.read()
-            self.bot.char_map = json.loads(json_data)
-            open("./configs/char_map.json", "wb").write(json_data)
+            self._replace_config("char_map.json", await json_file.read())
             await ctx.send("✅ Character map updated successfully.")
         except Exception as e:
             await ctx.send(f"❌ Failed to update character map: {e}")
@@ -65,9 +72,7 @@ class UpdateCog(commands.Cog):
             await ctx.send("❌ Invalid file type. Please upload a `.json` file.")
             return
         try:
-            json_data = await json_file.read()
-            self.bot.series_map = json.loads(json_data)
-            open("./configs/series_map.json", "wb").write(json_data)
+            self._replace_config("series_map.json", await json_file.read())
             await ctx.send("✅ Series map updated successfully.")
         except Exception as e:
             await ctx.send(f"❌ Failed to update series map: {e}")
@@ -90,9 +95,7 @@ class UpdateCog(commands.Cog):
             await ctx.send("Invalid file type. Please upload a `.json` file.")
             return
         try:
-            json_data = await json_file.read()
-            self.bot.webhooks = json.loads(json_data)
-            open("./configs/webhooks.json", "wb").write(json_data)
+            self._replace_config("webhooks.json", await json_file.read())
             await ctx.send("Webhooks updated successfully.")
         except Exception as e:
             await ctx.send(f"Failed to update webhooks: {e}")
@@ -100,13 +103,14 @@ class UpdateCog(commands.Cog):
     @update.command(name="char_map_refresh")
     @commands.guild_only()
     @commands.is_owner()
-    async def char_map_refresh(self, ctx: commands.Context):
+    async def char_map_refresh(self, ctx: commands.Context, full: bool = False):
         """
         Force refresh the character map using Danbooru data.
+        Only changes since the last refresh are fetched unless full is set.
         """
         await ctx.defer()
         try:
-            total = await asyncio.to_thread(run_update, self.bot.config)
+            total = await asyncio.to_thread(run_update, self.bot.config, None, full)
             self.bot.config.reload_char_map()
             await ctx.send(f"Character map refresh completed with {total} entries.")
         except Exception as e:
@@ -1,7 +1,13 @@
+import hashlib
 import json
+import re
 
+from collections.abc import Mapping
+from dataclasses import dataclass
 from pathlib import Path
 
+from utils import compiled_map
+
 TAGGER_DEFAULTS: dict[str, str] = {
     "gpu_space": "Halfabumcake/cl_tagger_v2_gpu",
     "cpu_space": "Halfabumcake/cl_tagger_v2_cpu",
@@ -16,19 +22,142 @@ TAGGER_DEFAULTS: dict[str, str] = {
     "gpu_cooldown_minutes": "30",
 }
 
+# Flat str -> str maps served from compiled snapshots. series_map stays a dict:
+# its order matters (first matching series wins in the text pass).
+COMPILED_MAPS = ("char_map.json", "safety_map.json", "manual_overrides.json")
+
+# Derived index -> the config attribute it is computed from.
+DERIVED_FROM: dict[str, str] = {
+    "safety_levels": "safety_map",
+    "char_text_index": "char_map",
+    "series_text_index": "series_map",
+}
+
+
+# attribute -> (file, loader method). Every file is tracked separately so a
+# reload only re-reads what actually changed.
+CONFIG_FILES: dict[str, tuple[str, str]] = {
+    "webhooks": ("webhooks.json", "load_json"),
+    "char_map": ("char_map.json", "load_map"),
+    "series_map": ("series_map.json", "load_json"),
+    "safety_map": ("safety_map.json", "load_map"),
+    "target_series": ("target_series.json", "load_set"),
+    "skip_tags": ("skip_tags.json", "load_set"),
+    "manual_overrides": ("manual_overrides.json", "load_map"),
+    "api_settings": ("api_settings.json", "load_dict"),
+    "tagger_settings": ("tagger_settings.json", "load_tagger_dict"),
+}
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase and fold underscores/whitespace, for matching tags in free text."""
+    return re.sub(r"[_\s]+", " ", text.lower())
+
+
+def _text_index(mapping) -> list[tuple[str, str]]:
+    """(normalized key, value) pairs in mapping order, for tags_text_pass."""
+    index = []
+    for tag, name in mapping.items():
+        key = normalize_text(tag)
+        if key:
+            index.append((key, name))
+    return index
+
+
+@dataclass(frozen=True)
+class FileStamp:
+    mtime_ns: int
+    size: int
+    digest: str
+
 
 class Config:
     def __init__(self, path: str):
         self.base_path = Path(path)
-        self.webhooks = self.load_json((self.base_path / "webhooks.json"))
-        self.char_map = self.load_json((self.base_path / "char_map.json"))
-        self.series_map = self.load_json((self.base_path / "series_map.json"))
-        self.safety_map = self.load_json((self.base_path / "safety_map.json"))
-        self.target_series = self.load_set((self.base_path / "target_series.json"))
-        self.skip_tags = self.load_set((self.base_path / "skip_tags.json"))
-        self.manual_overrides = self.load_dict((self.base_path / "manual_overrides.json"))
-        self.api_settings = self.load_dict((self.base_path / "api_settings.json"))
-        self.tagger_settings = self.load_tagger_settings()
+        self._stamps: dict[str, FileStamp | None] = {}
+        self._derived: dict[str, object] = {}
+        self.reload_all()
+
+    # -- change detection ---------------------------------------------------
+
+    def _stamp(self, path: Path, previous: FileStamp | None) -> FileStamp | None:
+        """Current stamp; the content is only hashed when mtime/size moved."""
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        if previous is not None and (stat.st_mtime_ns, stat.st_size) == (previous.mtime_ns, previous.size):
+            return previous
+        try:
+            digest = hashlib.sha256(path.read_bytes()).hexdigest()
+        except OSError:
+            return None
+        return FileStamp(stat.st_mtime_ns, stat.st_size, digest)
+
+    def changed_files(self) -> dict[str, FileStamp | None]:
+        """Attributes whose file content differs from what is loaded, with their new stamps.
+        Touched-but-identical files only get their stamp refreshed."""
+        changed = {}
+        for attr, (filename, _) in CONFIG_FILES.items():
+            old = self._stamps.get(attr)
+            new = self._stamp(self.base_path / filename, old)
+            if new == old:
+                continue
+            if old is not None and new is not None and new.digest == old.digest:
+                self._stamps[attr] = new
+                continue
+            changed[attr] = new
+        return changed
+
+    def _publish(self, stamps: dict[str, FileStamp | None]) -> None:
+        """Load the given attributes, then swap them in together so readers
+        never see half of a reload."""
+        values = {
+            attr: getattr(self, CONFIG_FILES[attr][1])(self.base_path / CONFIG_FILES[attr][0])
+            for attr in stamps
+        }
+        self.__dict__.update(values)
+        self._stamps.update(stamps)
+        for name in [n for n, source in DERIVED_FROM.items() if source in values]:
+            self._derived.pop(name, None)
+
+    def reload(self) -> list[str]:
+        """Reload only the files that changed on disk; returns their attribute names."""
+        changed = self.changed_files()
+        if changed:
+            self._publish(changed)
+        return list(changed)
+
+    def reload_char_map(self) -> None:
+        changed = self.changed_files()
+        if "char_map" in changed:
+            self._publish({"char_map": changed["char_map"]})
+
+    def reload_all(self) -> None:
+        self._publish({
+            attr: self._stamp(self.base_path / filename, None)
+            for attr, (filename, _) in CONFIG_FILES.items()
+        })
+
+    # -- derived indexes ------------------------------------------------------
+    # Built on first use and dropped when their source file is reloaded.
+
+    def _derive(self, name: str, build):
+        if name not in self._derived:
+            self._derived[name] = build()
+        return self._derived[name]
+
+    @property
+    def safety_levels(self) -> frozenset[str]:
+        return self._derive("safety_levels", lambda: frozenset(self.safety_map.values()))
+
+    @property
+    def char_text_index(self) -> list[tuple[str, str]]:
+        return self._derive("char_text_index", lambda: _text_index(self.char_map))
+
+    @property
+    def series_text_index(self) -> list[tuple[str, str]]:
+        return self._derive("series_text_index", lambda: _text_index(self.series_map))
 
     @property
     def poster_role_id(self) -> int | None:
@@ -56,22 +185,11 @@ class Config:
         else:
             return {}
 
-    def reload_char_map(self) -> None:
-        self.char_map = self.load_json((self.base_path / "char_map.json"))
-
-    def reload_all(self) -> None:
-        self.webhooks = self.load_json(self.base_path / "webhooks.json")
-        self.char_map = self.load_json(self.base_path / "char_map.json")
-        self.series_map = self.load_json(self.base_path / "series_map.json")
-        self.safety_map = self.load_json(self.base_path / "safety_map.json")
-        self.target_series = self.load_set(self.base_path / "target_series.json")
-        self.skip_tags = self.load_set(self.base_path / "skip_tags.json")
-        self.manual_overrides = self.load_dict(self.base_path / "manual_overrides.json")
-        self.api_settings = self.load_dict(self.base_path / "api_settings.json")
-        self.tagger_settings = self.load_tagger_settings()
-
     def load_tagger_settings(self) -> dict:
-        return {**TAGGER_DEFAULTS, **self.load_dict(self.base_path / "tagger_settings.json")}
+        return self.load_tagger_dict(self.base_path / "tagger_settings.json")
+
+    def load_tagger_dict(self, path: Path) -> dict:
+        return {**TAGGER_DEFAULTS, **self.load_dict(path)}
 
     def load_set(self, path: Path) -> set[str]:
         data = self.load_json(path)
@@ -79,4 +197,10 @@ class Config:
 
     def load_dict(self, path: Path) -> dict:
         data = self.load_json(path)
-        return data if isinstance(data, dict) else {}
\ No newline at end of file
+        return data if isinstance(data, dict) else {}
+
+    def load_map(self, path: Path) -> Mapping[str, str]:
+        """Flat str -> str map served from its compiled snapshot (see
+        utils/compiled_map.py); falls back to parsing the JSON."""
+        compiled = compiled_map.load(path)
+        return compiled if compiled is not None else self.load_dict(path)
\ No newline at end of file
@@ -1,20 +1,97 @@
+import asyncio
+import logging
 from pathlib import Path
 from tortoise import Tortoise
-import imagehash
+from tortoise.transactions import in_transaction
+import numpy as np
 
-from db.models import Image
+from db import search
+from db.hash_index import HashIndex, SnapshotError, write_snapshot
+from db.models import Image, ImageFingerprint
+from utils.fingerprint import EXTRA_DESCRIPTORS, to_vector
 
+LOGGER = logging.getLogger(__name__)
 
-def _hamming_distance(h1: str, h2: str) -> int:
-    """Calculate hamming distance between two hex hash strings."""
-    return imagehash.hex_to_hash(h1) - imagehash.hex_to_hash(h2)
+HASH_INDEX_CHUNK = 20000  # rows per hydration query
+SNAPSHOT_EVERY = 500      # new images between hash index snapshots
+
+# Keep image_facets (per platform/guild counts) current on every insert and
+# delete, whichever process or code path touches `images`.
+FACET_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS images_facets_ai AFTER INSERT ON images BEGIN
+        INSERT INTO image_facets (source_platform, guild_id, count)
+        VALUES (new.source_platform, new.guild_id, 1)
+        ON CONFLICT (source_platform, guild_id) DO UPDATE SET count = count + 1;
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS images_facets_ad AFTER DELETE ON images BEGIN
+        UPDATE image_facets SET count = count - 1
+        WHERE source_platform = old.source_platform AND guild_id = old.guild_id;
+        DELETE FROM image_facets
+        WHERE source_platform = old.source_platform AND guild_id = old.guild_id AND count <= 0;
+    END;
+    """,
+)
+FINGERPRINT_DELETE_TRIGGER = """
+    CREATE TRIGGER IF NOT EXISTS images_fingerprints_ad AFTER DELETE ON images BEGIN
+        DELETE FROM image_fingerprints WHERE image_id = old.id;
+    END;
+"""
+
+# Nullable columns added to existing tables after their first release;
+# generate_schemas only creates missing tables, so connect() adds these.
+ADDED_COLUMNS = (
+    ("pending_submissions", "analysis", "JSON NULL"),
+)
+
+# images rows joined with their fingerprint, as read into the hash index.
+FINGERPRINT_SELECT = (
+    "SELECT i.id, i.phash, i.dhash, i.guild_id, "
+    + ", ".join(f"f.{name}" for name in EXTRA_DESCRIPTORS)
+    + " FROM images i LEFT JOIN image_fingerprints f ON f.image_id = i.id"
+)
+
+
+def _index_arrays(rows) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray] | None:
+    """(ids, hashes, guilds, full) for rows of FINGERPRINT_SELECT; malformed hashes are skipped."""
+    ids, vectors, guilds, full = [], [], [], []
+    for row in rows:
+        try:
+            vector, complete = to_vector(dict(row))
+        except (TypeError, ValueError):
+            continue
+        ids.append(row["id"])
+        vectors.append(vector)
+        guilds.append(row["guild_id"])
+        full.append(complete)
+    if not ids:
+        return None
+    return (
+        np.array(ids, dtype=np.int64),
+        np.stack(vectors),
+        np.array(guilds, dtype=np.int64),
+        np.array(full, dtype=bool),
+    )
 
 
 class Database:
-    _hash_cache: dict[str, int] | None = None  # phash -> image_id
+    _hash_index: HashIndex | None = None
+    _hash_high = 0  # highest image id the index hydration reads itself
 
-    def __init__(self, path: str | Path):
+    def __init__(self, path: str | Path, snapshot_path: str | Path | None = None):
         self.path = str(path)
+        # Hash index snapshot (db/hash_index.py), mapped at startup so only
+        # images added since it was written are read from SQLite.
+        self.snapshot_path = Path(snapshot_path or f"{self.path}.hashidx")
+        # Set once the hash index is fully hydrated; until then find_similar
+        # asks SQLite, so a check during startup never misses a duplicate.
+        self.hashes_ready = asyncio.Event()
+        self._hash_task: asyncio.Task | None = None
+        self._adds_in_flight = 0  # add_image calls between INSERT and index update
+        self._unsaved = 0         # index changes since the last snapshot
+        self._snapshot_lock = asyncio.Lock()
 
     async def connect(self):
         await Tortoise.init(
@@ -27,37 +104,197 @@ class Database:
         await conn.execute_query("PRAGMA journal_mode = WAL;")
 
         await Tortoise.generate_schemas()
-        await self.load_hashes()
+        await self._ensure_facets(conn)
+        await search.ensure_index(conn)
+        await conn.execute_query(FINGERPRINT_DELETE_TRIGGER)
+        await self._ensure_columns(conn)
+
+    async def _ensure_columns(self, conn) -> None:
+        for table, column, definition in ADDED_COLUMNS:
+            _, rows = await conn.execute_query(f"PRAGMA table_info({table})")
+            if column not in {row["name"] for row in rows}:
+                await conn.execute_query(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    async def _ensure_facets(self, conn) -> None:
+        """Install the facet triggers, backfilling the summary table the first time."""
+        _, rows = await conn.execute_query(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name = 'images_facets_ai'"
+        )
+        if not rows:
+            await conn.execute_query("DELETE FROM image_facets")
+            await conn.execute_query(
+                "INSERT INTO image_facets (source_platform, guild_id, count) "
+                "SELECT source_platform, guild_id, COUNT(*) FROM images GROUP BY source_platform, guild_id"
+            )
+        for trigger in FACET_TRIGGERS:
+            await conn.execute_query(trigger)
+
+    def start_hash_index(self) -> asyncio.Task:
+        """Hydrate the hash index in the background; hashes_ready is set when done."""
+        if self._hash_task is None:
+            self._hash_task = asyncio.create_task(self._hydrate_hashes())
+        return self._hash_task
+
+    async def _hydrate_hashes(self) -> None:
+        while True:
+            try:
+                await self.load_hashes()
+                return
+            except Exception:
+                LOGGER.exception("Loading the hash index failed; retrying in 5s")
+                await asyncio.sleep(5)
+
+    def _open_snapshot(self, high: int) -> tuple[HashIndex, int]:
+        """The mapped snapshot and its high-water id, or an empty index and 0."""
+        try:
+            index, mark = HashIndex.open_snapshot(self.snapshot_path)
+        except SnapshotError as err:
+            if self.snapshot_path.exists():
+                LOGGER.warning(f"Ignoring hash index snapshot: {err}")
+            return HashIndex(), 0
+        if mark > high:
+            LOGGER.warning(f"Hash index snapshot covers image {mark} but the database ends at {high}; rebuilding")
+            return HashIndex(), 0
+        return index, mark
 
     async def load_hashes(self):
-        """Load all phashes from database into cache for similarity search."""
-        images = await Image.all().values("id", "phash")
-        self._hash_cache = {img["phash"]: img["id"] for img in images}
+        """Map the hash index snapshot, then stream the fingerprints of images
+        added after it into the index, in id order and in chunks, straight off
+        raw SQL rows (no model objects). Without a snapshot that's every row."""
+        conn = Tortoise.get_connection("default")
+        _, rows = await conn.execute_query("SELECT MAX(id) AS high FROM images")
+        # Rows up to `high` are read here; add_image adds newer ones itself and
+        # delete_image drops removed ones from here on.
+        high = rows[0]["high"] or 0
+        index, last = self._open_snapshot(high)
+        mapped = len(index)
+        if mapped:
+            self._unsaved += await self._reconcile_snapshot(conn, index, last)
+        self._hash_index, self._hash_high = index, high
+        while last < high:
+            _, rows = await conn.execute_query(
+                f"{FINGERPRINT_SELECT} WHERE i.id > ? AND i.id <= ? ORDER BY i.id LIMIT ?",
+                [last, high, HASH_INDEX_CHUNK],
+            )
+            if not rows:
+                break
+            last = rows[-1]["id"]
+            self._unsaved += len(rows)
+            arrays = _index_arrays(rows)
+            if arrays is not None:
+                index.extend(*arrays)
+        self.hashes_ready.set()
+        LOGGER.info(f"Hash index loaded: {len(index)} images ({mapped} from snapshot)")
+        if self._unsaved:
+            await self.save_hash_snapshot()
+
+    async def _reconcile_snapshot(self, conn, index: HashIndex, mark: int) -> int:
+        """Drop snapshot rows whose image is gone. The web dashboard deletes
+        rows straight from SQLite, so the snapshot can outlive them; one COUNT
+        tells whether the (rarer) id scan is needed."""
+        _, rows = await conn.execute_query("SELECT COUNT(*) AS count FROM images WHERE id <= ?", [mark])
+        if rows[0]["count"] >= len(index):
+            return 0
+        chunks, last = [], 0
+        while True:
+            _, rows = await conn.execute_query(
+                "SELECT id FROM images WHERE id > ? AND id <= ? ORDER BY id LIMIT ?",
+                [last, mark, HASH_INDEX_CHUNK],
+            )
+            if not rows:
+                break
+            last = rows[-1]["id"]
+            chunks.append(np.fromiter((row["id"] for row in rows), dtype=np.int64, count=len(rows)))
+        removed = index.retain(np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int64))
+        if removed:
+            LOGGER.info(f"Dropped {removed} deleted images from the hash index snapshot")
+        return removed
+
+    async def save_hash_snapshot(self) -> bool:
+        """Write the hash index snapshot if anything changed since the last one.
+
+        Skipped while an add_image is between its INSERT and the index update,
+        so the snapshot's high-water mark never passes over a missing row.
+        """
+        if not self.hashes_ready.is_set() or self._adds_in_flight or not self._unsaved:
+            return False
+        async with self._snapshot_lock:
+            if self._adds_in_flight:
+                return False
+            arrays = self._hash_index.snapshot_arrays()
+            high = max(self._hash_high, int(arrays[0].max()) if len(arrays[0]) else 0)
+            unsaved, self._unsaved = self._unsaved, 0
+            try:
+                await asyncio.to_thread(write_snapshot, self.snapshot_path, arrays, high)
+            except OSError:
+                self._unsaved += unsaved
+                LOGGER.exception(f"Writing hash index snapshot {self.snapshot_path} failed")
+                return False
+        return True
 
-    async def find_similar(self, phash: str, threshold: int = 8) -> list[Image]:
+    async def find_similar(self, hashes: dict, guild_id: int | None = None) -> list[Image]:
         """
-        Find images with similar perceptual hash within threshold.
-        Returns list of Image objects that are potential duplicates.
+        Find images whose fingerprint (utils/fingerprint.py) matches `hashes`,
+        optionally only in one guild. Returns the matching Image objects.
+
+        Until the index is hydrated this falls back to SQL (the guild_id index
+        when a guild is given), so early checks still see every image.
         """
-        if self._hash_cache is None or not self._hash_cache:
+        try:
+            query, query_full = to_vector(hashes)
+        except (KeyError, TypeError, ValueError):
             return []
-        
-        # Linear scan with hamming distance check
-        # For small datasets this is fine; for large datasets consider BKTree with proper setup
-        similar_ids = []
-        query_hash = imagehash.hex_to_hash(phash)
-        
-        for stored_phash, image_id in self._hash_cache.items():
-            stored_hash = imagehash.hex_to_hash(stored_phash)
-            distance = query_hash - stored_hash
-            if distance <= threshold:
-                similar_ids.append(image_id)
-        
+        if self.hashes_ready.is_set():
+            similar_ids = self._hash_index.search(query, query_full, guild_id)
+        else:
+            similar_ids = (await self._find_similar_sql([(query, query_full)], guild_id))[0]
+
         if not similar_ids:
             return []
-            
+
         return await Image.filter(id__in=similar_ids)
 
+    async def find_similar_many(self, hashes_list: list[dict], guild_id: int | None = None) -> list[list[Image]]:
+        """
+        find_similar() for several images at once (batch posting): one pass
+        over the guild's rows and one Image query for every match. Returns a
+        list of matches per entry of `hashes_list`.
+        """
+        queries, positions = [], []
+        for position, hashes in enumerate(hashes_list):
+            try:
+                queries.append(to_vector(hashes))
+            except (KeyError, TypeError, ValueError):
+                continue
+            positions.append(position)
+        matched: list[list[int]] = [[] for _ in hashes_list]
+        if queries:
+            if self.hashes_ready.is_set():
+                found = self._hash_index.search_many(queries, guild_id)
+            else:
+                found = await self._find_similar_sql(queries, guild_id)
+            for position, ids in zip(positions, found):
+                matched[position] = ids
+
+        all_ids = {image_id for ids in matched for image_id in ids}
+        if not all_ids:
+            return [[] for _ in hashes_list]
+        images = {image.id: image for image in await Image.filter(id__in=all_ids)}
+        return [[images[image_id] for image_id in ids if image_id in images] for ids in matched]
+
+    async def _find_similar_sql(self, queries: list[tuple[np.ndarray, bool]], guild_id: int | None) -> list[list[int]]:
+        conn = Tortoise.get_connection("default")
+        if guild_id is not None:
+            _, rows = await conn.execute_query(f"{FINGERPRINT_SELECT} WHERE i.guild_id = ?", [guild_id])
+        else:
+            _, rows = await conn.execute_query(FINGERPRINT_SELECT)
+        arrays = _index_arrays(rows)
+        if arrays is None:
+            return [[] for _ in queries]
+        index = HashIndex(capacity=len(arrays[0]))
+        index.extend(*arrays)
+        return index.search_many(queries)
+
     async def add_image(
         self,
         phash: str,
@@ -67,22 +304,42 @@ class Database:
         guild_id: int,
         thread_id: int,
         message_id: int,
+        fingerprint: dict | None = None,
     ) -> Image:
-        """Store a new image hash and add to cache."""
-        image = await Image.create(
-            phash=phash,
-            dhash=dhash,
-            source_url=source_url,
-            source_platform=source_platform,
-            guild_id=guild_id,
-            thread_id=thread_id,
-            message_id=message_id,
-        )
-        
-        # Add to cache for future lookups
-        if self._hash_cache is not None:
-            self._hash_cache[phash] = image.id
-        
+        """Store a new image hash (plus its fingerprint, when given) and add it to the index."""
+        hashes = {**(fingerprint or {}), "phash": phash, "dhash": dhash}
+        extra = {name: hashes[name] for name in EXTRA_DESCRIPTORS if hashes.get(name)}
+        self._adds_in_flight += 1
+        try:
+            # The FTS row commits with the image, so search never misses one.
+            async with in_transaction() as conn:
+                image = await Image.create(
+                    phash=phash,
+                    dhash=dhash,
+                    source_url=source_url,
+                    source_platform=source_platform,
+                    guild_id=guild_id,
+                    thread_id=thread_id,
+                    message_id=message_id,
+                )
+                if len(extra) == len(EXTRA_DESCRIPTORS):
+                    await ImageFingerprint.create(image_id=image.id, **extra)
+                await search.index_image(conn, image)
+
+            # Add to the index for future lookups
+            if self._hash_index is not None and image.id > self._hash_high:
+                try:
+                    vector, full = to_vector(hashes)
+                except ValueError:
+                    LOGGER.warning(f"Image {image.id} has malformed hashes; not indexed")
+                else:
+                    self._hash_index.add(image.id, vector, guild_id, full)
+                    self._unsaved += 1
+        finally:
+            self._adds_in_flight -= 1
+
+        if self._unsaved >= SNAPSHOT_EVERY:
+            await self.save_hash_snapshot()
         return image
 
     async def delete_image(self, image_id: int) -> bool:
@@ -90,13 +347,15 @@ class Database:
         image = await Image.get_or_none(id=image_id)
         if image is None:
             return False
-        phash = image.phash
         await image.delete()
-        if self._hash_cache is not None:
-            self._hash_cache.pop(phash, None)
+        if self._hash_index is not None and self._hash_index.remove(image_id):
+            self._unsaved += 1
         return True
 
     async def close(self):
+        if self._hash_task is not None:
+            self._hash_task.cancel()
+        await self.save_hash_snapshot()
         conn = Tortoise.get_connection("default")
         await conn.execute_query("PRAGMA wal_checkpoint(TRUNCATE);")
         await Tortoise.close_connections()
@@ -0,0 +1,216 @@
+"""Compact in-memory index of image fingerprints for duplicate detection.
+
+Fingerprints (utils/fingerprint.py) live in flat numpy arrays — a uint64 matrix
+with one column per descriptor, plus image id, guild id and a "complete" flag —
+rather than model objects, so a lookup is a few vectorized XOR + popcount
+passes over the whole archive and the index costs under 80 bytes per image.
+
+The index can be saved to a snapshot file — a small header (row count and the
+highest image id it covers) followed by the packed arrays. Opening a
+snapshot maps it read-only instead of reading it, so a restart costs the same
+however large the archive is: only rows added after the snapshot's high-water
+mark are replayed from SQLite, and every process mapping the file shares the
+same page-cache pages. Rows added since go to an in-memory tail; deletions of
+mapped rows are kept in a separate mask, as the mapping is never written.
+"""
+from __future__ import annotations
+
+import os
+import struct
+from pathlib import Path
+
+import numpy as np
+
+from utils.fingerprint import DESCRIPTORS, THRESHOLDS, match
+
+INITIAL_CAPACITY = 1024
+REMOVED = -1  # image id of a deleted tail slot
+WIDTH = len(DESCRIPTORS)
+
+SNAPSHOT_MAGIC = b"ABHIDX"
+SNAPSHOT_VERSION = 2
+SNAPSHOT_HEADER = struct.Struct("<6sHIqq")  # magic, version, descriptors, count, high-water id
+ROW_BYTES = WIDTH * 8 + 8 + 8 + 1         # hashes, id, guild id, complete flag
+
+
+class SnapshotError(Exception):
+    """A snapshot file is missing, truncated or from another format version."""
+
+
+class HashIndex:
+    def __init__(self, capacity: int = INITIAL_CAPACITY) -> None:
+        # Mapped snapshot rows (read-only) and which of them are still live.
+        self._base_hashes = np.zeros((0, WIDTH), dtype=np.uint64)
+        self._base_ids = np.zeros(0, dtype=np.int64)
+        self._base_guilds = np.zeros(0, dtype=np.int64)
+        self._base_full = np.zeros(0, dtype=bool)
+        self._base_live: np.ndarray | None = None  # bool mask, created on the first removal
+        # Rows added in memory.
+        self._hashes = np.zeros((capacity, WIDTH), dtype=np.uint64)
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._guilds = np.zeros(capacity, dtype=np.int64)
+        self._full = np.zeros(capacity, dtype=bool)
+        self._size = 0
+        self._removed = 0
+
+    def __len__(self) -> int:
+        base = len(self._base_ids) if self._base_live is None else int(self._base_live.sum())
+        return base + self._size - self._removed
+
+    def _reserve(self, extra: int) -> None:
+        needed = self._size + extra
+        if needed <= len(self._ids):
+            return
+        capacity = max(needed, len(self._ids) * 2)
+        for name in ("_hashes", "_ids", "_guilds", "_full"):
+            old = getattr(self, name)
+            grown = np.zeros((capacity, *old.shape[1:]), dtype=old.dtype)
+            grown[:self._size] = old[:self._size]
+            setattr(self, name, grown)
+
+    def add(self, image_id: int, hashes: np.ndarray, guild_id: int, full: bool) -> None:
+        self._reserve(1)
+        self._hashes[self._size] = hashes
+        self._ids[self._size] = image_id
+        self._guilds[self._size] = guild_id
+        self._full[self._size] = full
+        self._size += 1
+
+    def extend(self, ids: np.ndarray, hashes: np.ndarray, guilds: np.ndarray, full: np.ndarray) -> None:
+        count = len(ids)
+        self._reserve(count)
+        end = self._size + count
+        self._hashes[self._size:end] = hashes
+        self._ids[self._size:end] = ids
+        self._guilds[self._size:end] = guilds
+        self._full[self._size:end] = full
+        self._size = end
+
+    def remove(self, image_id: int) -> bool:
+        base_slots = np.flatnonzero(self._base_ids == image_id)
+        if len(base_slots):
+            if self._base_live is None:
+                self._base_live = np.ones(len(self._base_ids), dtype=bool)
+            self._base_live[base_slots] = False
+        slots = np.flatnonzero(self._ids[:self._size] == image_id)
+        self._ids[slots] = REMOVED
+        self._removed += len(slots)
+        if self._removed > INITIAL_CAPACITY and self._removed * 4 > self._size:
+            self._compact()
+        return len(slots) + len(base_slots) > 0
+
+    def retain(self, live_ids: np.ndarray) -> int:
+        """Drop mapped rows whose image id isn't in `live_ids` (sorted); returns how many."""
+        if not len(self._base_ids):
+            return 0
+        gone = ~np.isin(self._base_ids, live_ids, assume_unique=True)
+        if self._base_live is not None:
+            gone &= self._base_live
+        count = int(gone.sum())
+        if count:
+            if self._base_live is None:
+                self._base_live = np.ones(len(self._base_ids), dtype=bool)
+            self._base_live[gone] = False
+        return count
+
+    def _compact(self) -> None:
+        keep = self._ids[:self._size] != REMOVED
+        count = int(keep.sum())
+        for name in ("_hashes", "_guilds", "_full", "_ids"):
+            array = getattr(self, name)
+            array[:count] = array[:self._size][keep]
+        self._size, self._removed = count, 0
+
+    def search(
+        self,
+        query: np.ndarray,
+        query_full: bool,
+        guild_id: int | None = None,
+        thresholds: dict[str, int] = THRESHOLDS,
+    ) -> list[int]:
+        """Ids of images whose fingerprint matches `query` (optionally one guild's)."""
+        return self.search_many([(query, query_full)], guild_id, thresholds)[0]
+
+    def search_many(
+        self,
+        queries: list[tuple[np.ndarray, bool]],
+        guild_id: int | None = None,
+        thresholds: dict[str, int] = THRESHOLDS,
+    ) -> list[list[int]]:
+        """search() for several (query, query_full) pairs, narrowing to the guild once."""
+        found: list[list[int]] = [[] for _ in queries]
+        for hashes, ids, guilds, full, live in (
+            (self._base_hashes, self._base_ids, self._base_guilds, self._base_full, self._base_live),
+            (self._hashes[:self._size], self._ids[:self._size], self._guilds[:self._size], self._full[:self._size], None),
+        ):
+            rows = slice(None)
+            if guild_id is not None:
+                # Narrow to the guild first; the fingerprint comparison is the costly part.
+                rows = np.flatnonzero(guilds == guild_id)
+                if live is not None:
+                    rows = rows[live[rows]]
+            elif live is not None:
+                rows = np.flatnonzero(live)
+            rows_hashes, rows_full, rows_ids = hashes[rows], full[rows], ids[rows]
+            for result, (query, query_full) in zip(found, queries):
+                hit = match(rows_hashes, rows_full, query, query_full, thresholds)
+                result.extend(rows_ids[hit].tolist())
+        return [[image_id for image_id in result if image_id != REMOVED] for result in found]
+
+    def snapshot_arrays(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """A copy of every live row as (ids, hashes, guilds, full), for write_snapshot."""
+        base = slice(None) if self._base_live is None else self._base_live
+        tail = self._ids[:self._size] != REMOVED
+        return (
+            np.concatenate([self._base_ids[base], self._ids[:self._size][tail]]),
+            np.concatenate([self._base_hashes[base], self._hashes[:self._size][tail]]),
+            np.concatenate([self._base_guilds[base], self._guilds[:self._size][tail]]),
+            np.concatenate([self._base_full[base], self._full[:self._size][tail]]),
+        )
+
+    @classmethod
+    def open_snapshot(cls, path: str | Path) -> tuple["HashIndex", int]:
+        """Map a snapshot read-only; returns (index, high-water image id)."""
+        path = Path(path)
+        try:
+            size = path.stat().st_size
+            with open(path, "rb") as f:
+                head = f.read(SNAPSHOT_HEADER.size)
+        except OSError as err:
+            raise SnapshotError(str(err)) from err
+        if len(head) < SNAPSHOT_HEADER.size:
+            raise SnapshotError(f"{path} is truncated")
+        magic, version, width, count, high = SNAPSHOT_HEADER.unpack(head)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION or width != WIDTH:
+            raise SnapshotError(f"{path} is not a version {SNAPSHOT_VERSION} hash index snapshot")
+        if size != SNAPSHOT_HEADER.size + count * ROW_BYTES:
+            raise SnapshotError(f"{path} is truncated")
+
+        index = cls()
+        if count:
+            offset = SNAPSHOT_HEADER.size
+            index._base_hashes = np.memmap(path, dtype=np.uint64, mode="r", offset=offset, shape=(count, WIDTH))
+            offset += count * WIDTH * 8
+            index._base_ids = np.memmap(path, dtype=np.int64, mode="r", offset=offset, shape=(count,))
+            offset += count * 8
+            index._base_guilds = np.memmap(path, dtype=np.int64, mode="r", offset=offset, shape=(count,))
+            offset += count * 8
+            index._base_full = np.memmap(path, dtype=bool, mode="r", offset=offset, shape=(count,))
+        return index, high
+
+
+def write_snapshot(path: str | Path, arrays: tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray], high: int) -> None:
+    """Write (ids, hashes, guilds, full) covering image ids <= high; atomic replace,
+    so processes that mapped the previous file keep reading it undisturbed."""
+    path = Path(path)
+    ids, hashes, guilds, full = arrays
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, WIDTH, len(ids), high))
+        f.write(np.ascontiguousarray(hashes, dtype=np.uint64).tobytes())
+        f.write(ids.astype(np.int64, copy=False).tobytes())
+        f.write(guilds.astype(np.int64, copy=False).tobytes())
+        f.write(full.astype(bool, copy=False).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
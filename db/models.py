@@ -12,4 +12,85 @@ class Image(models.Model):
     posted_at = fields.DatetimeField(auto_now_add=True)
 
     class Meta:
-        table = "images"
\ No newline at end of file
+        table = "images"
+        # Keyset pagination for the admin image browser: newest first, filtered
+        # by nothing / platform / guild.
+        indexes = (
+            ("posted_at", "id"),
+            ("source_platform", "posted_at", "id"),
+            ("guild_id", "posted_at", "id"),
+        )
+
+
+class ImageFingerprint(models.Model):
+    """The extra duplicate-detection descriptors of an image (utils/fingerprint.py),
+    16 hex chars each like images.phash. Images posted before fingerprints have
+    no row. Deleted along with the image by a trigger (db/db.py)."""
+    image_id = fields.IntField(pk=True)
+    phash_flip = fields.CharField(max_length=16)
+    phash_crop = fields.CharField(max_length=16)
+    phash_trim = fields.CharField(max_length=16)
+    whash = fields.CharField(max_length=16)
+    colorhash = fields.CharField(max_length=16)
+
+    class Meta:
+        table = "image_fingerprints"
+
+
+class ImageFacet(models.Model):
+    """Per (platform, guild) image counts, kept in sync with `images` by SQLite
+    triggers (db/db.py) so admin stats never scan the images table."""
+    id = fields.IntField(pk=True)
+    source_platform = fields.CharField(max_length=32)
+    guild_id = fields.BigIntField()
+    count = fields.IntField(default=0)
+
+    class Meta:
+        table = "image_facets"
+        unique_together = (("source_platform", "guild_id"),)
+
+class PendingSubmission(models.Model):
+    """Userscript API submission awaiting confirmation. The image itself lives
+    in the submission spool directory (services/submissions.py)."""
+    id = fields.CharField(max_length=32, pk=True)
+    user_id = fields.BigIntField()
+    guild_id = fields.BigIntField()
+    platform = fields.CharField(max_length=32)
+    link = fields.TextField()
+    image_num = fields.IntField(null=True)
+    post_data = fields.JSONField()
+    image_name = fields.TextField()
+    image_size = fields.IntField(default=0)  # 0 once the spooled image is dropped
+    hashes = fields.JSONField()
+    embed_fallback = fields.BooleanField(default=False)
+    detected = fields.JSONField()
+    result = fields.JSONField(null=True)  # set once posted; kept so retried confirms replay it
+    analysis = fields.JSONField(null=True)  # size, mime, dimensions, sha256 (services/analysis.py)
+    created_at = fields.FloatField()
+    expires_at = fields.FloatField(index=True)
+    accessed_at = fields.FloatField(index=True)  # LRU order for disk-budget eviction
+
+    class Meta:
+        table = "pending_submissions"
+
+
+class IdempotencyKey(models.Model):
+    id = fields.IntField(pk=True)
+    user_id = fields.BigIntField()
+    key = fields.CharField(max_length=128)
+    submission_id = fields.CharField(max_length=32, null=True)
+    result = fields.JSONField(null=True)
+    expires_at = fields.FloatField(index=True)
+
+    class Meta:
+        table = "idempotency_keys"
+        unique_together = (("user_id", "key"),)
+
+
+class SpentToken(models.Model):
+    """Single-use token id that has been redeemed; kept until the token expires."""
+    jti = fields.CharField(max_length=64, pk=True)
+    expires_at = fields.FloatField(index=True)
+
+    class Meta:
+        table = "spent_tokens"
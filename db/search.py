@@ -0,0 +1,118 @@
+"""Full-text (FTS5 trigram) index over posted images for the admin search box.
+
+images_fts holds one row per image (rowid = images.id) with the source URL plus
+fields pulled out of it — pixiv illust id, Bluesky handle, tweet author — and
+the Discord thread/message ids. The trigram tokenizer gives indexed substring
+matching, so a search no longer scans `images` with LIKE '%x%'.
+
+Rows are added by Database.add_image (the only insert path), in the transaction
+that inserts the image, and removed by a trigger, so deletes from the bot and
+from the web panel both stay in sync.
+"""
+from __future__ import annotations
+
+import re
+
+from tortoise.expressions import RawSQL
+
+FTS_COLUMNS = ("source_url", "pixiv_id", "bsky_handle", "tweet_author", "thread_id", "message_id")
+
+FTS_SCHEMA = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS images_fts USING fts5("
+    + ", ".join(FTS_COLUMNS)
+    + ", tokenize = 'trigram')"
+)
+FTS_DELETE_TRIGGER = """
+    CREATE TRIGGER IF NOT EXISTS images_fts_ad AFTER DELETE ON images BEGIN
+        DELETE FROM images_fts WHERE rowid = old.id;
+    END;
+"""
+_INSERT_SQL = (
+    "INSERT OR REPLACE INTO images_fts (rowid, " + ", ".join(FTS_COLUMNS) + ") "
+    "VALUES (?, " + ", ".join("?" for _ in FTS_COLUMNS) + ")"
+)
+
+# "prefix:value" in the search box targets one extracted column.
+SEARCH_PREFIXES = {
+    "url": "source_url",
+    "pixiv": "pixiv_id",
+    "bsky": "bsky_handle",
+    "author": "tweet_author",
+    "thread": "thread_id",
+    "message": "message_id",
+}
+
+BACKFILL_CHUNK = 5000
+MIN_TRIGRAM = 3  # trigram MATCH needs at least this many characters
+
+_PIXIV_RE = re.compile(r"pixiv\.net/(?:[a-z]{2}/)?artworks/(\d+)")
+_BSKY_RE = re.compile(r"bsky\.app/profile/([^/]+)/post/")
+_TWEET_RE = re.compile(r"(?:x|twitter)\.com/([A-Za-z0-9_]+)/status/")
+
+
+def source_fields(source_url: str) -> tuple[str, str, str]:
+    """Return (pixiv_id, bsky_handle, tweet_author) extracted from a source URL."""
+    pixiv = _PIXIV_RE.search(source_url)
+    bsky = _BSKY_RE.search(source_url)
+    tweet = _TWEET_RE.search(source_url)
+    return (
+        pixiv.group(1) if pixiv else "",
+        bsky.group(1) if bsky else "",
+        tweet.group(1) if tweet else "",
+    )
+
+
+def _row(image_id: int, source_url: str, thread_id: int, message_id: int) -> tuple:
+    return (image_id, source_url, *source_fields(source_url), str(thread_id), str(message_id))
+
+
+async def index_image(conn, image) -> None:
+    await conn.execute_query(_INSERT_SQL, list(_row(image.id, image.source_url, image.thread_id, image.message_id)))
+
+
+async def ensure_index(conn) -> None:
+    """Create the FTS table and delete trigger, backfilling existing images the first time."""
+    _, rows = await conn.execute_query(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'images_fts'"
+    )
+    await conn.execute_query(FTS_SCHEMA)
+    await conn.execute_query(FTS_DELETE_TRIGGER)
+    if rows:
+        return
+    last_id = 0
+    while True:
+        _, chunk = await conn.execute_query(
+            "SELECT id, source_url, thread_id, message_id FROM images WHERE id > ? ORDER BY id LIMIT ?",
+            [last_id, BACKFILL_CHUNK],
+        )
+        if not chunk:
+            break
+        await conn.execute_many(
+            _INSERT_SQL,
+            [list(_row(r["id"], r["source_url"], r["thread_id"], r["message_id"])) for r in chunk],
+        )
+        last_id = chunk[-1]["id"]
+
+
+def match_expression(search: str) -> str | None:
+    """Build an FTS5 MATCH expression, or None when the text is too short for trigrams."""
+    column = None
+    prefix, sep, rest = search.partition(":")
+    if sep and prefix.lower() in SEARCH_PREFIXES and rest.strip() and not rest.startswith("//"):
+        column, search = SEARCH_PREFIXES[prefix.lower()], rest.strip()
+    if len(search) < MIN_TRIGRAM:
+        return None
+    phrase = '"' + search.replace('"', '""') + '"'
+    return f"{column} : {phrase}" if column else phrase
+
+
+def filter_search(qs, search: str):
+    """Restrict an Image queryset to rows matching the admin search text."""
+    expression = match_expression(search)
+    if expression is None:
+        # Too short for the trigram index; these queries are rare and cheap enough.
+        return qs.filter(source_url__icontains=search)
+    literal = "'" + expression.replace("'", "''") + "'"
+    return qs.annotate(
+        fts_hit=RawSQL(f'"images"."id" IN (SELECT rowid FROM images_fts WHERE images_fts MATCH {literal})')
+    ).filter(fts_hit=1)
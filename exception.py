@@ -32,6 +32,10 @@ class TooLittleArguments(commands.CommandInvokeError):
     """User has passed in too little arguments into the command."""
     pass
 
+class InvalidPages(commands.CommandInvokeError):
+    """User has provided an invalid page range or list."""
+    pass
+
 class RequestFailed(commands.CommandInvokeError):
     """A request to an external site has failed."""
     pass
@@ -2,13 +2,19 @@ import asyncio
 import datetime
 import logging
 import os
+import sys
 import traceback
 import typing
+from pathlib import Path
 import aiohttp
 import uvicorn
 from atproto import AsyncClient as BskyClient
 from config import Config
 from db.db import Database
+from services.posters import PosterCache
+from services.recompress import Recompressor
+from services.rest import RestScheduler
+from services.startup import CommandSyncState, Startup, command_tree_hash
 from services.tagger import TaggerClient
 
 import discord
@@ -22,6 +28,9 @@ class ArtBot(commands.Bot):
     bsky_client: BskyClient
     config: Config
     db: Database
+    posters: PosterCache
+    recompressor: Recompressor
+    rest: RestScheduler
     _uptime: datetime.datetime = datetime.datetime.now()
 
     def __init__(self, prefix: str, ext_dir: str, *args: typing.Any, **kwargs: typing.Any) -> None:
@@ -32,6 +41,11 @@ class ArtBot(commands.Bot):
         self.logger = logging.getLogger(self.__class__.__name__)
         self.ext_dir = ext_dir
         self.synced = False
+        self.startup = Startup()
+        self.command_sync = CommandSyncState(
+            os.getenv("COMMAND_SYNC_STATE")
+            or Path(os.getenv("SQLITE_PATH", "artbot.db")).resolve().parent / "command_tree.sha256"
+        )
         self.remove_command('help')
 
     async def _load_extensions(self) -> None:
@@ -53,14 +67,35 @@ class ArtBot(commands.Bot):
 
     async def on_ready(self) -> None:
         self.logger.info(f"Logged in as {self.user} ({self.user.id})")
+        self.startup.mark("gateway")
 
     async def setup_hook(self) -> None:
         self.client = aiohttp.ClientSession(cookies={'PHPSESSID': os.getenv("PIXIV_COOKIE")},headers={"User-Agent":"Mozilla/5.0 (Windows NT 10.0; rv:91.0) Gecko/20100101 Firefox/91.0", "Referer": "https://www.pixiv.net/"})
         self.config = Config(os.getenv("CONFIG_PATH"))
         self.tagger = TaggerClient(self.config, token=os.getenv("HF_TOKEN"))
-        self.db = Database(os.getenv("SQLITE_PATH"))
-        
-        # Initialize Bluesky client if credentials are provided
+        self.db = Database(os.getenv("SQLITE_PATH"), snapshot_path=os.getenv("HASH_INDEX_SNAPSHOT"))
+        self.rest = RestScheduler()
+        self.posters = PosterCache(self.rest)
+        self.recompressor = Recompressor()
+
+        # Bluesky login and the database don't depend on each other. Extensions
+        # load once the database is connected: a cog may use self.db in
+        # setup()/cog_load().
+        await self.startup.gather(
+            bluesky=self._login_bluesky(),
+            database=self.db.connect(),
+        )
+        await self.startup.step("extensions", self._load_extensions())
+        # The duplicate-hash index hydrates in the background (duplicate checks use
+        # SQLite until it's done); HASH_INDEX_MODE=eager waits for it instead.
+        self.startup.wait_for("hash_index")
+        hydration = self.db.start_hash_index()
+        hydration.add_done_callback(lambda _: self.startup.mark("hash_index"))
+        if os.getenv("HASH_INDEX_MODE", "background").lower() == "eager":
+            await self.startup.step("hash_index", asyncio.shield(hydration))
+        await self.startup.step("command_sync", self.sync_commands())
+
+    async def _login_bluesky(self) -> None:
         bsky_identifier = os.getenv("BLUESKY_IDENTIFIER")
         bsky_password = os.getenv("BLUESKY_APP_PASSWORD")
         if bsky_identifier and bsky_password:
@@ -70,18 +105,30 @@ class ArtBot(commands.Bot):
         else:
             self.bsky_client = None
             self.logger.warning("Bluesky credentials not provided, Bluesky support disabled")
-        
-        await self.db.connect()
-        await self._load_extensions()
-        if not self.synced:
-            await self.tree.sync()
-            self.synced = not self.synced
-            self.logger.info("Synced command tree")
+
+    async def sync_commands(self, force: bool = False) -> list[discord.app_commands.AppCommand] | None:
+        """Sync global commands, unless the tree is unchanged since the last sync.
+
+        FORCE_COMMAND_SYNC=1 (or force=True) syncs regardless. Returns the
+        synced commands, or None when the sync was skipped.
+        """
+        digest = command_tree_hash(self.tree, self.application_id)
+        force = force or os.getenv("FORCE_COMMAND_SYNC", "").lower() in ("1", "true", "yes")
+        if not force and self.command_sync.last() == digest:
+            self.synced = True
+            self.logger.info("Command tree unchanged since last sync, skipping sync")
+            return None
+        synced = await self.tree.sync()
+        self.command_sync.record(digest)
+        self.synced = True
+        self.logger.info("Synced command tree")
+        return synced
 
     async def close(self) -> None:
         await self.client.close()
         await self.tagger.close()
         await self.db.close()
+        self.recompressor.close()
         await super().close()
 
     def run(self, *args: typing.Any, **kwargs: typing.Any) -> None:
@@ -131,10 +178,66 @@ async def run_combined() -> None:
         )
 
 
+async def _supervise_web(socket_path: str, workers: int) -> None:
+    """Keep the uvicorn worker pool running; it restarts dead workers itself,
+    this restarts the pool if the whole thing exits."""
+    logger = logging.getLogger("ArtBot")
+    env = {**os.environ, "BOT_RPC_SOCKET": socket_path}
+    while True:
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "uvicorn", "web.app:app",
+            "--host", os.getenv("WEB_HOST", "127.0.0.1"),
+            "--port", os.getenv("WEB_PORT", "8000"),
+            "--workers", str(workers),
+            "--log-level", "warning",
+            env=env,
+        )
+        logger.info(f"Started {workers} web workers (pid {proc.pid})")
+        try:
+            code = await proc.wait()
+        except asyncio.CancelledError:
+            proc.terminate()
+            await proc.wait()
+            raise
+        logger.warning(f"Web workers exited with code {code}; restarting in 5s")
+        await asyncio.sleep(5)
+
+
+async def run_split(workers: int) -> None:
+    """Gateway in this process, the web app in separate uvicorn worker processes.
+
+    Heavy HTTP work (upload parsing, admin pages) then never delays heartbeats,
+    and the web side scales across cores. Workers reach the bot through a Unix
+    socket RPC (web/backend.py); submissions, replay protection and config
+    edits are shared through SQLite and the config directory.
+    """
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s] %(levelname)s: %(message)s")
+
+    bot = ArtBot(prefix="!", ext_dir="cogs")
+    socket_path = os.getenv("BOT_RPC_SOCKET") or str(
+        Path(os.getenv("SQLITE_PATH", "artbot.db")).resolve().parent / "artbot-rpc.sock"
+    )
+
+    async with bot:
+        await bot.login(str(os.getenv("TOKEN", "")))
+        from web.backend import LocalBackend, serve
+        rpc_server = serve(LocalBackend(bot), socket_path)
+        await rpc_server.start()
+        web_task = asyncio.create_task(_supervise_web(socket_path, workers))
+        try:
+            await bot.connect()
+        finally:
+            web_task.cancel()
+            await asyncio.gather(web_task, return_exceptions=True)
+            await rpc_server.close()
+
+
 def main() -> None:
     load_dotenv()
+    # WEB_WORKERS > 0 runs the web app as that many separate processes.
+    workers = int(os.getenv("WEB_WORKERS", "0") or 0)
     try:
-        asyncio.run(run_combined())
+        asyncio.run(run_split(workers) if workers > 0 else run_combined())
     except (discord.LoginFailure, KeyboardInterrupt):
         logging.getLogger("ArtBot").info("Exiting...")
 
@@ -0,0 +1,82 @@
+"""Single-decode image analysis shared by duplicate checks, tagging and size checks.
+
+Every artifact the pipeline derives from an image comes out of one decode
+(JPEG draft mode decodes straight at a reduced scale), in a worker thread:
+
+  * the fingerprint used for duplicate detection (utils/fingerprint.py);
+  * a tagger-sized JPEG, so the tagger upload is a few hundred KB rather than
+    the full original re-encoded as base64;
+  * original dimensions, MIME type, byte size and the sha256 of the raw bytes.
+
+The result travels with the image through the pipeline and is stored on API
+submissions (services/submissions.py), so nothing downstream decodes again.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import io
+from dataclasses import dataclass, field
+
+from PIL import Image
+
+from utils.fingerprint import fingerprint_image
+
+TAGGER_SIZE = 1024    # longest side of the image sent to the tagger
+TAGGER_QUALITY = 92
+
+
+@dataclass(frozen=True)
+class ImageAnalysis:
+    sha256: str
+    size: int
+    mime: str
+    width: int
+    height: int
+    hashes: dict[str, str]
+    thumbnail: bytes = field(repr=False, default=b"")  # JPEG for the tagger; not persisted
+
+    def to_dict(self) -> dict:
+        return {
+            "sha256": self.sha256,
+            "size": self.size,
+            "mime": self.mime,
+            "width": self.width,
+            "height": self.height,
+        }
+
+
+def _tagger_thumbnail(image: Image.Image) -> bytes:
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        rgba = image.convert("RGBA")
+        flat = Image.new("RGB", rgba.size, (255, 255, 255))
+        flat.paste(rgba, mask=rgba.getchannel("A"))
+    else:
+        flat = image.convert("RGB")
+    flat.thumbnail((TAGGER_SIZE, TAGGER_SIZE), Image.LANCZOS)
+    buf = io.BytesIO()
+    flat.save(buf, format="JPEG", quality=TAGGER_QUALITY)
+    return buf.getvalue()
+
+
+def analyze_bytes(data: bytes) -> ImageAnalysis:
+    """Decode `data` once and derive everything from it. Blocking; see analyze()."""
+    image = Image.open(io.BytesIO(data))
+    width, height = image.size
+    mime = Image.MIME.get(image.format or "", "application/octet-stream")
+    image.draft("RGB", (TAGGER_SIZE, TAGGER_SIZE))
+    image.load()
+    return ImageAnalysis(
+        sha256=hashlib.sha256(data).hexdigest(),
+        size=len(data),
+        mime=mime,
+        width=width,
+        height=height,
+        hashes=fingerprint_image(image),
+        thumbnail=_tagger_thumbnail(image),
+    )
+
+
+async def analyze(image: io.BytesIO | bytes) -> ImageAnalysis:
+    data = image.getvalue() if isinstance(image, io.BytesIO) else image
+    return await asyncio.to_thread(analyze_bytes, data)
@@ -0,0 +1,158 @@
+"""Background job queue for long-running pipeline work (userscript submissions).
+
+A job is queued, picked up by one of a fixed pool of asyncio workers and runs
+its stages there; the HTTP request that created it returns immediately. Each
+stage reports the same progress text the Discord commands show via on_status,
+and clients follow along through Job.wait (long-poll / Server-Sent Events).
+Every step is recorded, but waiters are woken through a StatusCoalescer
+(services/status.py), so a burst of steps is one event rather than one each.
+
+Jobs are in-memory and short-lived: finished jobs are kept for JOB_TTL so a
+client can collect the outcome, then dropped.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import secrets
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+from services.status import StatusCoalescer
+
+JOB_TTL = 1800                  # seconds a finished job stays collectable
+
+LOGGER = logging.getLogger(__name__)
+
+
+@dataclass
+class Job:
+    id: str
+    user_id: int
+    status: str = "queued"      # queued -> running -> done | failed
+    steps: list[str] = field(default_factory=list)
+    output: dict | None = None
+    error: dict | None = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: float | None = None
+    version: int = 0
+    _changed: asyncio.Condition = field(default_factory=asyncio.Condition, repr=False)
+    _updates: StatusCoalescer | None = field(default=None, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    async def _bump(self) -> None:
+        async with self._changed:
+            self.version += 1
+            self._changed.notify_all()
+
+    async def progress(self, step: str) -> None:
+        """on_status-compatible progress callback."""
+        self.steps.append(step)
+        if self._updates is None:
+            self._updates = StatusCoalescer(lambda _: self._bump())
+        await self._updates(step)
+
+    async def wait(self, seen_version: int, timeout: float) -> None:
+        """Block until the job changes past seen_version, finishes, or timeout elapses."""
+        async with self._changed:
+            try:
+                await asyncio.wait_for(
+                    self._changed.wait_for(lambda: self.version > seen_version or self.finished),
+                    timeout=timeout,
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    def snapshot(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "step": self.steps[-1] if self.steps else None,
+            "steps": list(self.steps),
+            "version": self.version,
+            "output": self.output,
+            "error": self.error,
+        }
+
+
+JobFn = Callable[[Job], Awaitable[dict]]
+
+
+class JobQueue:
+    def __init__(self, workers: int | None = None, on_error: Callable[[Exception], dict] | None = None) -> None:
+        self.workers = workers or int(os.getenv("SUBMISSION_WORKERS", "4"))
+        self.on_error = on_error or (lambda err: {"code": "internal_error", "message": str(err)})
+        self.jobs: dict[str, Job] = {}
+        self._keys: dict[tuple[int, str], str] = {}
+        self._queue: asyncio.Queue[tuple[Job, JobFn]] | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    def _start(self) -> None:
+        if self._queue is not None:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job, fn = await self._queue.get()
+            job.status = "running"
+            await job._bump()
+            try:
+                job.output = await fn(job)
+                job.status = "done"
+            except Exception as err:  # noqa: BLE001
+                job.error = self.on_error(err)
+                job.status = "failed"
+                if job.error.get("code") == "internal_error":
+                    LOGGER.error("Job %s failed on worker %d", job.id, index, exc_info=err)
+            finally:
+                job.finished_at = time.time()
+                self._queue.task_done()
+            if job._updates is not None:
+                await job._updates.settle()  # the final bump carries every step
+            await job._bump()
+
+    def _sweep(self) -> None:
+        now = time.time()
+        for jid in [j.id for j in self.jobs.values() if j.finished and now - j.finished_at > JOB_TTL]:
+            del self.jobs[jid]
+        for key in [k for k, jid in self._keys.items() if jid not in self.jobs]:
+            del self._keys[key]
+
+    def submit(self, user_id: int, fn: JobFn, idempotency_key: str | None = None) -> Job:
+        self._start()
+        self._sweep()
+        job = Job(id=secrets.token_urlsafe(12), user_id=user_id)
+        self.jobs[job.id] = job
+        if idempotency_key:
+            self._keys[(user_id, idempotency_key)] = job.id
+        self._queue.put_nowait((job, fn))
+        return job
+
+    def get(self, job_id: str, user_id: int) -> Job | None:
+        job = self.jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+
+    def by_key(self, user_id: int, idempotency_key: str) -> Job | None:
+        """Queued/running/succeeded job for this idempotency key (failed jobs may be retried)."""
+        job = self.jobs.get(self._keys.get((user_id, idempotency_key), ""))
+        if job is None or job.status == "failed":
+            return None
+        return job
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self._queue = None
@@ -0,0 +1,115 @@
+"""Member cache for userscript API authorization.
+
+Every API request has to confirm the caller is still in the guild and still
+holds the poster role. This keeps (guild_id, user_id) -> member + role id set,
+so the check is a dict lookup and a set membership test. Entries are kept
+current by gateway events (see TokenCog's listeners) rather than expiring:
+
+  * on_member_update replaces the entry (roles / nickname changed);
+  * on_raw_member_remove turns it into a short-lived negative entry;
+  * on_member_join drops a negative entry;
+  * on_guild_role_delete drops the guild's entries.
+
+Positive entries still carry a long safety TTL in case an event is missed
+across a gateway reconnect. Misses fall back to the guild's member cache,
+then a single coalesced fetch_member per key.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass
+
+import discord
+
+from services.rest import Priority, RestScheduler
+
+POSITIVE_TTL = 600      # seconds; events normally refresh long before this
+NEGATIVE_TTL = 30       # seconds a "not a member" answer is trusted
+MAX_ENTRIES = 10000
+
+
+@dataclass
+class CachedMember:
+    member: discord.Member | None   # None = not a member of the guild
+    role_ids: frozenset[int]
+    expires_at: float
+
+    @classmethod
+    def of(cls, member: discord.Member | None) -> "CachedMember":
+        if member is None:
+            return cls(None, frozenset(), time.monotonic() + NEGATIVE_TTL)
+        return cls(member, frozenset(role.id for role in member.roles), time.monotonic() + POSITIVE_TTL)
+
+    def has_role(self, role_id: int) -> bool:
+        return role_id in self.role_ids
+
+
+class PosterCache:
+    def __init__(self, rest: RestScheduler | None = None) -> None:
+        self.rest = rest
+        self._entries: dict[tuple[int, int], CachedMember] = {}
+        self._inflight: dict[tuple[int, int], asyncio.Future] = {}
+
+    def _store(self, key: tuple[int, int], entry: CachedMember) -> CachedMember:
+        self._entries.pop(key, None)
+        if len(self._entries) >= MAX_ENTRIES:
+            del self._entries[next(iter(self._entries))]  # oldest write
+        self._entries[key] = entry
+        return entry
+
+    async def get(self, guild: discord.Guild, user_id: int) -> CachedMember:
+        key = (guild.id, user_id)
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at > time.monotonic():
+            return entry
+
+        member = guild.get_member(user_id)
+        if member is not None:
+            return self._store(key, CachedMember.of(member))
+
+        # Not in the gateway cache: one REST fetch per key, shared by concurrent callers.
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            try:
+                if self.rest is not None:
+                    member = await self.rest.run(
+                        f"member:{guild.id}", Priority.LOOKUP, lambda: guild.fetch_member(user_id),
+                    )
+                else:
+                    member = await guild.fetch_member(user_id)
+            except discord.HTTPException:
+                member = None
+            entry = self._store(key, CachedMember.of(member))
+            future.set_result(entry)
+            return entry
+        except BaseException as err:
+            future.set_exception(err)
+            future.exception()  # mark retrieved when nobody else was waiting
+            raise
+        finally:
+            del self._inflight[key]
+
+    # -- gateway event hooks -----------------------------------------------
+
+    def member_updated(self, member: discord.Member) -> None:
+        key = (member.guild.id, member.id)
+        if key in self._entries:
+            self._store(key, CachedMember.of(member))
+
+    def member_removed(self, guild_id: int, user_id: int) -> None:
+        self._store((guild_id, user_id), CachedMember.of(None))
+
+    def member_joined(self, member: discord.Member) -> None:
+        key = (member.guild.id, member.id)
+        entry = self._entries.get(key)
+        if entry is not None and entry.member is None:
+            del self._entries[key]
+
+    def guild_changed(self, guild_id: int) -> None:
+        for key in [k for k in self._entries if k[0] == guild_id]:
+            del self._entries[key]
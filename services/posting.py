@@ -6,17 +6,24 @@ so the pipeline can run outside a Discord command invocation.
 """
 from __future__ import annotations
 
+import asyncio
 import datetime
 import io
 import json
 import re
+from dataclasses import dataclass
 
 import discord
+import numpy as np
 from discord.ext import commands
 from base64 import b64encode
 
 import exception
-from utils import bluesky_get, compute_hashes, detect_platform, imagehash, pixiv_ajax_get
+from config import normalize_text
+from services.analysis import ImageAnalysis, analyze
+from services.rest import Priority, RestScheduler
+from utils import bluesky_get, bluesky_get_pages, detect_platform, pixiv_ajax_get, pixiv_ajax_get_pages
+from utils.fingerprint import match, to_vector
 
 
 def error_description(error: Exception) -> tuple[str, str | None]:
@@ -34,6 +41,12 @@ def error_description(error: Exception) -> tuple[str, str | None]:
             "- Pixiv (<https://www.pixiv.net>)\n- Bluesky (<https://bsky.app>)",
             None,
         )
+    if isinstance(error, exception.InvalidPages):
+        return (
+            "Invalid pages! Use page numbers and ranges separated by commas (Ex: `1-3,5`), or `all`.\n"
+            + str(error).removeprefix("Command raised an exception: str: "),
+            None,
+        )
     if isinstance(error, exception.ForumNotFound):
         return ("Could not find correct forum channel! Check that {series} and {safety_level} is correct.", None)
     if isinstance(error, exception.AccessDenied):
@@ -66,6 +79,8 @@ def error_payload(error: Exception) -> tuple[int, str, str]:
     message, _ = error_description(error)
     if isinstance(error, exception.InvalidLink):
         return 400, "invalid_link", message
+    if isinstance(error, exception.InvalidPages):
+        return 400, "invalid_pages", message
     if isinstance(error, exception.ForumNotFound):
         return 400, "forum_not_found", message
     if isinstance(error, exception.ThreadsNotFound):
@@ -85,7 +100,7 @@ def error_payload(error: Exception) -> tuple[int, str, str]:
     return 500, "internal_error", message
 
 
-async def tags_model_pass(bot, hq_image: io.BytesIO, image_name: str, on_status=None) -> tuple[set, str, str]:
+async def tags_model_pass(bot, hq_image: io.BytesIO, image_name: str, on_status=None, analysis: ImageAnalysis | None = None) -> tuple[set, str, str]:
     """
     Run ML model on image to detect characters, series, and safety rating.
 
@@ -94,55 +109,94 @@ async def tags_model_pass(bot, hq_image: io.BytesIO, image_name: str, on_status=
         hq_image: BytesIO of the high-quality image
         image_name: Filename to determine image format
         on_status: optional async callable(text) for progress updates
+        analysis: the image's ImageAnalysis; its tagger-sized thumbnail is
+            sent instead of the full image
 
     Returns:
         tuple: (characters_set, series_str, safety_str)
     """
-    # Reset stream position and read image bytes
-    hq_image.seek(0)
-    image = hq_image.read()
-    hq_image.seek(0)  # Reset for later use
-
-    # Determine format from filename
-    if ".png" in image_name.lower():
-        mime = "image/png"
-    elif ".webp" in image_name.lower():
-        mime = "image/webp"
-    elif ".gif" in image_name.lower():
-        mime = "image/gif"
+    image_input = _tagger_input(hq_image, image_name, analysis)
+
+    if on_status:
+        await on_status("🤖 Running character & series detection model...")
+
+    result = await bot.tagger.predict(image_input)
+    return _map_tags(bot.config, result)
+
+
+def _tagger_input(hq_image: io.BytesIO, image_name: str, analysis: ImageAnalysis | None) -> dict:
+    if analysis is not None and analysis.thumbnail:
+        image, mime = analysis.thumbnail, "image/jpeg"
     else:
-        mime = "image/jpeg"
+        # Reset stream position and read image bytes
+        hq_image.seek(0)
+        image = hq_image.read()
+        hq_image.seek(0)  # Reset for later use
+
+        # Determine format from filename
+        if ".png" in image_name.lower():
+            mime = "image/png"
+        elif ".webp" in image_name.lower():
+            mime = "image/webp"
+        elif ".gif" in image_name.lower():
+            mime = "image/gif"
+        else:
+            mime = "image/jpeg"
 
     gradioIn = f"data:{mime};base64,{b64encode(image).decode('utf-8')}"
 
-    image_input = {
+    return {
         "url": gradioIn,
         "is_stream": False
     }
 
-    if on_status:
-        await on_status("🤖 Running character & series detection model...")
-
-    result = await bot.tagger.predict(image_input)
 
+def _map_tags(config, result) -> tuple[set, str, str]:
     charas = set()
     for chara in result.characters:
-        if chara in bot.config.char_map:
-            charas.add(bot.config.char_map[chara])
+        if chara in config.char_map:
+            charas.add(config.char_map[chara])
 
     series = ""
     for series_can in result.copyrights:
-        if series_can in bot.config.series_map:
-            series = bot.config.series_map[series_can]
+        if series_can in config.series_map:
+            series = config.series_map[series_can]
             break
 
     safety = ""
     if result.rating is not None:
-        safety = bot.config.safety_map.get(result.rating, "")
+        safety = config.safety_map.get(result.rating, "")
 
     return charas, series, safety
 
 
+async def tags_model_pass_many(bot, images: list[BatchImage], on_status=None) -> tuple[set, str, str]:
+    """
+    tags_model_pass() for a batch, in one tagger session (TaggerClient.predict_many).
+
+    Characters are the union over every image. Series and safety are only
+    returned when every image that produced one agrees, so a batch mixing
+    ratings or series leaves the forum for the poster to pick.
+    """
+    if on_status:
+        await on_status(f"🤖 Running character & series detection model on {len(images)} images...")
+    results = await bot.tagger.predict_many(
+        [_tagger_input(image.hq_image, image.image_name, image.analysis) for image in images]
+    )
+    charas = set()
+    series_found, safety_found = set(), set()
+    for result in results:
+        image_charas, series, safety = _map_tags(bot.config, result)
+        charas |= image_charas
+        if series:
+            series_found.add(series)
+        if safety:
+            safety_found.add(safety)
+    series = series_found.pop() if len(series_found) == 1 else ""
+    safety = safety_found.pop() if len(safety_found) == 1 else ""
+    return charas, series, safety
+
+
 def tags_pixiv_pass(config, ajax_resp: dict) -> tuple[set, str]:
     chara_tags = set()
     series = ""
@@ -156,10 +210,6 @@ def tags_pixiv_pass(config, ajax_resp: dict) -> tuple[set, str]:
     return chara_tags, series
 
 
-def _normalize_text(text: str) -> str:
-    return re.sub(r"[_\s]+", " ", text.lower())
-
-
 def tags_text_pass(config, text: str) -> tuple[set, str]:
     """
     Scan free text (e.g. a tweet body with hashtags) for known character and
@@ -174,20 +224,20 @@ def tags_text_pass(config, text: str) -> tuple[set, str]:
     if not text:
         return charas, series
 
-    norm = _normalize_text(text)
+    norm = normalize_text(text)
 
-    def key_in_text(tag: str) -> bool:
-        key = _normalize_text(tag)
-        if not key or key not in norm:
+    def key_in_text(key: str) -> bool:
+        if key not in norm:
             return False
         return re.search(rf"(?<!\w){re.escape(key)}(?!\w)", norm) is not None
 
-    for tag, name in config.char_map.items():
-        if key_in_text(tag):
+    # Keys are pre-normalized once per config reload (Config.*_text_index).
+    for key, name in config.char_text_index:
+        if key_in_text(key):
             charas.add(name)
 
-    for tag, name in config.series_map.items():
-        if key_in_text(tag):
+    for key, name in config.series_text_index:
+        if key_in_text(key):
             series = name
             break
 
@@ -204,75 +254,60 @@ def find_forum_by_name(guild: discord.Guild, series: str, safety: str) -> discor
     return None
 
 
-async def check_duplicate(bot, image: io.BytesIO, guild_id: int) -> tuple[dict, list]:
-    """
-    Check if image is a duplicate and return hashes.
-    Returns (hashes_dict, list_of_similar_images).
+async def check_duplicate(bot, image: io.BytesIO, guild_id: int) -> tuple[ImageAnalysis, list]:
     """
-    # Reset stream position for reading
-    image.seek(0)
-    hashes = compute_hashes(image)
-    image.seek(0)  # Reset for later use
-
-    # Convert ImageHash objects to hex strings for storage/comparison
-    hash_strings = {
-        "phash": str(hashes["phash"]),
-        "dhash": str(hashes["dhash"]),
-    }
-
-    # Find similar images in database
-    similar = await bot.db.find_similar(hash_strings["phash"])
-
-    # Filter to same guild and check if truly similar using phash + dhash
-    duplicates = []
-    for img in similar:
-        if img.guild_id == guild_id:
-            # Double-check with dhash for accuracy
-            stored_phash = imagehash.hex_to_hash(img.phash)
-            stored_dhash = imagehash.hex_to_hash(img.dhash)
-
-            phash_similar = (hashes["phash"] - stored_phash) <= 8
-            dhash_similar = (hashes["dhash"] - stored_dhash) <= 10
+    Analyze the image (services/analysis.py) and check if it is a duplicate.
+    Returns (analysis, list_of_similar_images).
 
-            if phash_similar and dhash_similar:
-                duplicates.append(img)
+    analysis.hashes is the image's fingerprint (utils/fingerprint.py): phash
+    and dhash plus the descriptors that catch mirrored, cropped, letterboxed
+    and recolored reposts, all as hex strings.
+    """
+    analysis = await analyze(image)
 
-    return hash_strings, duplicates
+    # Match against this guild's images, every descriptor in one pass
+    duplicates = await bot.db.find_similar(analysis.hashes, guild_id=guild_id)
+    return analysis, duplicates
 
 
 def _max_upload_size(guild: discord.Guild) -> int:
     return 52428799 if guild.premium_tier > 1 else 10485759
 
 
-async def validate_uploaded_image(bot, image_bytes: bytes, image_name: str, guild: discord.Guild) -> tuple[io.BytesIO, dict, bool]:
+async def validate_uploaded_image(bot, image_bytes: bytes, image_name: str, guild: discord.Guild, on_status=None) -> tuple[io.BytesIO, ImageAnalysis, bool]:
     """
     Validate an image uploaded directly (userscript twitter path): duplicate
     check + upload-size fallback determination.
 
     Returns:
-        tuple: (hq_image, hashes, embed_fallback)
+        tuple: (hq_image, analysis, embed_fallback)
 
     Raises:
         DuplicateImageFound: If image was already posted to this guild
     """
     hq_image = io.BytesIO(image_bytes)
-    hashes, duplicates = await check_duplicate(bot, hq_image, guild.id)
+    if on_status:
+        await on_status("🔍 Hashing image & checking for duplicates...")
+    analysis, duplicates = await check_duplicate(bot, hq_image, guild.id)
     if duplicates:
         dup = duplicates[0]
         raise exception.DuplicateImageFound(
             f"Post: https://discord.com/channels/{dup.guild_id}/{dup.thread_id}/{dup.message_id}"
         )
 
-    embed_fallback = hq_image.getbuffer().nbytes > _max_upload_size(guild)
-    return hq_image, hashes, embed_fallback
+    embed_fallback = analysis.size > _max_upload_size(guild)
+    if embed_fallback:
+        # Start fitting it under the limit now; create_embed_and_send picks it up.
+        bot.recompressor.prefetch(image_bytes, _max_upload_size(guild), key=analysis.sha256)
+    return hq_image, analysis, embed_fallback
 
 
-async def fetch_and_validate_image(bot, link: str, guild: discord.Guild, image_num: int | None = None, on_status=None) -> tuple[dict, io.BytesIO, str, dict, bool, str]:
+async def fetch_and_validate_image(bot, link: str, guild: discord.Guild, image_num: int | None = None, on_status=None) -> tuple[dict, io.BytesIO, str, ImageAnalysis, bool, str]:
     """
     Validate link, fetch image from supported platform, check for duplicates, and determine fallback mode.
 
     Returns:
-        tuple: (post_data, hq_image, image_name, hashes, embed_fallback, platform)
+        tuple: (post_data, hq_image, image_name, analysis, embed_fallback, platform)
 
     Raises:
         InvalidLink: If link is not from a supported platform
@@ -296,7 +331,7 @@ async def fetch_and_validate_image(bot, link: str, guild: discord.Guild, image_n
     # Check for duplicates before proceeding
     if on_status:
         await on_status("🔍 Hashing image & checking for duplicates...")
-    hashes, duplicates = await check_duplicate(bot, hq_image, guild.id)
+    analysis, duplicates = await check_duplicate(bot, hq_image, guild.id)
     if duplicates:
         dup = duplicates[0]
         raise exception.DuplicateImageFound(
@@ -304,19 +339,147 @@ async def fetch_and_validate_image(bot, link: str, guild: discord.Guild, image_n
         )
 
     # Determine if we need embed fallback based on server boost level
-    if hq_image.getbuffer().nbytes > _max_upload_size(guild):
+    if analysis.size > _max_upload_size(guild):
         embed_fallback = True
+        bot.recompressor.prefetch(hq_image.getvalue(), _max_upload_size(guild), key=analysis.sha256)
 
-    return post_data, hq_image, image_name, hashes, embed_fallback, platform
+    return post_data, hq_image, image_name, analysis, embed_fallback, platform
 
 
-async def find_character_threads(forum_channel: discord.ForumChannel, characters: str, on_status=None) -> tuple[list, list, list]:
+MAX_BATCH_PAGES = 20
+
+
+@dataclass
+class BatchImage:
+    """One page of a batch post (fetch_and_validate_pages)."""
+    page: int
+    hq_image: io.BytesIO
+    image_name: str
+    analysis: ImageAnalysis
+    embed_fallback: bool
+
+
+def parse_pages(spec: str) -> list[int] | None:
+    """
+    Parse a page selection like "1-3,5" into [1, 2, 3, 5] (1-indexed, in
+    order, without repeats). "all" returns None, meaning every page.
+
+    Raises:
+        InvalidPages: If the spec is malformed or selects more than MAX_BATCH_PAGES
+    """
+    spec = spec.strip().lower()
+    if spec == "all":
+        return None
+    pages: list[int] = []
+    for part in spec.replace(" ", "").split(","):
+        start, sep, end = part.partition("-")
+        if not start.isdigit() or (sep and not end.isdigit()):
+            raise exception.InvalidPages(f"Could not read `{part}`")
+        first, last = int(start), int(end) if sep else int(start)
+        if first < 1 or last < first:
+            raise exception.InvalidPages(f"`{part}` is not a valid range")
+        if last - first + 1 > MAX_BATCH_PAGES:
+            raise exception.InvalidPages(f"At most {MAX_BATCH_PAGES} pages can be posted at once")
+        pages.extend(page for page in range(first, last + 1) if page not in pages)
+    if len(pages) > MAX_BATCH_PAGES:
+        raise exception.InvalidPages(f"At most {MAX_BATCH_PAGES} pages can be posted at once")
+    return pages
+
+
+async def fetch_and_validate_pages(bot, link: str, guild: discord.Guild, pages: list[int] | None, on_status=None) -> tuple[dict, list[BatchImage], list[str], str]:
+    """
+    fetch_and_validate_image() for several pages of one post: the post
+    metadata is fetched once, pages are downloaded and analyzed concurrently,
+    and every page is checked for duplicates in one pass over the guild's
+    images (plus against the other pages of the batch).
+
+    Duplicate pages are skipped rather than failing the batch.
+
+    Returns:
+        tuple: (post_data, images, skipped, platform) where skipped describes
+        each duplicate page that was left out
+
+    Raises:
+        InvalidLink: If link is not from a supported platform
+        InvalidPages: If more than MAX_BATCH_PAGES pages are selected
+        DuplicateImageFound: If every selected page was already posted
+    """
+    platform = detect_platform(link)
+    if platform == "pixiv":
+        post_data, fetched = await pixiv_ajax_get_pages(bot, link, pages, on_status=on_status)
+    elif platform == "bluesky":
+        post_data, fetched = await bluesky_get_pages(bot, link, pages, on_status=on_status)
+    else:
+        raise exception.InvalidLink("Invalid Link! Supported platforms: Pixiv, Bluesky")
+    if len(fetched) > MAX_BATCH_PAGES:
+        raise exception.InvalidPages(
+            f"This post has {len(fetched)} images; at most {MAX_BATCH_PAGES} can be posted at once"
+        )
+    if pages is None or len(fetched) != len(pages):  # "all", or an ugoira
+        pages = list(range(1, len(fetched) + 1))
+
+    if on_status:
+        await on_status(f"🔍 Hashing {len(fetched)} images & checking for duplicates...")
+    analyses = await asyncio.gather(*(analyze(hq_image) for hq_image, _ in fetched))
+    duplicates = await bot.db.find_similar_many([analysis.hashes for analysis in analyses], guild_id=guild.id)
+
+    vectors = [to_vector(analysis.hashes) for analysis in analyses]
+    stored = np.array([vector for vector, _ in vectors], dtype=np.uint64)
+    stored_full = np.array([full for _, full in vectors], dtype=bool)
+    kept = np.zeros(len(fetched), dtype=bool)
+
+    limit = _max_upload_size(guild)
+    images: list[BatchImage] = []
+    skipped: list[str] = []
+    for i, (page, (hq_image, image_name), analysis, dups) in enumerate(zip(pages, fetched, analyses, duplicates)):
+        if dups:
+            dup = dups[0]
+            skipped.append(f"Image {page}: https://discord.com/channels/{dup.guild_id}/{dup.thread_id}/{dup.message_id}")
+            continue
+        same = np.flatnonzero(kept[:i] & match(stored[:i], stored_full[:i], *vectors[i]))
+        if len(same):
+            skipped.append(f"Image {page}: same as image {pages[same[0]]}")
+            continue
+        kept[i] = True
+        embed_fallback = analysis.size > limit
+        if embed_fallback:
+            bot.recompressor.prefetch(hq_image.getvalue(), limit, key=analysis.sha256)
+        images.append(BatchImage(page, hq_image, image_name, analysis, embed_fallback))
+
+    if not images:
+        raise exception.DuplicateImageFound("\n".join(skipped))
+    return post_data, images, skipped, platform
+
+
+ARCHIVE_PAGE = 100   # threads per archived-thread listing request (Discord's max)
+
+
+async def _archived_threads(forum_channel: discord.ForumChannel, rest: RestScheduler | None):
+    """Yield the forum's archived threads, newest first, one listing request
+    per page. Each page is its own RestScheduler call, so pages are paced by
+    the route bucket and no slot is held while the caller looks at a page."""
+    route = f"archived_threads:{forum_channel.id}"
+    before = None
+    while True:
+        async def fetch_page(before=before):
+            return [thread async for thread in forum_channel.archived_threads(limit=ARCHIVE_PAGE, before=before)]
+
+        page = await (fetch_page() if rest is None else rest.run(route, Priority.LOOKUP, fetch_page))
+        for thread in page:
+            yield thread
+        if len(page) < ARCHIVE_PAGE:
+            return
+        before = page[-1].archive_timestamp
+
+
+async def find_character_threads(forum_channel: discord.ForumChannel, characters: str, on_status=None, rest: RestScheduler | None = None) -> tuple[list, list, list]:
     """
     Find all character threads, group threads, and "All Characters" thread in forum.
 
     Args:
         forum_channel: The forum channel to search
         characters: Comma-separated character names
+        rest: the bot's RestScheduler; each archived-thread page goes through it
 
     Returns:
         tuple: (threads, thread_names, group_names)
@@ -358,7 +521,7 @@ async def find_character_threads(forum_channel: discord.ForumChannel, characters
     if len(threads) != len(charas) + 1:
         if on_status:
             await on_status(f"📂 Searching archived threads in {forum_channel.name}...")
-        async for thread in forum_channel.archived_threads():
+        async for thread in _archived_threads(forum_channel, rest):
             process_thread(thread)
             if len(threads) == len(charas) + 1:
                 break
@@ -372,7 +535,7 @@ async def find_character_threads(forum_channel: discord.ForumChannel, characters
                     thread_names.append(thread.name.lower())
                     break
             if group_name not in thread_names:
-                async for thread in forum_channel.archived_threads():
+                async for thread in _archived_threads(forum_channel, rest):
                     if group_name == thread.name.lower() and thread.name.lower() not in thread_names:
                         threads.append(thread)
                         thread_names.append(thread.name.lower())
@@ -394,6 +557,37 @@ async def find_character_threads(forum_channel: discord.ForumChannel, characters
     return threads, thread_names, group_names
 
 
+async def post_batch(bot, link: str, post_data: dict, threads: list, poster_name: str, guild_id: int, channel_name: str, images: list[BatchImage], platform: str = "pixiv", on_status=None) -> tuple[list[str], list[int]]:
+    """
+    Post every image of a batch to the same (already resolved) threads, in
+    page order. Each image that posted is removed from `images`, so a retry
+    after a failure carries on from the first image that didn't.
+
+    Returns:
+        tuple: (thread links per image, post ids)
+    """
+    links, post_ids = [], []
+    total = len(images)
+    for idx in range(1, total + 1):
+        image = images[0]
+
+        async def page_status(text: str, idx=idx) -> None:
+            if on_status:
+                await on_status(f"[{idx}/{total}] {text}")
+
+        image.hq_image.seek(0)
+        thread_links, post_id = await create_embed_and_send(
+            bot, link, post_data, threads, poster_name, guild_id, channel_name,
+            image.embed_fallback, image.hq_image.read(), image.image_name, image.analysis.hashes,
+            image.page, platform, on_status=page_status,
+        )
+        images.pop(0)
+        links.append(thread_links)
+        if post_id is not None:
+            post_ids.append(post_id)
+    return links, post_ids
+
+
 async def store_image_hash(bot, hashes: dict, link: str, platform: str, guild_id: int, thread_id: int, message_id: int):
     """Store image hashes in database for duplicate detection. Returns the created Image."""
     return await bot.db.add_image(
@@ -404,6 +598,7 @@ async def store_image_hash(bot, hashes: dict, link: str, platform: str, guild_id
         guild_id=guild_id,
         thread_id=thread_id,
         message_id=message_id,
+        fingerprint=hashes,
     )
 
 
@@ -445,6 +640,15 @@ async def create_embed_and_send(bot, link: str, post_data: dict, threads: list,
         embed_author_url = link
         fallback_link = link
 
+    # Too big to attach: re-encode it to fit rather than linking out.
+    recompressed = None
+    if embed_fallback and threads:
+        if on_status:
+            await on_status("🗜️ Recompressing image to fit the upload limit...")
+        recompressed = await bot.recompressor.fit(hq_image, min(_max_upload_size(thread.guild) for thread in threads))
+        if recompressed is not None:
+            hq_image, image_name, embed_fallback = recompressed.data, recompressed.filename(image_name), False
+
     if not embed_fallback:
         embed = discord.Embed(
         title=embed_title,
@@ -468,9 +672,10 @@ async def create_embed_and_send(bot, link: str, post_data: dict, threads: list,
         if on_status:
             await on_status(f"📤 Posting to thread {idx} of {total}: #{thread.name}")
         if not embed_fallback:
-            post = await thread.send(content=f"<{link}>",embed=embed, file=discord.File(io.BytesIO(hq_image),filename=image_name))
+            send = lambda thread=thread: thread.send(content=f"<{link}>",embed=embed, file=discord.File(io.BytesIO(hq_image),filename=image_name))
         else:
-            post = await thread.send(content=embed)
+            send = lambda thread=thread: thread.send(content=embed)
+        post = await bot.rest.run(f"channel:{thread.id}", Priority.POST, send)
 
         # Store first post for hash tracking
         if first_post is None:
@@ -499,6 +704,8 @@ async def create_embed_and_send(bot, link: str, post_data: dict, threads: list,
 
     await send_webhook(bot, embed, post, channel_name, link)
 
+    if recompressed is not None:
+        msg += "\n**NOTE:** Image was recompressed to fit the server's upload limit."
     if embed_fallback:
         if platform == "pixiv":
             msg += "\n**NOTE:** Older embed system (Phixiv) has been used due to the image being too big to upload directly."
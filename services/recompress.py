@@ -0,0 +1,180 @@
+"""Fit oversized images under a guild's upload limit instead of linking out.
+
+When an image is over the limit, create_embed_and_send used to post a bare
+phixiv/fxtwitter link. Here the image is re-encoded until it fits, cheapest
+loss first:
+
+  1. lossless PNG, when the original isn't a PNG already;
+  2. WebP (images with transparency) or JPEG, binary-searching the quality
+     between MIN_QUALITY and MAX_QUALITY for the best one that fits, stopping
+     early once a candidate lands within FIT_SLACK of the limit;
+  3. the same at smaller scales, each picked from how far over the last try was.
+
+Encoding runs in a small dedicated thread pool (Pillow releases the GIL while
+encoding). Results are cached per (image sha256, limit) in a bounded LRU, and
+concurrent requests for the same pair share one job — prefetch() starts it as
+soon as an image is known to be too big, so it's usually done by confirm time.
+Animated images are left alone (None): re-encoding them frame by frame isn't
+worth it, and they keep the link fallback.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import io
+import logging
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import PurePath
+
+from PIL import Image
+
+MIN_QUALITY = 60
+MAX_QUALITY = 95
+FIT_SLACK = 0.05          # a candidate within 5% under the limit is good enough
+MIN_SIDE = 512            # don't downscale the shorter side below this
+SCALE_MARGIN = 0.95       # aim a little under the limit when picking a scale
+MAX_SCALE_STEPS = 6
+
+WORKERS = int(os.getenv("RECOMPRESS_WORKERS", "2") or 2)
+CACHE_BYTES = int(os.getenv("RECOMPRESS_CACHE_MB", "128") or 128) * 1024 * 1024
+
+LOGGER = logging.getLogger(__name__)
+
+_EXTENSIONS = {"PNG": ".png", "WEBP": ".webp", "JPEG": ".jpg"}
+
+
+@dataclass(frozen=True)
+class Recompressed:
+    data: bytes
+    format: str       # "PNG", "WEBP" or "JPEG"
+    quality: int | None
+    scale: float
+
+    def filename(self, original: str) -> str:
+        return PurePath(original).stem + _EXTENSIONS[self.format]
+
+
+def _has_alpha(image: Image.Image) -> bool:
+    return image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+
+
+def _encode(image: Image.Image, fmt: str, quality: int | None = None) -> bytes:
+    buf = io.BytesIO()
+    if fmt == "PNG":
+        image.save(buf, format="PNG", optimize=True)
+    elif fmt == "WEBP":
+        image.save(buf, format="WEBP", quality=quality, method=4)
+    else:
+        image.save(buf, format="JPEG", quality=quality, optimize=True, progressive=True, subsampling=0 if quality >= 90 else 2)
+    return buf.getvalue()
+
+
+def _search_quality(image: Image.Image, fmt: str, limit: int) -> tuple[bytes | None, int, int]:
+    """Best-quality encoding under `limit`: (data or None, quality, size at MIN_QUALITY)."""
+    best = _encode(image, fmt, MAX_QUALITY)
+    if len(best) <= limit:
+        return best, MAX_QUALITY, len(best)
+    floor = _encode(image, fmt, MIN_QUALITY)
+    if len(floor) > limit:
+        return None, MIN_QUALITY, len(floor)
+    found, found_quality = floor, MIN_QUALITY
+    lo, hi = MIN_QUALITY + 1, MAX_QUALITY - 1
+    while lo <= hi and len(found) < limit * (1 - FIT_SLACK):
+        quality = (lo + hi) // 2
+        data = _encode(image, fmt, quality)
+        if len(data) <= limit:
+            found, found_quality, lo = data, quality, quality + 1
+        else:
+            hi = quality - 1
+    return found, found_quality, len(floor)
+
+
+def recompress_bytes(data: bytes, limit: int) -> Recompressed | None:
+    """Re-encode `data` to at most `limit` bytes, or None if it can't be done sensibly."""
+    image = Image.open(io.BytesIO(data))
+    if getattr(image, "is_animated", False):
+        return None
+    original_format = image.format
+    image.load()
+    alpha = _has_alpha(image)
+    image = image.convert("RGBA" if alpha else "RGB")
+
+    if original_format != "PNG":
+        lossless = _encode(image, "PNG")
+        if len(lossless) <= limit:
+            return Recompressed(lossless, "PNG", None, 1.0)
+
+    fmt = "WEBP" if alpha else "JPEG"
+    scale, scaled = 1.0, image
+    for _ in range(MAX_SCALE_STEPS):
+        encoded, quality, floor_size = _search_quality(scaled, fmt, limit)
+        if encoded is not None:
+            return Recompressed(encoded, fmt, quality, round(scale, 3))
+        # Size scales roughly with pixel count: jump straight to a scale that should fit.
+        scale *= min(0.9, (limit * SCALE_MARGIN / floor_size) ** 0.5)
+        size = (round(image.width * scale), round(image.height * scale))
+        if min(size) < MIN_SIDE:
+            return None
+        scaled = image.resize(size, Image.LANCZOS)
+    return None
+
+
+class Recompressor:
+    def __init__(self, workers: int = WORKERS, cache_bytes: int = CACHE_BYTES) -> None:
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="recompress")
+        self.cache_bytes = cache_bytes
+        self._cache: OrderedDict[tuple[str, int], Recompressed | None] = OrderedDict()
+        self._cached_bytes = 0
+        self._jobs: dict[tuple[str, int], asyncio.Future] = {}
+
+    def _remember(self, key: tuple[str, int], result: Recompressed | None) -> None:
+        size = len(result.data) if result else 0
+        if size > self.cache_bytes:
+            return
+        self._cache[key] = result
+        self._cached_bytes += size
+        while self._cached_bytes > self.cache_bytes:
+            _, dropped = self._cache.popitem(last=False)
+            self._cached_bytes -= len(dropped.data) if dropped else 0
+
+    def _start(self, data: bytes, limit: int, key: str | None) -> tuple[tuple[str, int], asyncio.Future | None]:
+        cache_key = (key or hashlib.sha256(data).hexdigest(), limit)
+        if cache_key in self._cache:
+            self._cache.move_to_end(cache_key)
+            return cache_key, None
+        job = self._jobs.get(cache_key)
+        if job is None:
+            loop = asyncio.get_running_loop()
+            job = asyncio.ensure_future(loop.run_in_executor(self._pool, recompress_bytes, data, limit))
+            self._jobs[cache_key] = job
+            job.add_done_callback(lambda done: self._finish(cache_key, done))
+        return cache_key, job
+
+    def _finish(self, cache_key: tuple[str, int], job: asyncio.Future) -> None:
+        self._jobs.pop(cache_key, None)
+        if job.cancelled():
+            return
+        if job.exception() is not None:
+            LOGGER.warning(f"Recompressing image {cache_key[0][:12]} failed: {job.exception()}")
+            return
+        self._remember(cache_key, job.result())
+
+    def prefetch(self, data: bytes, limit: int, key: str | None = None) -> None:
+        """Start recompressing in the background; fit() picks up the result."""
+        self._start(data, limit, key)
+
+    async def fit(self, data: bytes, limit: int, key: str | None = None) -> Recompressed | None:
+        """`data` re-encoded to fit `limit`, or None if it can't be (or failed)."""
+        cache_key, job = self._start(data, limit, key)
+        if job is None:
+            return self._cache[cache_key]
+        try:
+            return await asyncio.shield(job)
+        except Exception:  # noqa: BLE001 — logged in _finish; the caller falls back
+            return None
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
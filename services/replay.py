@@ -0,0 +1,86 @@
+"""Replay protection for single-use setup tokens.
+
+SQLite (db.models.SpentToken) is the source of truth: the jti is the primary
+key, so burning a token is one INSERT and of two concurrent redemptions — in
+this process, another worker, or before a restart — exactly one succeeds.
+
+In front of it sits a ring of per-minute buckets of recently burned jtis, so
+replays are refused without a query. Checks and inserts are O(1); expiry drops
+whole buckets instead of scanning every entry, and MAX_ENTRIES caps memory by
+dropping the oldest bucket early (the DB still remembers those jtis). Expired
+rows are deleted from the DB at most once per SWEEP_INTERVAL.
+"""
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+
+from tortoise.exceptions import IntegrityError
+
+from db.models import SpentToken
+
+BUCKET_SECONDS = 60
+MAX_ENTRIES = 50000
+SWEEP_INTERVAL = 60
+
+
+class ReplayStore:
+    def __init__(self, max_entries: int = MAX_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self._buckets: OrderedDict[int, set[str]] = OrderedDict()  # expiry minute -> jtis
+        self._where: dict[str, int] = {}                              # jti -> its bucket
+        self._next_sweep = 0.0
+
+    def _expire(self, now: float) -> None:
+        current = int(now // BUCKET_SECONDS)
+        while self._buckets and next(iter(self._buckets)) < current:
+            self._drop_oldest()
+
+    def _drop_oldest(self) -> None:
+        _, jtis = self._buckets.popitem(last=False)
+        for jti in jtis:
+            del self._where[jti]
+
+    def _remember(self, jti: str, expires_at: float) -> None:
+        # Round the bucket up so an entry is never forgotten before it expires.
+        bucket = -int(-expires_at // BUCKET_SECONDS)
+        if bucket not in self._buckets:
+            self._buckets[bucket] = set()
+            if len(self._buckets) > 1 and bucket < next(reversed(self._buckets)):
+                self._buckets = OrderedDict(sorted(self._buckets.items()))
+        self._buckets[bucket].add(jti)
+        self._where[jti] = bucket
+        while len(self._where) > self.max_entries and len(self._buckets) > 1:
+            self._drop_oldest()
+
+    async def is_spent(self, jti: str) -> bool:
+        self._expire(time.time())
+        if jti in self._where:
+            return True
+        return await SpentToken.filter(jti=jti, expires_at__gte=time.time()).exists()
+
+    async def spend(self, jti: str, expires_at: float) -> bool:
+        """Burn jti. False if it was already spent (by anyone)."""
+        now = time.time()
+        self._expire(now)
+        if jti in self._where:
+            return False
+        await self._maybe_sweep(now)
+        try:
+            await SpentToken.create(jti=jti, expires_at=expires_at)
+        except IntegrityError:
+            row = await SpentToken.get_or_none(jti=jti)
+            if row is None or row.expires_at >= now:
+                self._remember(jti, row.expires_at if row else expires_at)
+                return False
+            # A stale row the sweep hasn't reached yet: take it over.
+            row.expires_at = expires_at
+            await row.save(update_fields=["expires_at"])
+        self._remember(jti, expires_at)
+        return True
+
+    async def _maybe_sweep(self, now: float) -> None:
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + SWEEP_INTERVAL
+        await SpentToken.filter(expires_at__lt=now).delete()
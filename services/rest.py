@@ -0,0 +1,106 @@
+"""Shared budget for the Discord REST calls the posting pipeline makes.
+
+discord.py already waits out 429s per route, but it has no idea which calls
+matter: a burst of posts used to queue status edits, archived-thread
+listings, member fetches and the actual thread.send calls all at once, and
+the sends stalled behind cosmetic edits. Every such call now goes through
+RestScheduler:
+
+  * each call names its route bucket (ROUTE_LIMITS — e.g. messages in one
+    channel share "channel:{id}") and is paced by that bucket's rate, so we
+    stay under Discord's limits instead of finding them with 429s;
+  * at most REST_CONCURRENCY calls run at once, and when callers are queued
+    the slot goes to the most important one first (Priority).
+
+Status edits are also coalesced before they get here (services/status.py).
+
+`metrics` exposes queue depths per priority for the web status page.
+"""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import os
+from enum import IntEnum
+from typing import Awaitable, Callable
+
+from utils.danbooru import TokenBucket
+
+CONCURRENCY = int(os.getenv("REST_CONCURRENCY", "4") or 4)
+
+# Route kind -> (requests per second, burst). Message create/edit is 5 per 5s
+# per channel; the others are conservative guesses at Discord's buckets.
+ROUTE_LIMITS = {
+    "channel": (1.0, 5),
+    "archived_threads": (1.0, 2),
+    "member": (2.0, 5),
+}
+DEFAULT_LIMIT = (5.0, 10)
+
+
+class Priority(IntEnum):
+    POST = 0      # the user-visible result: thread.send
+    LOOKUP = 1    # needed to finish a post: threads, members
+    STATUS = 2    # progress edits; already coalesced, and the first to wait
+
+
+class RestScheduler:
+    def __init__(self, concurrency: int = CONCURRENCY) -> None:
+        self.concurrency = concurrency
+        self._free = concurrency
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._buckets: dict[str, TokenBucket] = {}
+        self._queued = {priority: 0 for priority in Priority}
+        self._completed = {priority: 0 for priority in Priority}
+
+    def _bucket(self, route: str) -> TokenBucket:
+        bucket = self._buckets.get(route)
+        if bucket is None:
+            rate, burst = ROUTE_LIMITS.get(route.split(":", 1)[0], DEFAULT_LIMIT)
+            bucket = self._buckets[route] = TokenBucket(rate, burst)
+        return bucket
+
+    async def _acquire(self, priority: Priority) -> None:
+        if self._free > 0 and not self._waiters:
+            self._free -= 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), waiter))
+        self._queued[priority] += 1
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release()  # granted just as we were cancelled: pass it on
+            raise
+        finally:
+            self._queued[priority] -= 1
+
+    def _release(self) -> None:
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._free += 1
+
+    async def run(self, route: str, priority: Priority, call: Callable[[], Awaitable]):
+        """Run `call()` (a REST coroutine factory making one request) within
+        the budget: one token from `route`'s bucket, one slot while it runs."""
+        await self._bucket(route).acquire()
+        await self._acquire(priority)
+        try:
+            return await call()
+        finally:
+            self._release()
+            self._completed[priority] += 1
+
+    @property
+    def metrics(self) -> dict:
+        return {
+            "in_flight": self.concurrency - self._free,
+            "queued": {priority.name.lower(): count for priority, count in self._queued.items()},
+            "completed": {priority.name.lower(): count for priority, count in self._completed.items()},
+        }
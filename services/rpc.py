@@ -0,0 +1,183 @@
+"""Small request/response RPC over a Unix socket, between the bot process and
+the web workers (see web/backend.py).
+
+Each frame is a struct header (JSON length, blob length), a JSON object and an
+optional binary blob, so images cross the socket as raw bytes rather than
+base64. Requests are {"id", "method", "params"}; replies are {"id", "result"}
+or {"id", "error": {...}}. One connection carries any number of concurrent
+calls, matched up by id.
+"""
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import struct
+from pathlib import Path
+from typing import Awaitable, Callable
+
+FRAME = struct.Struct("<II")    # JSON length, blob length
+MAX_FRAME = 64 * 1024 * 1024
+
+LOGGER = logging.getLogger(__name__)
+
+
+class RpcError(Exception):
+    """A call failed on the other side; payload is the error object it sent."""
+
+    def __init__(self, payload: dict) -> None:
+        super().__init__(payload.get("message", "RPC call failed"))
+        self.payload = payload
+
+
+class RpcUnavailable(Exception):
+    """The other process can't be reached."""
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> tuple[dict, bytes | None]:
+    head_len, blob_len = FRAME.unpack(await reader.readexactly(FRAME.size))
+    if head_len + blob_len > MAX_FRAME:
+        raise ValueError(f"RPC frame too large ({head_len + blob_len} bytes)")
+    head = json.loads(await reader.readexactly(head_len))
+    blob = await reader.readexactly(blob_len) if blob_len else None
+    return head, blob
+
+
+def _frame(head: dict, blob: bytes | None = None) -> bytes:
+    encoded = json.dumps(head, separators=(",", ":")).encode()
+    return FRAME.pack(len(encoded), len(blob or b"")) + encoded + (blob or b"")
+
+
+Handler = Callable[..., Awaitable]
+ErrorMapper = Callable[[Exception], dict]
+
+
+class RpcServer:
+    def __init__(self, path: str | Path, handlers: dict[str, Handler], on_error: ErrorMapper) -> None:
+        """handlers[method](**params, blob=...) returns a JSON-able result;
+        on_error(exc) turns anything it raises into the error object sent back."""
+        self.path = Path(path)
+        self.handlers = handlers
+        self.on_error = on_error
+        self._server: asyncio.AbstractServer | None = None
+        self._connections: set[asyncio.StreamWriter] = set()
+
+    async def start(self) -> None:
+        self.path.unlink(missing_ok=True)
+        self._server = await asyncio.start_unix_server(self._connection, path=str(self.path))
+        os.chmod(self.path, 0o600)
+        LOGGER.info(f"Bot RPC listening on {self.path}")
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._connections):
+                writer.close()  # ends each connection's read loop
+            await self._server.wait_closed()
+            self._server = None
+        self.path.unlink(missing_ok=True)
+
+    async def _connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        write_lock = asyncio.Lock()
+        tasks: set[asyncio.Task] = set()
+        self._connections.add(writer)
+        try:
+            while True:
+                try:
+                    head, blob = await _read_frame(reader)
+                except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+                    return
+                task = asyncio.create_task(self._call(head, blob, writer, write_lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            self._connections.discard(writer)
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def _call(self, head: dict, blob: bytes | None, writer: asyncio.StreamWriter, write_lock: asyncio.Lock) -> None:
+        handler = self.handlers.get(head.get("method", ""))
+        try:
+            if handler is None:
+                raise LookupError(f"Unknown RPC method {head.get('method')!r}")
+            params = head.get("params") or {}
+            reply = {"id": head["id"], "result": await (handler(**params, blob=blob) if blob else handler(**params))}
+        except Exception as err:  # noqa: BLE001
+            reply = {"id": head.get("id"), "error": self.on_error(err)}
+        async with write_lock:
+            try:
+                writer.write(_frame(reply))
+                await writer.drain()
+            except ConnectionError:
+                pass  # the worker went away; nothing to answer
+
+
+class RpcClient:
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self._ids = itertools.count(1)
+        self._pending: dict[int, asyncio.Future] = {}
+        self._writer: asyncio.StreamWriter | None = None
+        self._reader_task: asyncio.Task | None = None
+        self._connect_lock = asyncio.Lock()
+        self._write_lock = asyncio.Lock()
+
+    async def _connect(self) -> asyncio.StreamWriter:
+        async with self._connect_lock:
+            if self._writer is None or self._writer.is_closing():
+                try:
+                    reader, self._writer = await asyncio.open_unix_connection(str(self.path))
+                except OSError as err:
+                    raise RpcUnavailable(f"Bot RPC socket {self.path} unavailable: {err}") from err
+                self._reader_task = asyncio.create_task(self._read_replies(reader))
+            return self._writer
+
+    async def _read_replies(self, reader: asyncio.StreamReader) -> None:
+        try:
+            while True:
+                head, _ = await _read_frame(reader)
+                future = self._pending.pop(head.get("id"), None)
+                if future is None or future.done():
+                    continue
+                if "error" in head:
+                    future.set_exception(RpcError(head["error"]))
+                else:
+                    future.set_result(head.get("result"))
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            pending, self._pending = self._pending, {}
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(RpcUnavailable("Bot RPC connection lost"))
+
+    async def call(self, method: str, blob: bytes | None = None, **params):
+        writer = await self._connect()
+        call_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[call_id] = future
+        try:
+            async with self._write_lock:
+                writer.write(_frame({"id": call_id, "method": method, "params": params}, blob))
+                await writer.drain()
+        except ConnectionError as err:
+            self._pending.pop(call_id, None)
+            raise RpcUnavailable(f"Bot RPC connection lost: {err}") from err
+        try:
+            return await future
+        finally:
+            self._pending.pop(call_id, None)
+
+    async def close(self) -> None:
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            self._reader_task = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
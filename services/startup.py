@@ -0,0 +1,108 @@
+"""Boot bookkeeping for ArtBot.setup_hook.
+
+Startup steps that don't depend on each other (Bluesky login, database) run
+concurrently, and each one is timed; extensions load after the database, since
+cogs may use it while loading. Time-to-ready — from process
+start until the gateway is ready and the duplicate-hash index is loaded — is
+logged once and kept in `Startup.metrics` for the admin panel.
+
+Global command sync is a slow, rate-limited REST call that only matters when
+the slash commands changed, so it is skipped when a hash of the command tree
+matches the one recorded at the last sync.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Awaitable
+
+from discord import app_commands
+
+PROCESS_STARTED = time.monotonic()  # as close to process start as an import gets
+
+LOGGER = logging.getLogger(__name__)
+
+
+def command_tree_hash(tree: app_commands.CommandTree, application_id: int | None) -> str:
+    """sha256 of the global command payloads that tree.sync() would upload."""
+    payload = sorted(
+        (command.to_dict(tree) for command in tree.get_commands()),
+        key=lambda command: (command.get("type", 1), command["name"]),
+    )
+    encoded = json.dumps([application_id, payload], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class CommandSyncState:
+    """The command-tree hash recorded after the last successful global sync."""
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+
+    def last(self) -> str | None:
+        try:
+            return self.path.read_text().strip() or None
+        except OSError:
+            return None
+
+    def record(self, digest: str) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(digest)
+        os.replace(tmp, self.path)
+
+    def forget(self) -> None:
+        self.path.unlink(missing_ok=True)
+
+
+class Startup:
+    def __init__(self) -> None:
+        self.steps: dict[str, float] = {}       # duration of each setup step
+        self.milestones: dict[str, float] = {}  # seconds after process start
+        self.time_to_ready: float | None = None
+        self._waiting: set[str] = {"gateway"}
+
+    async def step(self, name: str, awaitable: Awaitable):
+        started = time.monotonic()
+        try:
+            return await awaitable
+        finally:
+            self.steps[name] = round(time.monotonic() - started, 3)
+            LOGGER.info(f"Startup step {name} took {self.steps[name]:.2f}s")
+
+    async def gather(self, **steps: Awaitable) -> list:
+        """Run independent steps concurrently; the first failure is raised once all finish."""
+        results = await asyncio.gather(
+            *(self.step(name, awaitable) for name, awaitable in steps.items()),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return results
+
+    def wait_for(self, name: str) -> None:
+        """Count `name` as part of time-to-ready; call mark(name) when it's done."""
+        if self.time_to_ready is None:
+            self._waiting.add(name)
+
+    def mark(self, name: str) -> None:
+        self.milestones.setdefault(name, round(time.monotonic() - PROCESS_STARTED, 3))
+        self._waiting.discard(name)
+        if not self._waiting and self.time_to_ready is None:
+            self.time_to_ready = round(time.monotonic() - PROCESS_STARTED, 3)
+            LOGGER.info(f"Ready {self.time_to_ready:.2f}s after process start ({self._summary()})")
+
+    def _summary(self) -> str:
+        steps = (f"{name} {seconds:.2f}s" for name, seconds in self.steps.items())
+        milestones = (f"{name} at {seconds:.2f}s" for name, seconds in self.milestones.items())
+        return ", ".join([*steps, *milestones])
+
+    @property
+    def metrics(self) -> dict:
+        return {"time_to_ready": self.time_to_ready, "steps": dict(self.steps), "milestones": dict(self.milestones)}
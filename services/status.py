@@ -0,0 +1,106 @@
+"""Coalesced progress updates for long-running commands and API jobs.
+
+The pipeline reports every step through an on_status callback: each
+download, archived-thread search and thread posted. Passing each one
+straight through costs a message edit per step (or an SSE event per step
+for API jobs). StatusCoalescer sits in between: it keeps only the newest
+pending text and hands it to its sink at most once per interval. The first
+update also waits an interval, so a command that finishes sooner than that
+never shows intermediate steps at all — settle() drops whatever is still
+pending before the final result is shown.
+
+STATUS_UPDATE_INTERVAL sets the interval in seconds (default 1).
+status_metrics() totals what every coalescer sent and dropped, for the web
+status page.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+import weakref
+from typing import Awaitable, Callable
+
+INTERVAL = float(os.getenv("STATUS_UPDATE_INTERVAL", "1.0") or 1.0)
+
+LOGGER = logging.getLogger(__name__)
+
+_TOTALS = {"sent": 0, "coalesced": 0}
+_LIVE: weakref.WeakSet[StatusCoalescer] = weakref.WeakSet()
+
+
+class StatusCoalescer:
+    def __init__(self, sink: Callable[[str], Awaitable], interval: float = INTERVAL) -> None:
+        self.sink = sink
+        self.interval = interval
+        self.sent = 0
+        self.dropped = 0
+        self._latest: str | None = None
+        self._next = time.monotonic() + interval
+        self._flusher: asyncio.Task | None = None
+        self._sending: asyncio.Future | None = None
+        _LIVE.add(self)
+
+    def _drop(self) -> None:
+        self.dropped += 1
+        _TOTALS["coalesced"] += 1
+
+    async def __call__(self, text: str) -> None:
+        """on_status-compatible: queue `text`, replacing any pending update."""
+        if self._latest is not None:
+            self._drop()
+        self._latest = text
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush())
+
+    async def _flush(self) -> None:
+        try:
+            while True:
+                wait = self._next - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                text, self._latest = self._latest, None
+                if text is None:
+                    return
+                self._next = time.monotonic() + self.interval
+                self._sending = asyncio.ensure_future(self.sink(text))
+                try:
+                    await asyncio.shield(self._sending)
+                    self.sent += 1
+                    _TOTALS["sent"] += 1
+                except asyncio.CancelledError:
+                    raise
+                except Exception as err:  # noqa: BLE001 — a status glitch never breaks a command
+                    LOGGER.debug(f"Status update failed: {err}")
+                finally:
+                    self._sending = None
+        finally:
+            if self._flusher is asyncio.current_task():
+                self._flusher = None
+
+    async def settle(self) -> None:
+        """Drop the pending update and wait out one being sent, so the final
+        result shown next can't be overwritten by a stale step. Updates after
+        this start a new phase (again waiting an interval before the first)."""
+        if self._latest is not None:
+            self._drop()
+            self._latest = None
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        sending, self._sending = self._sending, None
+        if sending is not None:
+            await asyncio.wait([sending])
+            if not sending.cancelled():
+                sending.exception()  # already logged in _flush, or not worth logging
+        self._next = time.monotonic() + self.interval
+
+
+def status_metrics() -> dict:
+    """Updates sent and coalesced away by every StatusCoalescer, and how many
+    are waiting on their interval right now."""
+    return {
+        **_TOTALS,
+        "pending": sum(coalescer._latest is not None for coalescer in _LIVE),
+    }
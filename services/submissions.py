@@ -0,0 +1,309 @@
+"""Durable store for userscript API submissions awaiting confirmation.
+
+Metadata lives in SQLite (db.models.PendingSubmission / IdempotencyKey) and
+every image is written through to a spool file, so a confirm keeps working
+across restarts and deploys. A bounded in-memory LRU keeps the hottest images
+off the disk path; anything pushed out of it is simply re-read from the spool.
+When the spool exceeds its disk budget the least-recently-used unconfirmed
+submissions are evicted entirely (the userscript re-submits on a 404).
+
+Expiry runs off the indexed expires_at column and at most once per
+SWEEP_INTERVAL, rather than scanning every submission on each request.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+from db.models import IdempotencyKey, PendingSubmission
+
+SUBMISSION_TTL = 1800           # seconds an unconfirmed submission is kept
+SWEEP_INTERVAL = 60             # seconds between expiry sweeps
+UPLOAD_SUBDIR = "incoming"      # uploads streamed in by the web side (web/uploads.py)
+UPLOAD_TTL = 3600               # seconds before an abandoned upload is removed
+
+DEFAULT_SPOOL_DIR = Path(os.getenv("SQLITE_PATH", "artbot.db")).resolve().parent / "submission_spool"
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _env_mb(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default))) * 1024 * 1024
+    except ValueError:
+        return default * 1024 * 1024
+
+
+@dataclass
+class Submission:
+    id: str
+    user_id: int
+    guild_id: int
+    platform: str
+    link: str
+    image_num: int | None
+    post_data: dict
+    image_name: str
+    image_size: int
+    hashes: dict
+    embed_fallback: bool
+    detected: dict
+    created_at: float
+    result: dict | None = None
+    analysis: dict | None = None  # ImageAnalysis.to_dict() (services/analysis.py)
+
+    @property
+    def expires_at(self) -> float:
+        return self.created_at + SUBMISSION_TTL
+
+    @classmethod
+    def from_row(cls, row: PendingSubmission) -> Submission:
+        return cls(
+            id=row.id,
+            user_id=row.user_id,
+            guild_id=row.guild_id,
+            platform=row.platform,
+            link=row.link,
+            image_num=row.image_num,
+            post_data=row.post_data,
+            image_name=row.image_name,
+            image_size=row.image_size,
+            hashes=row.hashes,
+            embed_fallback=row.embed_fallback,
+            detected=row.detected,
+            created_at=row.created_at,
+            result=row.result,
+            analysis=row.analysis,
+        )
+
+
+class SubmissionStore:
+    def __init__(
+        self,
+        spool_dir: str | Path | None = None,
+        memory_budget: int | None = None,
+        disk_budget: int | None = None,
+    ) -> None:
+        self.spool_dir = Path(spool_dir or os.getenv("SUBMISSION_SPOOL_DIR") or DEFAULT_SPOOL_DIR)
+        self.memory_budget = memory_budget if memory_budget is not None else _env_mb("SUBMISSION_MEMORY_MB", 256)
+        self.disk_budget = disk_budget if disk_budget is not None else _env_mb("SUBMISSION_DISK_MB", 2048)
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._ready = False
+        self._ready_lock = asyncio.Lock()
+        self._next_sweep = 0.0
+
+    # -- lifecycle ---------------------------------------------------------
+
+    async def _ensure_ready(self) -> None:
+        """Resume after a restart: size the spool from the DB and drop orphan files."""
+        if self._ready:
+            return
+        async with self._ready_lock:
+            if self._ready:
+                return
+            self.spool_dir.mkdir(parents=True, exist_ok=True)
+            rows = await PendingSubmission.filter(image_size__gt=0).values_list("id", "image_size")
+            live = {sid for sid, _ in rows}
+            self._disk_bytes = sum(size for _, size in rows)
+            orphans = await asyncio.to_thread(self._orphan_files, live)
+            if orphans:
+                LOGGER.info("Removed %d orphaned submission spool files", orphans)
+            self._ready = True
+
+    def _stale_uploads(self, cutoff: float) -> None:
+        """Uploads left behind by interrupted requests or a crash mid-job."""
+        for path in (self.spool_dir / UPLOAD_SUBDIR).glob("*.part"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except OSError:
+                pass
+
+    def _orphan_files(self, live: set[str]) -> int:
+        removed = 0
+        for path in self.spool_dir.glob("*.img"):
+            if path.stem not in live:
+                path.unlink(missing_ok=True)
+                removed += 1
+        return removed
+
+    async def maybe_sweep(self) -> None:
+        """Drop expired submissions and idempotency keys (rate-limited)."""
+        await self._ensure_ready()
+        now = time.time()
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + SWEEP_INTERVAL
+        expired = await (
+            PendingSubmission.filter(expires_at__lt=now).exclude(id__in=self._busy())
+            .values("id", "image_size")
+        )
+        if expired:
+            await self._drop_images([(row["id"], row["image_size"]) for row in expired])
+            await PendingSubmission.filter(id__in=[row["id"] for row in expired]).delete()
+            for row in expired:
+                self._locks.pop(row["id"], None)
+        await IdempotencyKey.filter(expires_at__lt=now).delete()
+        await asyncio.to_thread(self._stale_uploads, now - UPLOAD_TTL)
+
+    # -- image spool -------------------------------------------------------
+
+    def _path(self, sid: str) -> Path:
+        return self.spool_dir / f"{sid}.img"
+
+    def _remember(self, sid: str, image: bytes) -> None:
+        if len(image) > self.memory_budget:
+            return
+        old = self._memory.pop(sid, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[sid] = image
+        self._memory_bytes += len(image)
+        # Spill: the spool file is already written, so evicting from memory is free.
+        while self._memory_bytes > self.memory_budget:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _forget(self, sid: str) -> None:
+        image = self._memory.pop(sid, None)
+        if image is not None:
+            self._memory_bytes -= len(image)
+
+    async def _drop_images(self, entries: list[tuple[str, int]]) -> None:
+        for sid, size in entries:
+            self._forget(sid)
+            if size:
+                self._disk_bytes -= size
+        await asyncio.to_thread(
+            lambda: [self._path(sid).unlink(missing_ok=True) for sid, size in entries if size]
+        )
+
+    def _busy(self) -> list[str]:
+        """Submissions being confirmed right now; never evicted or expired under a confirm."""
+        return [sid for sid, lock in self._locks.items() if lock.locked()]
+
+    async def _make_room(self, size: int) -> None:
+        """Evict least-recently-used unconfirmed submissions until size fits the disk budget."""
+        while self._disk_bytes + size > self.disk_budget:
+            victims = await (
+                PendingSubmission.filter(image_size__gt=0, result__isnull=True)
+                .exclude(id__in=self._busy())
+                .order_by("accessed_at").limit(16).values("id", "image_size")
+            )
+            if not victims:
+                break
+            excess = self._disk_bytes + size - self.disk_budget
+            for count, row in enumerate(victims, start=1):
+                excess -= row["image_size"]
+                if excess <= 0:
+                    victims = victims[:count]
+                    break
+            LOGGER.info("Submission spool over budget, evicting %d submissions", len(victims))
+            await self._drop_images([(row["id"], row["image_size"]) for row in victims])
+            await PendingSubmission.filter(id__in=[row["id"] for row in victims]).delete()
+            for row in victims:
+                self._locks.pop(row["id"], None)
+
+    async def read_image(self, sub: Submission) -> bytes:
+        image = self._memory.get(sub.id)
+        if image is not None:
+            self._memory.move_to_end(sub.id)
+            return image
+        try:
+            image = await asyncio.to_thread(self._path(sub.id).read_bytes)
+        except FileNotFoundError:
+            raise KeyError(sub.id)
+        self._remember(sub.id, image)
+        return image
+
+    # -- submissions -------------------------------------------------------
+
+    def lock(self, sid: str) -> asyncio.Lock:
+        return self._locks.setdefault(sid, asyncio.Lock())
+
+    async def put(self, sub: Submission, image: bytes | None = None, source: Path | None = None) -> None:
+        """Store a submission with its image, given as bytes or as a file on the
+        same filesystem (a spooled upload), which is moved into the spool."""
+        await self._ensure_ready()
+        size = len(image) if image is not None else source.stat().st_size
+        await self._make_room(size)
+        if image is not None:
+            await asyncio.to_thread(self._path(sub.id).write_bytes, image)
+            self._remember(sub.id, image)
+        else:
+            await asyncio.to_thread(os.replace, source, self._path(sub.id))
+        self._disk_bytes += size
+        sub.image_size = size
+        await PendingSubmission.create(
+            id=sub.id,
+            user_id=sub.user_id,
+            guild_id=sub.guild_id,
+            platform=sub.platform,
+            link=sub.link,
+            image_num=sub.image_num,
+            post_data=sub.post_data,
+            image_name=sub.image_name,
+            image_size=sub.image_size,
+            hashes=sub.hashes,
+            embed_fallback=sub.embed_fallback,
+            detected=sub.detected,
+            result=sub.result,
+            analysis=sub.analysis,
+            created_at=sub.created_at,
+            expires_at=sub.expires_at,
+            accessed_at=time.time(),
+        )
+
+    async def get(self, sid: str) -> Submission | None:
+        await self._ensure_ready()
+        row = await PendingSubmission.get_or_none(id=sid)
+        if row is None or row.expires_at < time.time():
+            return None
+        await PendingSubmission.filter(id=sid).update(accessed_at=time.time())
+        return Submission.from_row(row)
+
+    async def complete(self, sub: Submission, result: dict) -> None:
+        """Record the posting result and drop the (large) image.
+
+        The row itself stays until it expires so a retried confirm replays the
+        result instead of posting twice.
+        """
+        sub.result = result
+        # The row's size, not sub's: sub may predate a concurrent complete/discard.
+        row = await PendingSubmission.get_or_none(id=sub.id)
+        await self._drop_images([(sub.id, row.image_size if row is not None else 0)])
+        sub.image_size = 0
+        await PendingSubmission.filter(id=sub.id).update(result=result, image_size=0)
+        await IdempotencyKey.filter(submission_id=sub.id).update(result=result)
+
+    async def discard(self, sid: str) -> None:
+        """Drop a submission. Callers hold lock(sid); it is forgotten only once the row is gone."""
+        row = await PendingSubmission.get_or_none(id=sid)
+        if row is None:
+            return
+        await self._drop_images([(sid, row.image_size)])
+        await row.delete()
+        self._locks.pop(sid, None)
+
+    # -- idempotency -------------------------------------------------------
+
+    async def get_idempotent(self, user_id: int, key: str) -> IdempotencyKey | None:
+        await self._ensure_ready()
+        entry = await IdempotencyKey.get_or_none(user_id=user_id, key=key)
+        if entry is None or entry.expires_at < time.time():
+            return None
+        return entry
+
+    async def remember_idempotent(self, user_id: int, key: str, sid: str) -> None:
+        await IdempotencyKey.update_or_create(
+            user_id=user_id, key=key,
+            defaults={"submission_id": sid, "result": None, "expires_at": time.time() + SUBMISSION_TTL},
+        )
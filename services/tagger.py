@@ -1,4 +1,9 @@
-"""GPU-first, CPU-fallback client for the cl_tagger_v2 HuggingFace spaces."""
+"""GPU-first, CPU-fallback client for the cl_tagger_v2 HuggingFace spaces.
+
+Each space has its own circuit breaker and adaptive timeout
+(utils/resilience.py): while one is known to be down, predictions go
+straight to the other instead of waiting out a timeout first.
+"""
 from __future__ import annotations
 
 import asyncio
@@ -12,7 +17,14 @@ from dataclasses import dataclass, field
 import httpx
 from gradio_client import Client as GradioClient
 
+from utils.resilience import CircuitOpen, Unavailable, upstream
+
 API_NAME = "/_run_predict"
+DEFAULT_SERIES = "cella110n/cl_tagger_v2"
+# A call that first connects to the space or loads a model (a cold start can
+# take minutes) gets the fixed budget the client always had — 120s per request,
+# for the load and the predict — instead of the adaptive timeout.
+COLD_TIMEOUT = 240.0
 
 _HEADER_RE = re.compile(
     r'>(Quality|Rating)</div>'
@@ -95,28 +107,81 @@ class TaggerClient:
 
     async def predict(self, image_input: dict, instance: str | None = None) -> TagResult:
         async with self._predict_lock:
-            loop = asyncio.get_running_loop()
             errors: list[Exception] = []
             order = [instance] if instance else self._auto_order()
             for i, inst in enumerate(order):
                 try:
-                    result = await loop.run_in_executor(
-                        None, functools.partial(self._predict_sync, inst, image_input)
-                    )
+                    result = await self._predict_on(inst, image_input)
                     result.fell_back = i > 0
                     return result
-                except QuotaExceeded as err:
-                    self._gpu_blocked_until = time.monotonic() + err.retry_after
-                    self.logger.warning(
-                        "GPU space quota exhausted (cooldown %.0f min): %s",
-                        err.retry_after / 60, err,
-                    )
-                    errors.append(err)
                 except Exception as err:  # noqa: BLE001
-                    self.logger.warning("Tagger predict failed on %s space: %s", inst, err)
                     errors.append(err)
             raise errors[-1]
 
+    async def predict_many(self, image_inputs: list[dict]) -> list[TagResult]:
+        """Tag several images in one hold of the predict lock (batch posting).
+
+        The instance order is decided once for the batch, and an instance that
+        fails is dropped for the rest of it rather than retried on every image.
+        """
+        async with self._predict_lock:
+            order = self._auto_order()
+            first = order[0]
+            errors: list[Exception] = []
+            results = []
+            for image_input in image_inputs:
+                while order:
+                    try:
+                        result = await self._predict_on(order[0], image_input)
+                    except Exception as err:  # noqa: BLE001
+                        errors.append(err)
+                        order.pop(0)
+                        continue
+                    result.fell_back = order[0] != first
+                    results.append(result)
+                    break
+                else:
+                    raise errors[-1]
+            return results
+
+    async def _predict_on(self, inst: str, image_input: dict) -> TagResult:
+        loop = asyncio.get_running_loop()
+        space = upstream(f"tagger-{inst}", default_timeout=120, min_timeout=30, max_timeout=180, retries=0)
+
+        async def attempt() -> TagResult:
+            try:
+                return await loop.run_in_executor(
+                    None, functools.partial(self._predict_sync, inst, image_input)
+                )
+            except QuotaExceeded:
+                raise  # the GPU cooldown handles quota; not an outage
+            except Exception as err:  # noqa: BLE001
+                raise Unavailable(str(err)) from err
+
+        cold = self._cold(inst)
+        try:
+            return await space.call(attempt, timeout=COLD_TIMEOUT if cold else None, sample=not cold)
+        except asyncio.TimeoutError:
+            # The worker thread may still be using the client; start afresh next time.
+            self._instances[inst].client = None
+            self.logger.warning(
+                "Tagger predict timed out on %s space after %.0fs", inst, COLD_TIMEOUT if cold else space.timeout()
+            )
+            raise
+        except CircuitOpen as err:
+            self.logger.info("Skipping %s space: %s", inst, err)
+            raise
+        except QuotaExceeded as err:
+            self._gpu_blocked_until = time.monotonic() + err.retry_after
+            self.logger.warning(
+                "GPU space quota exhausted (cooldown %.0f min): %s",
+                err.retry_after / 60, err,
+            )
+            raise
+        except Unavailable as err:
+            self.logger.warning("Tagger predict failed on %s space: %s", inst, err)
+            raise err.__cause__ from None
+
     def gpu_cooldown_remaining(self) -> float:
         return max(0.0, self._gpu_blocked_until - time.monotonic())
 
@@ -139,6 +204,21 @@ class TaggerClient:
         settings = self.config.tagger_settings
         return settings["gpu_space" if instance == "gpu" else "cpu_space"].strip()
 
+    def _wanted_model(self) -> tuple[str, str] | None:
+        settings = self.config.tagger_settings
+        version = str(settings.get("model_version", "")).strip()
+        if not version:
+            return None
+        return str(settings.get("model_series", "")).strip() or DEFAULT_SERIES, version
+
+    def _cold(self, instance: str) -> bool:
+        """Whether a predict on `instance` would first connect or load a model."""
+        inst = self._instances[instance]
+        if inst.client is None or inst.space != self._space_for(instance):
+            return True
+        wanted = self._wanted_model()
+        return wanted is not None and inst.loaded_model != wanted
+
     def _get_client(self, instance: str) -> GradioClient:
         inst = self._instances[instance]
         space = self._space_for(instance)
@@ -154,13 +234,12 @@ class TaggerClient:
         return inst.client
 
     def _ensure_model(self, instance: str, client: GradioClient) -> None:
-        settings = self.config.tagger_settings
-        version = str(settings.get("model_version", "")).strip()
-        if not version:
+        wanted = self._wanted_model()
+        if wanted is None:
             return
-        series = str(settings.get("model_series", "")).strip() or "cella110n/cl_tagger_v2"
+        series, version = wanted
         inst = self._instances[instance]
-        if inst.loaded_model == (series, version):
+        if inst.loaded_model == wanted:
             return
         self.logger.info("Loading model %s/%s on %s space ...", series, version, instance)
         result = client.predict(series=series, version=version, api_name="/_load_and_reset")
@@ -1,7 +1,7 @@
 // ==UserScript==
 // @name         Art Bot Helper
 // @namespace    https://github.com/Maren0000/Art-Bot-Helper
-// @version      1.1.0
+// @version      1.2.0
 // @description  Post art from Twitter/X and Pixiv straight into the Discord art forums via Maren's Art Bot.
 // @homepageURL  https://github.com/Maren0000/Art-Bot-Helper
 // @updateURL    https://raw.githubusercontent.com/Maren0000/Art-Bot-Helper/main/userscript/artbot-helper.user.js
@@ -30,7 +30,8 @@
     userName: '[data-testid="User-Name"]',
   };
 
-  const CLIENT_TIMEOUT_MS = 120000; // > server's 90s detection long-poll
+  const CLIENT_TIMEOUT_MS = 45000; // > server's 25s job long-poll
+  const JOB_WAIT_S = 20;            // ?wait= per job poll request
   const MAX_ATTEMPTS = 5;
   const BASE_RETRY_MS = 5000;
   const MAX_RETRY_MS = 300000;
@@ -349,6 +350,8 @@
       }));
       resp = await apiRequest('POST', '/api/submissions', { formData: fd });
     }
+    // Detection runs as a server-side job: long-poll it until it finishes.
+    if (resp.job_id) resp = await awaitJob(item, resp);
     // Idempotent replay of an already-confirmed item returns the final result.
     if (resp.thread_links) {
       item.state = 'posted';
@@ -365,6 +368,36 @@
     if (item.imageB64) { delete item.imageB64; }
   }
 
+  async function awaitJob(item, job) {
+    item.jobId = job.job_id;
+    while (job.status !== 'done' && job.status !== 'failed') {
+      if (job.step && job.step !== item.step) { item.step = job.step; render(); }
+      try {
+        job = await apiRequest('GET', '/api/jobs/' + job.job_id + '?wait=' + JOB_WAIT_S + '&version=' + job.version);
+      } catch (err) {
+        // Server restarted mid-job: retryable, the idempotency key re-queues it.
+        if (err.kind === 'http' && err.code === 'job_not_found') {
+          throw { kind: 'network', message: 'Detection job was lost — resubmitting.' };
+        }
+        throw err;
+      }
+    }
+    item.jobId = null;
+    item.step = null;
+    if (job.status === 'failed') {
+      const e = job.error || {};
+      throw {
+        kind: 'http',
+        status: e.status || 500,
+        code: e.code || 'internal_error',
+        message: e.message || 'Detection failed.',
+        missing: e.missing,
+        existing_post: e.existing_post,
+      };
+    }
+    return job.output;
+  }
+
   async function confirmItem(item) {
     item.state = 'posting';
     render();
@@ -383,7 +416,7 @@
     } catch (err) {
       item.error = err;
       if (err.kind === 'http' && err.status === 404 && err.code === 'submission_not_found') {
-        // Server restarted / submission expired: go around again. The
+        // Submission expired or was evicted server-side: go around again. The
         // idempotency key + server-side phash dedup prevent double posts.
         item.submissionId = null;
         item.state = 'pending';
@@ -582,7 +615,7 @@
   function statusLine(item) {
     switch (item.state) {
       case 'pending': return ['busy', item.nextRetryAt > Date.now() ? 'Retrying ' + new Date(item.nextRetryAt).toLocaleTimeString() + '… (attempt ' + (item.attempts + 1) + ')' : 'Queued…'];
-      case 'detecting': return ['busy', 'Detecting characters… (can take ~30s)'];
+      case 'detecting': return ['busy', item.step || 'Detecting characters… (can take ~30s)'];
       case 'awaiting_confirm': return item.error ? ['err', errText(item)] : ['busy', 'Review & post'];
       case 'posting': return ['busy', 'Posting…'];
       case 'posted': return ['ok', 'Posted!'];
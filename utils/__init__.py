@@ -1,20 +1,24 @@
-from .bluesky import bluesky_get, parse_bsky_url
+from .bluesky import bluesky_get, bluesky_get_pages, parse_bsky_url
 from .emoji import is_emoji
+from .fingerprint import compute_fingerprint
 from .hashing import compute_hashes, hamming, image_id, is_similar
-from .pixiv import pixiv_ajax_get, ugoria_merge
+from .pixiv import pixiv_ajax_get, pixiv_ajax_get_pages, ugoria_merge
 from .platform import detect_platform
 
 import imagehash as imagehash
 
 __all__ = [
     "bluesky_get",
+    "bluesky_get_pages",
     "parse_bsky_url",
     "is_emoji",
     "compute_hashes",
+    "compute_fingerprint",
     "hamming",
     "image_id",
     "is_similar",
     "pixiv_ajax_get",
+    "pixiv_ajax_get_pages",
     "ugoria_merge",
     "detect_platform",
     "imagehash",
@@ -1,8 +1,14 @@
 """Mint and verify HMAC-signed bearer tokens for the userscript API.
 
-Token format: "abt1.<b64url(payload)>.<b64url(hmac_sha256(payload))>" where
-payload is JSON {"u": user_id, "g": guild_id, "t": type, "exp": unix_ts | null,
-"jti": id (setup tokens only)}.
+Token format: "<version>.<b64url(payload)>.<b64url(hmac_sha256(payload))>".
+- abt1: payload is JSON {"u": user_id, "g": guild_id, "t": type,
+  "exp": unix_ts | null, "jti": id (setup tokens only)}.
+- abt2: payload is packed binary — type byte, u64 user id, u64 guild id,
+  i64 expiry (-1 = never), then the jti bytes — so verifying needs no JSON
+  parse. Minted when API_TOKEN_FORMAT=abt2; both versions always verify.
+
+Verified access tokens are kept in a small LRU keyed by the token text, so a
+request reusing its access token (the common case) skips decoding and HMAC.
 
 Three token types:
 - "setup"   — DM'd by /token, valid for SETUP_TOKEN_TTL seconds and single-use
@@ -24,10 +30,20 @@ import hmac
 import json
 import os
 import secrets
+import struct
 import time
+from collections import OrderedDict
 from dataclasses import dataclass
 
 _PREFIX = "abt1"
+_PREFIX_V2 = "abt2"
+MINT_FORMAT = os.getenv("API_TOKEN_FORMAT", _PREFIX)
+
+_V2_HEADER = struct.Struct("<BQQq")  # type, user id, guild id, exp (-1 = never)
+_V2_TYPES = {"setup": 1, "refresh": 2, "access": 3}
+_V2_TYPE_NAMES = {code: name for name, code in _V2_TYPES.items()}
+
+VERIFIED_CACHE_SIZE = 4096
 
 SETUP_TOKEN_TTL = 300      # 5 minutes to paste the DM'd token into the userscript
 ACCESS_TOKEN_TTL = 3600    # access tokens auto-refresh, so keep them short
@@ -46,7 +62,7 @@ class TokenExpired(InvalidToken):
     pass
 
 
-@dataclass
+@dataclass(frozen=True)
 class Claims:
     user_id: int
     guild_id: int
@@ -68,6 +84,11 @@ def _sign(payload: bytes) -> str:
 
 
 def _mint(user_id: int, guild_id: int, token_type: str, exp: int | None, jti: str | None = None) -> str:
+    if MINT_FORMAT == _PREFIX_V2:
+        payload = _V2_HEADER.pack(
+            _V2_TYPES[token_type], user_id, guild_id, -1 if exp is None else exp
+        ) + (jti or "").encode()
+        return f"{_PREFIX_V2}.{_b64encode(payload)}.{_sign(payload)}"
     claims: dict = {"u": user_id, "g": guild_id, "t": token_type, "exp": exp}
     if jti is not None:
         claims["jti"] = jti
@@ -88,12 +109,69 @@ def mint_access_token(user_id: int, guild_id: int) -> str:
     return _mint(user_id, guild_id, "access", int(time.time()) + ACCESS_TOKEN_TTL)
 
 
+def _parse_v1(payload: bytes) -> Claims:
+    try:
+        claims = json.loads(payload)
+        return Claims(
+            user_id=int(claims["u"]),
+            guild_id=int(claims["g"]),
+            token_type=str(claims["t"]),
+            expires_at=claims["exp"],
+            jti=claims.get("jti"),
+        )
+    except (ValueError, KeyError, TypeError, json.JSONDecodeError):
+        raise InvalidToken("Malformed payload")
+
+
+def _parse_v2(payload: bytes) -> Claims:
+    try:
+        type_code, user_id, guild_id, exp = _V2_HEADER.unpack_from(payload)
+        jti = payload[_V2_HEADER.size:].decode()
+    except (struct.error, UnicodeDecodeError):
+        raise InvalidToken("Malformed payload")
+    if type_code not in _V2_TYPE_NAMES:
+        raise InvalidToken("Malformed payload")
+    return Claims(
+        user_id=user_id,
+        guild_id=guild_id,
+        token_type=_V2_TYPE_NAMES[type_code],
+        expires_at=None if exp < 0 else exp,
+        jti=jti or None,
+    )
+
+
+_PARSERS = {_PREFIX: _parse_v1, _PREFIX_V2: _parse_v2}
+
+# token text -> claims, for access tokens that already passed verification.
+# The whole token is the key, so a signature is only ever reused with the
+# payload it was computed over.
+_verified: OrderedDict[str, Claims] = OrderedDict()
+
+
+def _check(claims: Claims, expected_type: str) -> Claims:
+    if claims.token_type != expected_type:
+        raise InvalidToken(f"Wrong token type (expected a {expected_type} token)")
+    if claims.expires_at is not None and time.time() > claims.expires_at:
+        raise TokenExpired("Token expired")
+    return claims
+
+
 def verify_token(token: str, expected_type: str) -> Claims:
+    token = token.strip()
+    cached = _verified.get(token)
+    if cached is not None:
+        if cached.expires_at is not None and time.time() > cached.expires_at:
+            _verified.pop(token, None)
+        else:
+            _verified.move_to_end(token)
+        return _check(cached, expected_type)
+
     try:
-        prefix, payload_b64, sig = token.strip().split(".")
+        prefix, payload_b64, sig = token.split(".")
     except ValueError:
         raise InvalidToken("Malformed token")
-    if prefix != _PREFIX:
+    parse = _PARSERS.get(prefix)
+    if parse is None:
         raise InvalidToken("Unknown token version")
 
     try:
@@ -103,22 +181,29 @@ def verify_token(token: str, expected_type: str) -> Claims:
     if not hmac.compare_digest(sig, _sign(payload)):
         raise InvalidToken("Bad signature")
 
-    try:
-        claims = json.loads(payload)
-        user_id, guild_id, exp = int(claims["u"]), int(claims["g"]), claims["exp"]
-        token_type = str(claims["t"])
-    except (ValueError, KeyError, TypeError, json.JSONDecodeError):
-        raise InvalidToken("Malformed payload")
-
-    if token_type != expected_type:
-        raise InvalidToken(f"Wrong token type (expected a {expected_type} token)")
-    if exp is not None and time.time() > exp:
-        raise TokenExpired("Token expired")
-
-    return Claims(
-        user_id=user_id,
-        guild_id=guild_id,
-        token_type=token_type,
-        expires_at=exp,
-        jti=claims.get("jti"),
-    )
+    claims = _check(parse(payload), expected_type)
+    if claims.token_type == "access":
+        _verified[token] = claims
+        if len(_verified) > VERIFIED_CACHE_SIZE:
+            _verified.popitem(last=False)
+    return claims
+
+
+def _benchmark(rounds: int = 20000) -> None:
+    """python -m utils.api_token — verification throughput per format."""
+    global MINT_FORMAT
+    for fmt in (_PREFIX, _PREFIX_V2):
+        MINT_FORMAT = fmt
+        token = mint_access_token(123456789012345678, 876543210987654321)
+        for label, clear in (("cold", True), ("cached", False)):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                if clear:
+                    _verified.clear()
+                verify_token(token, "access")
+            elapsed = time.perf_counter() - start
+            print(f"{fmt} {label:>6}: {rounds / elapsed:>10,.0f} verifications/s ({elapsed / rounds * 1e6:.2f} us each)")
+
+
+if __name__ == "__main__":
+    _benchmark()
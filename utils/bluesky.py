@@ -1,7 +1,33 @@
+import asyncio
 import io
 import re
 
+from atproto.exceptions import InvokeTimeoutError, NetworkError, RateLimitExceededError, RequestException
+
 import exception
+from utils.resilience import FAILURES, CircuitOpen, Unavailable, fetch, upstream
+
+BLUESKY = upstream("bluesky", default_timeout=10, min_timeout=3, max_timeout=30)
+BLUESKY_IMAGES = upstream("bluesky-images", default_timeout=30, min_timeout=15, max_timeout=90, retries=1)
+
+
+async def _xrpc(call):
+    """Run an atproto call through the Bluesky circuit breaker."""
+    async def attempt():
+        try:
+            return await call()
+        except (NetworkError, InvokeTimeoutError, RateLimitExceededError) as err:
+            raise Unavailable(str(err)) from err
+        except RequestException as err:
+            if err.response is not None and err.response.status_code >= 500:
+                raise Unavailable(str(err)) from err
+            raise
+    try:
+        return await BLUESKY.call(attempt)
+    except CircuitOpen as err:
+        raise exception.RequestFailed(str(err)) from err
+    except FAILURES as err:
+        raise exception.RequestFailed(f"Bluesky request failed: {err}") from err
 
 
 def parse_bsky_url(link: str) -> tuple[str, str]:
@@ -35,6 +61,42 @@ async def bluesky_get(
     Returns:
         tuple: (post_data, image_bytes, image_filename)
     """
+    post_data, images = await bluesky_get_pages(bot, link, [image_num or 1], on_status=on_status)
+    image, image_name = images[0]
+    return post_data, image, image_name
+
+
+async def _bluesky_download(bot, image_url: str) -> bytes:
+    try:
+        status, body = await fetch(bot.client, BLUESKY_IMAGES, image_url)
+    except CircuitOpen as err:
+        raise exception.RequestFailed(str(err)) from err
+    except FAILURES as err:
+        raise exception.RequestFailed(f"Failed to download Bluesky image: {err!r}") from err
+    if status != 200:
+        raise exception.RequestFailed("Failed to download Bluesky image")
+    return body
+
+
+async def bluesky_get_pages(
+    bot,
+    link: str,
+    pages: list[int] | None,
+    on_status=None,
+) -> tuple[dict, list[tuple[io.BytesIO, str]]]:
+    """
+    Fetch several images from one Bluesky post: metadata once, images concurrently.
+
+    Args:
+        bot: The ArtBot instance with client and bsky_client attributes
+        link: Bluesky post URL
+        pages: 1-indexed image numbers, or None for every image
+        on_status: optional async callable(text) for progress updates
+
+    Returns:
+        tuple: (post_data, [(image_bytes, image_filename), ...]) in `pages` order.
+        post_data["title"] is the alt text of the first requested image.
+    """
     async def _status(text):
         if on_status:
             await on_status(text)
@@ -50,12 +112,12 @@ async def bluesky_get(
         did = handle
     else:
         await _status("🪪 Resolving Bluesky handle...")
-        resolved = await bot.bsky_client.resolve_handle(handle)
+        resolved = await _xrpc(lambda: bot.bsky_client.resolve_handle(handle))
         did = resolved.did
 
     await _status("📥 Fetching Bluesky post metadata...")
     uri = f"at://{did}/app.bsky.feed.post/{rkey}"
-    response = await bot.bsky_client.get_posts([uri])
+    response = await _xrpc(lambda: bot.bsky_client.get_posts([uri]))
 
     if not response.posts:
         raise exception.RequestFailed("Bluesky post not found")
@@ -78,38 +140,40 @@ async def bluesky_get(
     if not images:
         raise exception.RequestFailed("No images found in Bluesky post")
 
-    idx = (image_num or 1) - 1
-    if idx < 0 or idx >= len(images):
-        raise exception.RequestFailed(f"Image {image_num} not found. Post has {len(images)} images.")
-
-    image_data = images[idx]
-    image_url = image_data.fullsize or image_data.thumb
-    image_alt = image_data.alt or ""
-
-    if not image_url:
-        raise exception.RequestFailed("Could not get image URL from Bluesky post")
-
-    await _status("🖼️ Downloading image from Bluesky...")
-    img_resp = await bot.client.get(image_url)
-    if img_resp.status != 200:
-        raise exception.RequestFailed("Failed to download Bluesky image")
-
-    image_bytes = await img_resp.read()
-
-    ext = "jpg"
-    if "png" in image_url.lower():
-        ext = "png"
-    elif "webp" in image_url.lower():
-        ext = "webp"
-
-    image_name = f"bsky_{rkey}_{idx + 1}.{ext}"
+    if pages is None:
+        pages = list(range(1, len(images) + 1))
+    for page in pages:
+        if page < 1 or page > len(images):
+            raise exception.RequestFailed(f"Image {page} not found. Post has {len(images)} images.")
+
+    image_urls = []
+    for page in pages:
+        image_url = images[page - 1].fullsize or images[page - 1].thumb
+        if not image_url:
+            raise exception.RequestFailed("Could not get image URL from Bluesky post")
+        image_urls.append(image_url)
+
+    if len(pages) == 1:
+        await _status("🖼️ Downloading image from Bluesky...")
+    else:
+        await _status(f"🖼️ Downloading {len(pages)} images from Bluesky...")
+    downloads = await asyncio.gather(*(_bluesky_download(bot, image_url) for image_url in image_urls))
+
+    fetched = []
+    for page, image_url, image_bytes in zip(pages, image_urls, downloads):
+        ext = "jpg"
+        if "png" in image_url.lower():
+            ext = "png"
+        elif "webp" in image_url.lower():
+            ext = "webp"
+        fetched.append((io.BytesIO(image_bytes), f"bsky_{rkey}_{page}.{ext}"))
 
     post_data = {
-        "title": image_alt or "Bluesky Post",
+        "title": images[pages[0] - 1].alt or "Bluesky Post",
         "url": link,
         "author_handle": author_handle,
         "author_display": author_display,
         "author_url": f"https://bsky.app/profile/{author_handle}",
     }
 
-    return post_data, io.BytesIO(image_bytes), image_name
+    return post_data, fetched
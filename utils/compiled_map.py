@@ -0,0 +1,195 @@
+"""Compiled, memory-mapped form of the str -> str config maps (char_map etc.).
+
+<name>.json stays the source of truth; <name>.abmap next to it is a binary
+snapshot that is opened with mmap instead of parsed:
+
+    header        magic, version, key count, value count, source sha256
+    key_offsets   (keys + 1) x u32   into the key blob, keys sorted by UTF-8 bytes
+    value_ids     keys x u32         index into the value table
+    value_offsets (values + 1) x u32 into the value blob (values deduplicated)
+    key blob, value blob
+
+Lookups binary-search the key table directly in the mapping, so loading costs
+hashing the JSON (no parse) and an mmap, and every process that opens the same
+snapshot shares its pages through the OS page cache.
+
+A snapshot records the sha256 of the JSON it was built from; load() rebuilds
+it when the JSON's content differs (hand edits, restored files — size and
+mtime alone can't tell), so writers only need to call build() to front-load
+the work.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+from array import array
+from collections.abc import ItemsView, Iterator, Mapping, ValuesView
+from pathlib import Path
+
+MAGIC = b"ABMAP\x00"
+VERSION = 2
+SUFFIX = ".abmap"
+HEADER = struct.Struct("<6sHII32s")  # magic, version, n_keys, n_values, source sha256
+
+assert array("I").itemsize == 4
+
+
+def snapshot_path(source: Path) -> Path:
+    return source.with_suffix(SUFFIX)
+
+
+class _Items(ItemsView):
+    def __iter__(self):
+        return self._mapping._iter_items()
+
+
+class _Values(ValuesView):
+    def __iter__(self):
+        return (value for _, value in self._mapping._iter_items())
+
+
+class StringMap(Mapping):
+    """Read-only str -> str mapping over a compiled snapshot buffer."""
+
+    def __init__(self, buf, n_keys: int, n_values: int) -> None:
+        self._buf = buf
+        view = memoryview(buf)
+        pos = HEADER.size
+        self._key_offsets = view[pos:pos + 4 * (n_keys + 1)].cast("I")
+        pos += 4 * (n_keys + 1)
+        self._value_ids = view[pos:pos + 4 * n_keys].cast("I")
+        pos += 4 * n_keys
+        self._value_offsets = view[pos:pos + 4 * (n_values + 1)].cast("I")
+        pos += 4 * (n_values + 1)
+        self._keys = view[pos:pos + self._key_offsets[n_keys]]
+        pos += self._key_offsets[n_keys]
+        self._values = view[pos:pos + self._value_offsets[n_values]]
+        self._len = n_keys
+
+    def _key(self, i: int) -> bytes:
+        return bytes(self._keys[self._key_offsets[i]:self._key_offsets[i + 1]])
+
+    def _value(self, i: int) -> str:
+        vid = self._value_ids[i]
+        return bytes(self._values[self._value_offsets[vid]:self._value_offsets[vid + 1]]).decode()
+
+    def _find(self, key) -> int:
+        if not isinstance(key, str):
+            return -1
+        target = key.encode()
+        lo, hi = 0, self._len
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < self._len and self._key(lo) == target else -1
+
+    def __getitem__(self, key: str) -> str:
+        i = self._find(key)
+        if i < 0:
+            raise KeyError(key)
+        return self._value(i)
+
+    def __contains__(self, key) -> bool:
+        return self._find(key) >= 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator[str]:
+        return (key for key, _ in self._iter_items())
+
+    def _iter_items(self) -> Iterator[tuple[str, str]]:
+        # Full scans (tags_text_pass) copy the tables out once instead of
+        # slicing the mmap per entry.
+        keys = bytes(self._keys)
+        key_offsets = self._key_offsets.tolist()
+        blob = bytes(self._values)
+        value_offsets = self._value_offsets.tolist()
+        values = [blob[value_offsets[j]:value_offsets[j + 1]].decode() for j in range(len(value_offsets) - 1)]
+        for i, vid in enumerate(self._value_ids.tolist()):
+            yield keys[key_offsets[i]:key_offsets[i + 1]].decode(), values[vid]
+
+    def items(self) -> ItemsView:
+        return _Items(self)
+
+    def values(self) -> ValuesView:
+        return _Values(self)
+
+
+def _pack(data: dict[str, str], digest: bytes) -> bytes:
+    encoded = sorted((k.encode(), v) for k, v in data.items())
+    values = sorted(set(data.values()))
+    value_index = {v: i for i, v in enumerate(values)}
+
+    key_offsets = array("I", [0])
+    for key, _ in encoded:
+        key_offsets.append(key_offsets[-1] + len(key))
+    value_ids = array("I", (value_index[v] for _, v in encoded))
+    value_bytes = [v.encode() for v in values]
+    value_offsets = array("I", [0])
+    for value in value_bytes:
+        value_offsets.append(value_offsets[-1] + len(value))
+
+    return b"".join([
+        HEADER.pack(MAGIC, VERSION, len(encoded), len(values), digest),
+        key_offsets.tobytes(),
+        value_ids.tobytes(),
+        value_offsets.tobytes(),
+        b"".join(key for key, _ in encoded),
+        b"".join(value_bytes),
+    ])
+
+
+def build(source: Path) -> bool:
+    """Compile source into its snapshot. Returns False (and removes any old
+    snapshot) if the JSON is missing or isn't a flat str -> str object."""
+    target = snapshot_path(source)
+    try:
+        raw = source.read_bytes()
+        data = json.loads(raw.decode("utf-8"))
+    except (OSError, ValueError):
+        data = None
+    if not isinstance(data, dict) or not all(isinstance(v, str) for v in data.values()):
+        target.unlink(missing_ok=True)
+        return False
+    tmp = target.with_suffix(f"{SUFFIX}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(_pack(data, hashlib.sha256(raw).digest()))
+    tmp.replace(target)
+    return True
+
+
+def _open(target: Path, digest: bytes) -> StringMap | None:
+    try:
+        with open(target, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if len(buf) < HEADER.size:
+        buf.close()
+        return None
+    magic, version, n_keys, n_values, src_digest = HEADER.unpack_from(buf)
+    if magic != MAGIC or version != VERSION or src_digest != digest:
+        buf.close()
+        return None
+    return StringMap(buf, n_keys, n_values)
+
+
+def load(source: Path) -> StringMap | None:
+    """Open source's snapshot, compiling it first if missing or stale.
+    None if the source can't be compiled (caller falls back to JSON)."""
+    try:
+        digest = hashlib.sha256(source.read_bytes()).digest()
+    except OSError:
+        return None
+    target = snapshot_path(source)
+    compiled = _open(target, digest)
+    if compiled is None and build(source):
+        compiled = _open(target, hashlib.sha256(source.read_bytes()).digest())
+    return compiled
@@ -0,0 +1,310 @@
+"""Async Danbooru listing crawler used by the character map refresh.
+
+Several listings (tags, aliases, wiki pages) are crawled concurrently on one
+aiohttp session. Each listing is fetched in windows of PAGE_WINDOW numbered
+pages at a time; all requests share a token bucket that halves its rate on a
+429 and creeps back up on success, and transient failures are retried with
+jittered exponential backoff. Requests also go through the shared Danbooru
+circuit breaker (utils/resilience.py) for adaptive timeouts and, when the site
+is down, waiting for its probe instead of retrying into it.
+
+Listings are streamed page by page to a consumer, so a caller that only keeps
+a few fields never holds a whole listing in memory. With a checkpoint
+directory every finished page is written to disk, so a crawl that dies on page
+300 resumes from there on the next run instead of page 1; the directory is
+removed when the crawler exits cleanly.
+
+DANBOORU_URL points the crawler somewhere else (e.g. a local mock server).
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import AsyncIterator, Callable
+
+import aiohttp
+
+from utils.resilience import CircuitOpen, Unavailable, upstream
+
+LOGGER = logging.getLogger(__name__)
+
+DANBOORU_URL = os.getenv("DANBOORU_URL", "https://danbooru.donmai.us").rstrip("/")
+USER_AGENT = "Art-Bot-Helper/1.0"
+
+PAGE_LIMIT = 1000
+PAGE_WINDOW = int(os.getenv("DANBOORU_PAGE_WINDOW", "4"))   # pages in flight per listing
+REQUEST_RATE = float(os.getenv("DANBOORU_RATE", "5"))       # requests/second across all listings
+MIN_RATE = 0.5
+REQUEST_TIMEOUT = 30
+MAX_RETRIES = 6
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+CHECKPOINT_TTL = 24 * 3600  # older partial crawls are thrown away
+
+# Adaptive per-request timeout, capped by the session's REQUEST_TIMEOUT.
+DANBOORU = upstream("danbooru", default_timeout=REQUEST_TIMEOUT, min_timeout=10, max_timeout=REQUEST_TIMEOUT, retries=0)
+
+
+class DanbooruError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class Listing:
+    name: str                       # key for results and checkpoint files
+    path: str                       # e.g. "tags.json"
+    params: dict = field(default_factory=dict)
+
+    @property
+    def fingerprint(self) -> str:
+        return json.dumps([self.path, self.params], sort_keys=True)
+
+
+PageConsumer = Callable[[list[dict]], None]
+
+
+class TokenBucket:
+    """Shared request limiter. A 429 halves the refill rate and pauses every
+    caller for Retry-After; each success adds back a little of the rate."""
+
+    def __init__(self, rate: float, burst: float | None = None) -> None:
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def throttle(self, retry_after: float) -> None:
+        now = time.monotonic()
+        self._refill(now)
+        self.rate = max(MIN_RATE, self.rate / 2)
+        self.tokens = 0
+        self.blocked_until = max(self.blocked_until, now + retry_after)
+        LOGGER.warning(f"Danbooru rate limited; backing off {retry_after:.1f}s at {self.rate:.2f} req/s")
+
+    def recover(self) -> None:
+        if self.rate < self.max_rate:
+            self._refill(time.monotonic())
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+class CrawlCheckpoint:
+    """Finished pages on disk: <root>/<listing>/<page>.json plus state.json
+    recording each listing's query and, once known, its last page."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self.state_file = root / "state.json"
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            self.state = {}
+
+    def _dir(self, name: str) -> Path:
+        return self.root / name
+
+    def _save_state(self) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_file.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+        tmp.replace(self.state_file)
+
+    def prepare(self, listing: Listing) -> None:
+        """Keep earlier pages only if they belong to the same, recent query."""
+        entry = self.state.get(listing.name)
+        fresh = (
+            entry is not None
+            and entry.get("fingerprint") == listing.fingerprint
+            and time.time() - entry.get("started_at", 0) < CHECKPOINT_TTL
+        )
+        if fresh:
+            return
+        shutil.rmtree(self._dir(listing.name), ignore_errors=True)
+        self.state[listing.name] = {
+            "fingerprint": listing.fingerprint,
+            "started_at": time.time(),
+            "last_page": None,
+        }
+        self._save_state()
+
+    def load_page(self, name: str, page: int) -> list[dict] | None:
+        try:
+            with open(self._dir(name) / f"{page}.json", "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def save_page(self, name: str, page: int, records: list[dict]) -> None:
+        directory = self._dir(name)
+        directory.mkdir(parents=True, exist_ok=True)
+        tmp = directory / f"{page}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(records, f, ensure_ascii=False, separators=(",", ":"))
+        tmp.replace(directory / f"{page}.json")
+
+    def last_page(self, name: str) -> int | None:
+        return self.state.get(name, {}).get("last_page")
+
+    def finish(self, name: str, last_page: int) -> None:
+        self.state[name]["last_page"] = last_page
+        self._save_state()
+
+    def clear(self) -> None:
+        shutil.rmtree(self.root, ignore_errors=True)
+        self.state = {}
+
+
+class DanbooruCrawler:
+    def __init__(
+        self,
+        base_url: str | None = None,
+        rate: float | None = None,
+        window: int | None = None,
+        checkpoint_dir: Path | None = None,
+    ) -> None:
+        self.base_url = (base_url or DANBOORU_URL).rstrip("/")
+        self.bucket = TokenBucket(rate or REQUEST_RATE)
+        self.window = max(1, window or PAGE_WINDOW)
+        self.checkpoint = CrawlCheckpoint(checkpoint_dir) if checkpoint_dir else None
+        self.session: aiohttp.ClientSession | None = None
+
+    async def __aenter__(self) -> "DanbooruCrawler":
+        self.session = aiohttp.ClientSession(
+            headers={"User-Agent": USER_AGENT},
+            timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.session.close()
+        self.session = None
+        if self.checkpoint and exc_type is None:
+            self.checkpoint.clear()  # everything was consumed; nothing to resume
+
+    async def _attempt(self, url: str, path: str, params: dict) -> tuple[str | None, list[dict] | None]:
+        """One request: (Retry-After, None) on a 429, else (None, records)."""
+        async with self.session.get(url, params=params) as resp:
+            if resp.status == 429:
+                return resp.headers.get("Retry-After", ""), None
+            if resp.status >= 500:
+                raise Unavailable(f"HTTP {resp.status} for {path}")
+            if resp.status >= 400:
+                raise DanbooruError(f"HTTP {resp.status} for {path} {params}: {await resp.text()}")
+            return None, await resp.json(content_type=None)
+
+    async def get(self, path: str, params: dict) -> list[dict]:
+        """One listing request with rate limiting, retries and the Danbooru circuit breaker."""
+        url = f"{self.base_url}/{path}"
+        for attempt in range(MAX_RETRIES + 1):
+            await self.bucket.acquire()
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+            try:
+                retry_after, data = await DANBOORU.call(lambda: self._attempt(url, path, params), retries=0)
+            except CircuitOpen as e:
+                # Known to be down: wait for the breaker's probe rather than hammering it.
+                error = str(e)
+                delay = max(delay, e.retry_in)
+            except (Unavailable, aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError) as e:
+                error = f"{type(e).__name__} for {path}: {e}"
+            else:
+                if retry_after is None:
+                    self.bucket.recover()
+                    return data
+                self.bucket.throttle(float(retry_after) if retry_after.isdigit() else delay)
+                error = f"HTTP 429 for {path}"
+            if attempt < MAX_RETRIES:
+                LOGGER.info(f"Danbooru request failed ({error}); retry {attempt + 1} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+        raise DanbooruError(f"Giving up after {MAX_RETRIES + 1} attempts: {error}")
+
+    async def _page(self, listing: Listing, page: int) -> list[dict]:
+        if self.checkpoint:
+            records = self.checkpoint.load_page(listing.name, page)
+            if records is not None:
+                return records
+        records = await self.get(listing.path, {**listing.params, "limit": PAGE_LIMIT, "page": page})
+        if self.checkpoint:
+            self.checkpoint.save_page(listing.name, page, records)
+        return records
+
+    async def stream(self, listing: Listing) -> AsyncIterator[list[dict]]:
+        """Yield a listing page by page, in order, fetching PAGE_WINDOW pages at a time.
+
+        Only the current window is held in memory. Numbered pages shift while
+        records are created mid-crawl, so repeats (by id) are dropped.
+        """
+        if self.checkpoint:
+            self.checkpoint.prepare(listing)
+        last = self.checkpoint.last_page(listing.name) if self.checkpoint else None
+        seen: set[int] = set()
+        total = 0
+        start, width = 1, 1  # page 1 alone first: most incremental queries fit in it
+        while last is None or start <= last:
+            stop = start + width if last is None else min(start + width, last + 1)
+            numbers = range(start, stop)
+            results = await asyncio.gather(*(self._page(listing, n) for n in numbers))
+            for n, records in zip(numbers, results):
+                fresh = [r for r in records if r.get("id") not in seen]
+                seen.update(r.get("id") for r in fresh)
+                total += len(fresh)
+                yield fresh
+                if len(records) < PAGE_LIMIT:
+                    last = n
+                    break
+            start, width = stop, self.window
+        if self.checkpoint:
+            self.checkpoint.finish(listing.name, last)
+        LOGGER.info(f"Fetched {total} {listing.name} records over {last} pages")
+
+    async def consume(self, listing: Listing, consumer: PageConsumer) -> None:
+        async for records in self.stream(listing):
+            consumer(records)
+
+    async def consume_all(self, consumers: list[tuple[Listing, PageConsumer]]) -> None:
+        """Stream several listings concurrently, handing each page to its consumer."""
+        try:
+            async with asyncio.TaskGroup() as group:
+                for listing, consumer in consumers:
+                    group.create_task(self.consume(listing, consumer))
+        except ExceptionGroup as errors:
+            # One failed listing cancels the rest; surface its error as-is.
+            raise errors.exceptions[0] from None
+
+    async def crawl_all(self, listings: list[Listing]) -> dict[str, list[dict]]:
+        """Crawl several listings concurrently into memory."""
+        results: dict[str, list[dict]] = {listing.name: [] for listing in listings}
+        await self.consume_all([(listing, results[listing.name].extend) for listing in listings])
+        return results
+
+
+async def crawl_listings(listings: list[Listing], checkpoint_dir: Path | None = None) -> dict[str, list[dict]]:
+    async with DanbooruCrawler(checkpoint_dir=checkpoint_dir) as crawler:
+        return await crawler.crawl_all(listings)
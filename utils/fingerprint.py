@@ -0,0 +1,204 @@
+"""Perceptual fingerprints for duplicate detection.
+
+A plain phash/dhash pair misses mirrored, cropped, letterboxed or recolored
+reposts. A fingerprint adds a few compact descriptors, all taken from one decode
+and one downscale of the image:
+
+  phash, dhash   the original pair, on the whole image
+  phash_flip     phash of the mirrored image
+  phash_crop     phash of the central CROP_FRACTION of the image
+  phash_trim     phash with uniform borders (letterboxing, pillarboxing) cut off
+  whash          wavelet hash, less sensitive to recoloring and compression
+  colorhash      hue/saturation histogram hash (42 bits)
+
+Each descriptor is a 64-bit int, kept as 16 hex chars like the old hashes.
+match() compares a query against many stored fingerprints at once with numpy;
+each descriptor has its own threshold (FINGERPRINT_THRESHOLDS).
+"""
+from __future__ import annotations
+
+import io
+import os
+
+import imagehash
+import numpy as np
+from PIL import Image, ImageChops, ImageOps
+
+DESCRIPTORS = ("phash", "dhash", "phash_flip", "phash_crop", "phash_trim", "whash", "colorhash")
+EXTRA_DESCRIPTORS = DESCRIPTORS[2:]  # stored in image_fingerprints, next to images.phash/dhash
+PHASH, DHASH, WHASH, COLORHASH = 0, 1, 5, 6
+PHASH_FAMILY = (0, 2, 3, 4)  # phash of the image and of each variant
+
+WORK_SIZE = 256        # every descriptor is computed from this downscale
+CROP_FRACTION = 0.8
+TRIM_TOLERANCE = 16    # grey levels a border pixel may differ from the corner
+MIN_TRIMMED = 0.5      # ignore trims that would leave less than this of a side
+MATCH_CHUNK = 65536    # rows compared per numpy pass
+
+# Bits of difference allowed per descriptor. "phash" and "dhash" must both hold
+# (the original rule); "variant" is for a mirrored/cropped/trimmed phash pair;
+# "whash" and "colorhash" must both hold, and the phash must be within the
+# looser "whash_phash". colorhash is the same for every grayscale image, so
+# without that gate unrelated monochrome drawings matched on whash alone.
+DEFAULT_THRESHOLDS = {"phash": 8, "dhash": 10, "variant": 6, "whash": 6, "colorhash": 3, "whash_phash": 16}
+
+
+def load_thresholds() -> dict[str, int]:
+    """DEFAULT_THRESHOLDS overridden by FINGERPRINT_THRESHOLDS, e.g. "variant=4,whash=5"."""
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    for item in os.getenv("FINGERPRINT_THRESHOLDS", "").split(","):
+        name, _, value = item.partition("=")
+        if name.strip() in thresholds and value.strip().isdigit():
+            thresholds[name.strip()] = int(value)
+    return thresholds
+
+
+THRESHOLDS = load_thresholds()
+
+
+def parse_hash(value: str) -> int:
+    """A 16 hex char hash as an int."""
+    if len(value) != 16:
+        raise ValueError(f"Not a 64-bit hash: {value!r}")
+    return int(value, 16)
+
+
+def _as_int(value: imagehash.ImageHash) -> int:
+    bits = value.hash.flatten()
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+
+def _center_crop(image: Image.Image) -> Image.Image:
+    width, height = image.size
+    dx = int(width * (1 - CROP_FRACTION) / 2)
+    dy = int(height * (1 - CROP_FRACTION) / 2)
+    return image.crop((dx, dy, width - dx, height - dy))
+
+
+def _trim_borders(image: Image.Image) -> Image.Image:
+    background = Image.new("L", image.size, image.getpixel((0, 0)))
+    diff = ImageChops.difference(image, background).point(lambda p: 255 if p > TRIM_TOLERANCE else 0)
+    box = diff.getbbox()
+    if box is None:
+        return image
+    left, top, right, bottom = box
+    if right - left < image.width * MIN_TRIMMED or bottom - top < image.height * MIN_TRIMMED:
+        return image
+    return image.crop(box)
+
+
+def fingerprint_image(image: Image.Image) -> dict[str, str]:
+    """Fingerprint of an already decoded image, as {descriptor: 16 hex chars}."""
+    rgb = image.convert("RGB")
+    rgb.thumbnail((WORK_SIZE, WORK_SIZE), Image.LANCZOS)
+    gray = rgb.convert("L")
+    values = {
+        "phash": imagehash.phash(gray),
+        "dhash": imagehash.dhash(gray),
+        "phash_flip": imagehash.phash(ImageOps.mirror(gray)),
+        "phash_crop": imagehash.phash(_center_crop(gray)),
+        "phash_trim": imagehash.phash(_trim_borders(gray)),
+        "whash": imagehash.whash(gray, image_scale=64),
+        "colorhash": imagehash.colorhash(rgb, binbits=3),
+    }
+    return {name: f"{_as_int(value):016x}" for name, value in values.items()}
+
+
+def compute_fingerprint(img: io.BytesIO) -> dict[str, str]:
+    image = Image.open(img)
+    image.draft("RGB", (WORK_SIZE, WORK_SIZE))  # JPEG: decode straight at a reduced scale
+    return fingerprint_image(image)
+
+
+def to_vector(hashes: dict) -> tuple[np.ndarray, bool]:
+    """(uint64 descriptor vector, whether it's complete) from a hashes dict.
+
+    Hashes from before fingerprints only have phash/dhash: the phash stands in
+    for the variants, and whash/colorhash are marked missing.
+    """
+    phash, dhash = parse_hash(hashes["phash"]), parse_hash(hashes["dhash"])
+    if all(hashes.get(name) for name in EXTRA_DESCRIPTORS):
+        return np.array([parse_hash(hashes[name]) for name in DESCRIPTORS], dtype=np.uint64), True
+    values = [phash] * len(DESCRIPTORS)
+    values[DHASH] = dhash
+    values[WHASH] = values[COLORHASH] = 0
+    return np.array(values, dtype=np.uint64), False
+
+
+def _distance(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return np.bitwise_count(a ^ b)
+
+
+def match(
+    stored: np.ndarray,
+    full: np.ndarray,
+    query: np.ndarray,
+    query_full: bool,
+    thresholds: dict[str, int] = THRESHOLDS,
+) -> np.ndarray:
+    """Bool mask over `stored` (N x len(DESCRIPTORS)) of rows matching `query`."""
+    result = np.zeros(len(stored), dtype=bool)
+    family = list(PHASH_FAMILY)
+    query_family = query[family]
+    for start in range(0, len(stored), MATCH_CHUNK):
+        rows = stored[start:start + MATCH_CHUNK]
+        hit = (_distance(rows[:, PHASH], query[PHASH]) <= thresholds["phash"]) & (
+            _distance(rows[:, DHASH], query[DHASH]) <= thresholds["dhash"]
+        )
+        # Every (stored variant, query variant) phash pair except original vs original.
+        cross = _distance(rows[:, family][:, :, None], query_family[None, None, :])
+        cross[:, 0, 0] = 64
+        cross[~full[start:start + MATCH_CHUNK], 1:, :] = 64  # no stored variants, only its phash
+        hit |= cross.min(axis=(1, 2)) <= thresholds["variant"]
+        if query_full:
+            hit |= (
+                full[start:start + MATCH_CHUNK]
+                & (_distance(rows[:, WHASH], query[WHASH]) <= thresholds["whash"])
+                & (_distance(rows[:, COLORHASH], query[COLORHASH]) <= thresholds["colorhash"])
+                & (_distance(rows[:, PHASH], query[PHASH]) <= thresholds["whash_phash"])
+            )
+        result[start:start + MATCH_CHUNK] = hit
+    return result
+
+
+def _check_monochrome(count: int = 80) -> None:
+    """python -m utils.fingerprint — unrelated black-and-white drawings must not match.
+
+    Every grayscale image has the same colorhash, so this guards the
+    whash/colorhash rule against flagging unrelated monochrome art.
+    """
+    import random
+
+    from PIL import ImageDraw
+
+    vectors = []
+    for seed in range(count):
+        rng = random.Random(seed)
+        image = Image.new("L", (600, 800), 255)
+        draw = ImageDraw.Draw(image)
+        for _ in range(rng.randint(3, 12)):
+            x0, x1 = sorted(rng.sample(range(600), 2))
+            y0, y1 = sorted(rng.sample(range(800), 2))
+            shape = draw.rectangle if rng.random() < 0.5 else draw.ellipse
+            shape((x0, y0, x1, y1), outline=0, fill=rng.choice([0, None, None]), width=rng.randint(1, 5))
+        for _ in range(rng.randint(5, 30)):
+            draw.line([(rng.randrange(600), rng.randrange(800)) for _ in range(2)], fill=0, width=rng.randint(1, 4))
+        vectors.append(to_vector(fingerprint_image(image)))
+
+    stored = np.array([vector for vector, _ in vectors], dtype=np.uint64)
+    full = np.array([complete for _, complete in vectors], dtype=bool)
+    flagged = []
+    for i, (query, query_full) in enumerate(vectors):
+        hit = match(stored, full, query, query_full)
+        hit[i] = False
+        if hit.any():
+            flagged.append((i, np.flatnonzero(hit).tolist()))
+    print(f"{len(flagged)} of {count} unrelated monochrome drawings flagged as duplicates")
+    for i, others in flagged:
+        print(f"  drawing {i} matched {others}")
+    if flagged:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    _check_monochrome()
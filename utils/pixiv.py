@@ -1,3 +1,4 @@
+import asyncio
 import io
 import json
 import zipfile
@@ -5,49 +6,58 @@ import zipfile
 from PIL import Image
 
 import exception
+from utils.resilience import FAILURES, CircuitOpen, fetch, upstream
+
+PIXIV = upstream("pixiv", default_timeout=10, min_timeout=3, max_timeout=30)
+PIXIV_IMAGES = upstream("pixiv-images", default_timeout=60, min_timeout=30, max_timeout=120, retries=1)
+
+
+async def _pixiv_fetch(bot, url: str, what: str, up=PIXIV, text: bool = False) -> bytes | str:
+    """GET from Pixiv through its circuit breaker; anything but a 200 is RequestFailed."""
+    try:
+        status, body = await fetch(bot.client, up, url, text=text)
+    except CircuitOpen as err:
+        raise exception.RequestFailed(str(err)) from err
+    except FAILURES as err:
+        raise exception.RequestFailed(f"request to {what} failed: {err!r}") from err
+    if status != 200:
+        raise exception.RequestFailed(f"request to {what} failed")
+    return body
 
 
 async def ugoria_merge(bot, id) -> tuple[bytes, str]:
-    ugo_resp = await bot.client.get(f"https://www.pixiv.net/ajax/illust/{id}/ugoira_meta")
-    if ugo_resp.status == 200:
-        ugo_json_resp = json.loads(await ugo_resp.text())
-        ugo_zip_resp = await bot.client.get(ugo_json_resp["body"]["originalSrc"])
-        if ugo_zip_resp.status == 200:
-            frames = {f["file"]: f["delay"] for f in ugo_json_resp["body"]["frames"]}
-            zipcontent = await ugo_zip_resp.read()
-            with zipfile.ZipFile(io.BytesIO(zipcontent)) as zf:
-                files = zf.namelist()
-                images = []
-                durations = []
-                width = 0
-                height = 0
-                for file in files:
-                    f = io.BytesIO(zf.read(file))
-                    im = Image.open(fp=f)
-                    width = max(im.width, width)
-                    height = max(im.height, height)
-                    images.append(im)
-                    durations.append(int(frames[file]))
-
-                first_im = images.pop(0)
-                image = io.BytesIO()
-                first_im.save(
-                    image,
-                    format="webp",
-                    save_all=True,
-                    append_images=images,
-                    duration=durations,
-                    lossless=True,
-                    quality=100,
-                )
-                image = image.getvalue()
-                image_name = f"ugoria_{id}.webp"
-
-                return image, image_name
-        else:
-            raise exception.RequestFailed("request to pixiv ugoria zip failed")
-    else:
-        raise exception.RequestFailed("request to pixiv ugoria api failed")
+    ugo_json_resp = json.loads(await _pixiv_fetch(bot, f"https://www.pixiv.net/ajax/illust/{id}/ugoira_meta", "pixiv ugoria api", text=True))
+    zipcontent = await _pixiv_fetch(bot, ugo_json_resp["body"]["originalSrc"], "pixiv ugoria zip", up=PIXIV_IMAGES)
+    frames = {f["file"]: f["delay"] for f in ugo_json_resp["body"]["frames"]}
+    with zipfile.ZipFile(io.BytesIO(zipcontent)) as zf:
+        files = zf.namelist()
+        images = []
+        durations = []
+        width = 0
+        height = 0
+        for file in files:
+            f = io.BytesIO(zf.read(file))
+            im = Image.open(fp=f)
+            width = max(im.width, width)
+            height = max(im.height, height)
+            images.append(im)
+            durations.append(int(frames[file]))
+
+        first_im = images.pop(0)
+        image = io.BytesIO()
+        first_im.save(
+            image,
+            format="webp",
+            save_all=True,
+            append_images=images,
+            duration=durations,
+            lossless=True,
+            quality=100,
+        )
+        image = image.getvalue()
+        image_name = f"ugoria_{id}.webp"
+
+        return image, image_name
 
 
 async def pixiv_ajax_get(bot, link: str, image_num: int | None, on_status=None) -> tuple[dict, io.BytesIO, str]:
@@ -63,31 +73,57 @@ async def pixiv_ajax_get(bot, link: str, image_num: int | None, on_status=None)
     Returns:
         tuple: (ajax_resp, image_bytes, image_filename)
     """
+    ajax_resp, images = await pixiv_ajax_get_pages(bot, link, [image_num or 1], on_status=on_status)
+    image, image_name = images[0]
+    return ajax_resp, image, image_name
+
+
+async def pixiv_ajax_get_pages(bot, link: str, pages: list[int] | None, on_status=None) -> tuple[dict, list[tuple[io.BytesIO, str]]]:
+    """
+    Fetch several images from one Pixiv post: metadata once, pages concurrently.
+
+    Args:
+        bot: The ArtBot instance with client attribute
+        link: Pixiv post URL
+        pages: 1-indexed page numbers, or None for every page
+        on_status: optional async callable(text) for progress updates
+
+    Returns:
+        tuple: (ajax_resp, [(image_bytes, image_filename), ...]) in `pages` order.
+        Ugoira posts have a single image, whatever `pages` is.
+    """
     async def _status(text):
         if on_status:
             await on_status(text)
 
     id = link.split("/")[-1].split("?", 1)[0].split("#", 1)[0]
     await _status("📥 Fetching Pixiv post metadata...")
-    resp = await bot.client.get(f"https://www.pixiv.net/ajax/illust/{id}")
-    if resp.status == 200:
-        ajax_resp = json.loads(await resp.text())
-        if ajax_resp["body"]["aiType"] > 1:
-            raise exception.AIImageFound("pixiv ai image")
-        if ajax_resp["body"]["illustType"] != 2:
-            image_link = ajax_resp["body"]["urls"]["original"]
-            temp = ajax_resp["body"]["urls"]["original"].split("/")
-            image_name = temp[len(temp) - 1]
-            if image_num:
-                image_link = image_link.replace("_p0.", f"_p{image_num-1}.")
-                image_name = image_name.replace("_p0.", f"_p{image_num-1}.")
-            await _status("🖼️ Downloading image from Pixiv...")
-            image_req = await bot.client.get(image_link)
-            if image_req.status == 200:
-                image = await image_req.read()
-            else:
-                raise exception.RequestFailed("request to pixiv image failed")
-        else:
-            await _status("🎞️ Compositing ugoira frames...")
-            image, image_name = await ugoria_merge(bot, id)
-    return ajax_resp, io.BytesIO(image), image_name
+    ajax_resp = json.loads(await _pixiv_fetch(bot, f"https://www.pixiv.net/ajax/illust/{id}", "pixiv ajax api", text=True))
+    if ajax_resp["body"]["aiType"] > 1:
+        raise exception.AIImageFound("pixiv ai image")
+
+    if ajax_resp["body"]["illustType"] == 2:
+        await _status("🎞️ Compositing ugoira frames...")
+        image, image_name = await ugoria_merge(bot, id)
+        return ajax_resp, [(io.BytesIO(image), image_name)]
+
+    page_count = ajax_resp["body"].get("pageCount", 1)
+    if pages is None:
+        pages = list(range(1, page_count + 1))
+    for page in pages:
+        if page < 1 or page > page_count:
+            raise exception.RequestFailed(f"Image {page} not found. Post has {page_count} images.")
+
+    original = ajax_resp["body"]["urls"]["original"]
+    image_name = original.split("/")[-1]
+    if len(pages) == 1:
+        await _status("🖼️ Downloading image from Pixiv...")
+    else:
+        await _status(f"🖼️ Downloading {len(pages)} images from Pixiv...")
+    images = await asyncio.gather(*(
+        _pixiv_fetch(bot, original.replace("_p0.", f"_p{page - 1}."), "pixiv image", up=PIXIV_IMAGES) for page in pages
+    ))
+    return ajax_resp, [
+        (io.BytesIO(image), image_name.replace("_p0.", f"_p{page - 1}."))
+        for page, image in zip(pages, images)
+    ]
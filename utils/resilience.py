@@ -0,0 +1,201 @@
+"""Circuit breakers, adaptive timeouts and retries for upstream services.
+
+Pixiv, Bluesky, the tagger spaces and Danbooru each get one shared Upstream
+(see upstream()), so what one request learns about an upstream applies to
+every later one:
+
+  * timeouts adapt to the upstream's observed latency: TIMEOUT_FACTOR times
+    its recent p95, clamped to the upstream's [min_timeout, max_timeout],
+    instead of a fixed (often 120s) worst case;
+  * failures (timeouts, connection errors, Unavailable) are retried a bounded
+    number of times with jittered exponential backoff;
+  * FAILURE_THRESHOLD failures in a row open the breaker: calls then fail in
+    microseconds with CircuitOpen instead of each user waiting out a timeout.
+    After the cooldown one call is let through as a probe (half-open); its
+    success closes the breaker, its failure reopens it for twice as long, up
+    to MAX_COOLDOWN.
+
+Errors that say nothing about the upstream's health (a 404, an AI-flagged
+post) pass straight through and don't count as failures.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, TypeVar
+
+import aiohttp
+
+FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURES", "5") or 5)
+COOLDOWN = float(os.getenv("CIRCUIT_COOLDOWN", "30") or 30)   # seconds open before a probe
+MAX_COOLDOWN = 600.0
+LATENCY_WINDOW = 100   # recent successful calls the percentile is taken over
+MIN_SAMPLES = 10       # use the default timeout until this many are in
+TIMEOUT_FACTOR = 3.0
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+
+LOGGER = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class CircuitOpen(Exception):
+    """The upstream is known to be down; the call was not attempted."""
+
+    def __init__(self, name: str, retry_in: float) -> None:
+        super().__init__(f"{name} is unavailable (retrying in {retry_in:.0f}s)")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class Unavailable(Exception):
+    """Raise inside a call for a response that means the upstream is unhealthy
+    (5xx, 429): it's retried and counts against the breaker."""
+
+
+FAILURES = (Unavailable, asyncio.TimeoutError, aiohttp.ClientError, ConnectionError)
+
+
+class Upstream:
+    def __init__(
+        self,
+        name: str,
+        default_timeout: float = 15.0,
+        min_timeout: float = 5.0,
+        max_timeout: float = 60.0,
+        retries: int = 2,
+    ) -> None:
+        self.name = name
+        self.default_timeout = default_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.retries = retries
+        self.state = "closed"            # closed -> open -> half_open -> closed | open
+        self.failures = 0                # consecutive
+        self.cooldown = COOLDOWN
+        self.opened_until = 0.0
+        self.rejected = 0
+        self._latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._probing = False
+
+    def timeout(self) -> float:
+        if len(self._latencies) < MIN_SAMPLES:
+            return self.default_timeout
+        ordered = sorted(self._latencies)
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        return min(self.max_timeout, max(self.min_timeout, p95 * TIMEOUT_FACTOR))
+
+    def check(self) -> None:
+        """Raise CircuitOpen unless a call may go ahead now."""
+        if self.state == "closed":
+            return
+        now = time.monotonic()
+        if self.state == "open" and now >= self.opened_until:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probing:
+            self._probing = True
+            return
+        self.rejected += 1
+        raise CircuitOpen(self.name, max(0.0, self.opened_until - now))
+
+    def record_success(self, latency: float | None) -> None:
+        if latency is not None:
+            self._latencies.append(latency)
+        self._probing = False
+        if self.state != "closed":
+            LOGGER.info(f"{self.name} recovered; circuit closed")
+        self.state = "closed"
+        self.failures = 0
+        self.cooldown = COOLDOWN
+
+    def record_failure(self, error: BaseException) -> None:
+        self.failures += 1
+        if self.state == "half_open":
+            self._probing = False
+            self.cooldown = min(MAX_COOLDOWN, self.cooldown * 2)
+            self._open(error)
+        elif self.state == "closed" and self.failures >= FAILURE_THRESHOLD:
+            self._open(error)
+
+    def _open(self, error: BaseException) -> None:
+        self.state = "open"
+        self.opened_until = time.monotonic() + self.cooldown
+        LOGGER.warning(f"{self.name} circuit open for {self.cooldown:.0f}s after {self.failures} failures: {error!r}")
+
+    def release_probe(self) -> None:
+        """The probe ended without a verdict (a non-failure error); let another through."""
+        self._probing = False
+
+    async def call(
+        self,
+        fn: Callable[[], Awaitable[T]],
+        retries: int | None = None,
+        timeout: float | None = None,
+        sample: bool = True,
+    ) -> T:
+        """Await `fn()` under this upstream's breaker, timeout and retry policy.
+
+        `fn` is called again for each attempt, so it must build a fresh request.
+        sample=False keeps an atypical call (a cold start with its own
+        `timeout`) out of the latency window the adaptive timeout comes from.
+        """
+        retries = self.retries if retries is None else retries
+        for attempt in range(retries + 1):
+            self.check()
+            start = time.monotonic()
+            try:
+                result = await asyncio.wait_for(fn(), timeout or self.timeout())
+            except FAILURES as err:
+                self.record_failure(err)
+                if attempt == retries or self.state == "open":
+                    raise
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+                LOGGER.info(f"{self.name} call failed ({err!r}); retry {attempt + 1} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                self.release_probe()
+                raise
+            self.record_success(time.monotonic() - start if sample else None)
+            return result
+
+    @property
+    def metrics(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "timeout": round(self.timeout(), 2),
+            "rejected": self.rejected,
+            "retry_in": round(max(0.0, self.opened_until - time.monotonic()), 1) if self.state == "open" else 0.0,
+        }
+
+
+async def fetch(session: aiohttp.ClientSession, up: Upstream, url: str, *, text: bool = False, **kwargs) -> tuple[int, bytes | str]:
+    """GET `url` through `up`: (status, body). 5xx and 429 count as failures;
+    other statuses are returned for the caller to judge."""
+    async def attempt() -> tuple[int, bytes | str]:
+        async with session.get(url, **kwargs) as resp:
+            if resp.status >= 500 or resp.status == 429:
+                raise Unavailable(f"HTTP {resp.status} from {up.name}")
+            return resp.status, await (resp.text() if text else resp.read())
+    return await up.call(attempt)
+
+
+_UPSTREAMS: dict[str, Upstream] = {}
+
+
+def upstream(name: str, **settings) -> Upstream:
+    """The shared Upstream called `name`, created with `settings` on first use."""
+    found = _UPSTREAMS.get(name)
+    if found is None:
+        found = _UPSTREAMS[name] = Upstream(name, **settings)
+    return found
+
+
+def upstream_metrics() -> dict:
+    return {name: up.metrics for name, up in _UPSTREAMS.items()}
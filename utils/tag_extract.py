@@ -1,28 +1,22 @@
+import asyncio
+import datetime
+import hashlib
 import json
 import logging
 import os
 import re
+import sys
 import time
+from collections.abc import Mapping
+from dataclasses import dataclass, field
 from pathlib import Path
 
-import requests
-
 from config import Config
+from utils import compiled_map
+from utils.danbooru import DanbooruCrawler, Listing
 
 LOGGER = logging.getLogger(__name__)
 
-DANBOORU_BASE_URL = "https://danbooru.donmai.us/tags.json"
-DANBOORU_ALIAS_URL = "https://danbooru.donmai.us/tag_aliases.json"
-DANBOORU_WIKI_URL = "https://danbooru.donmai.us/wiki_pages.json"
-
-USER_AGENT = "Art-Bot-Helper/1.0"
-
-SESSION = requests.Session()
-SESSION.headers.update({"User-Agent": USER_AGENT})
-
-FETCH_LIMIT = 1000
-SLEEP_TIME = 0.1
-
 DEFAULT_CONFIG_DIR = Path(
     os.getenv("CONFIG_PATH", str(Path(__file__).resolve().parents[1] / "configs"))
 )
@@ -31,96 +25,9 @@ DEFAULT_OUTPUT_FILE = "char_map.json"
 PAREN_RE = re.compile(r"\(([^)]+)\)")
 
 
-def fetch_all_character_tags():
-    all_tags = []
-    page = 1
-
-    while True:
-        params = {
-            "search[category]": 4,
-            "limit": FETCH_LIMIT,
-            "page": page,
-        }
-
-        #LOGGER.info(f"Fetching Danbooru page {page}...")
-        resp = SESSION.get(DANBOORU_BASE_URL, params=params, timeout=30)
-        resp.raise_for_status()
-
-        data = resp.json()
-        if not data:
-            break
-
-        all_tags.extend(data)
-
-        if len(data) < FETCH_LIMIT:
-            break
-
-        page += 1
-        time.sleep(SLEEP_TIME)
-
-    LOGGER.info(f"Fetched {len(all_tags)} character tags total")
-    return all_tags
-
-
-def fetch_all_tag_aliases():
-    aliases = []
-    page = 1
-
-    while True:
-        params = {
-            "search[status]": "active",
-            "limit": FETCH_LIMIT,
-            "page": page,
-        }
-
-        #LOGGER.info(f"Fetching Danbooru aliases page {page}...")
-        resp = SESSION.get(DANBOORU_ALIAS_URL, params=params, timeout=30)
-        resp.raise_for_status()
-
-        data = resp.json()
-        if not data:
-            break
-
-        aliases.extend(data)
-
-        if len(data) < FETCH_LIMIT:
-            break
-
-        page += 1
-        time.sleep(SLEEP_TIME)
-
-    LOGGER.info(f"Fetched {len(aliases)} aliases total")
-    return aliases
-
-
-def fetch_all_wiki_pages():
-    pages = []
-    page = 1
-
-    while True:
-        params = {
-            "limit": FETCH_LIMIT,
-            "page": page,
-        }
-
-        #LOGGER.info(f"Fetching Danbooru wiki page {page}...")
-        resp = SESSION.get(DANBOORU_WIKI_URL, params=params, timeout=30)
-        resp.raise_for_status()
-
-        data = resp.json()
-        if not data:
-            break
-
-        pages.extend(data)
-
-        if len(data) < FETCH_LIMIT:
-            break
-
-        page += 1
-        time.sleep(SLEEP_TIME)
-
-    LOGGER.info(f"Fetched {len(pages)} wiki pages total")
-    return pages
+CHARACTER_TAGS = Listing("tags", "tags.json", {"search[category]": 4})
+TAG_ALIASES = Listing("aliases", "tag_aliases.json", {"search[status]": "active"})
+WIKI_PAGES = Listing("wiki", "wiki_pages.json")
 
 
 def extract_parentheses(tag_name: str):
@@ -157,7 +64,7 @@ def is_valid_alt_name(name: str) -> bool:
 
 
 def build_mapping(
-    tags, target_series: set[str], skip_tags: set[str], manual_overrides: dict[str, str]
+    tags, target_series: set[str], skip_tags: set[str], manual_overrides: Mapping[str, str]
 ):
     result = {}
 
@@ -181,99 +88,403 @@ def build_mapping(
     return result
 
 
-def apply_aliases(mapping, aliases, skip_tags: set[str]):
-    added = 0
-
-    for alias in aliases:
-        antecedent = alias.get("antecedent_name")
-        consequent = alias.get("consequent_name")
-
-        if not antecedent or not consequent:
-            continue
-        if antecedent in skip_tags:
-            continue
-        if antecedent in mapping:
-            continue
-
-        final_name = mapping.get(consequent)
-        if not final_name:
-            continue
-
-        mapping[antecedent] = final_name
-        added += 1
-
-    LOGGER.info(f"Added {added} alias mappings")
-
-
-def apply_wiki_translations(mapping, wiki_pages):
-    added = 0
-
-    for wiki in wiki_pages:
-        if wiki.get("is_deleted"):
-            continue
-
-        title = wiki.get("title")
-        if not title:
-            continue
-
-        final_name = mapping.get(title)
-        if not final_name:
-            continue
-
-        translated = wiki.get("translated_name")
-        if translated and is_valid_alt_name(translated):
-            if translated not in mapping:
-                mapping[translated] = final_name
-                added += 1
-
-        for alt in wiki.get("other_names", []):
-            if not is_valid_alt_name(alt):
+def wiki_alt_names(wiki) -> list[str]:
+    """Usable alternative names (translated name first) from a wiki page record."""
+    names = []
+    translated = wiki.get("translated_name")
+    if translated and is_valid_alt_name(translated):
+        names.append(translated)
+    names.extend(alt for alt in wiki.get("other_names") or [] if is_valid_alt_name(alt))
+    return names
+
+
+# ---------------------------------------------------------------------------
+# Local Danbooru snapshot + incremental sync
+#
+# The snapshot keeps just what the mapping needs — character tag names, active
+# aliases and the alt names from the wiki pages of mapped characters — plus a
+# per-dataset cursor (highest id / updated_at seen). A refresh only asks Danbooru for
+# records updated since the cursor and re-resolves the mapping keys those
+# records can affect. A full crawl happens on the first run, when the snapshot
+# is older than FULL_CRAWL_DAYS, or on request.
+# ---------------------------------------------------------------------------
+
+SNAPSHOT_FILE = "danbooru_snapshot.json"
+CHECKPOINT_DIR = "danbooru_crawl"  # resumable full-crawl pages, removed on success
+WIKI_TITLE_BATCH = 100  # titles per wiki query; tag names never contain spaces
+SNAPSHOT_VERSION = 2
+FULL_CRAWL_DAYS = 90
+CURSOR_OVERLAP = datetime.timedelta(minutes=5)  # re-read a little to absorb clock skew
+
+
+def _parse_time(value: str | None) -> datetime.datetime | None:
+    if not value:
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed.astimezone(datetime.timezone.utc)
+
+
+def advance_cursor(cursor: dict, records: list[dict]) -> dict:
+    """Return cursor moved past the highest id / updated_at in records."""
+    cursor = {"id": cursor.get("id", 0), "updated_at": cursor.get("updated_at")}
+    latest = _parse_time(cursor["updated_at"])
+    for record in records:
+        cursor["id"] = max(cursor["id"], record.get("id") or 0)
+        updated = _parse_time(record.get("updated_at"))
+        if updated is not None and (latest is None or updated > latest):
+            latest = updated
+    cursor["updated_at"] = latest.isoformat() if latest else None
+    return cursor
+
+
+def changed_since_params(cursor: dict) -> dict:
+    since = _parse_time(cursor.get("updated_at"))
+    if since is None:
+        return {}
+    return {"search[updated_at]": f">{(since - CURSOR_OVERLAP).isoformat()}"}
+
+
+def changed_since(listing: Listing, cursor: dict) -> Listing:
+    return Listing(listing.name, listing.path, {**listing.params, **changed_since_params(cursor)})
+
+
+def changed_tags(cursor: dict) -> Listing:
+    """Tags of any category changed since cursor: a tag moved out of the
+    character category must be seen for apply_tags to drop it, so the category
+    is filtered locally. Without a cursor this is the plain character listing."""
+    since = changed_since_params(cursor)
+    if not since:
+        return CHARACTER_TAGS
+    return Listing(CHARACTER_TAGS.name, CHARACTER_TAGS.path, since)
+
+
+def settings_fingerprint(config: Config) -> str:
+    payload = json.dumps(
+        [sorted(config.target_series), sorted(config.skip_tags), dict(config.manual_overrides.items())],
+        sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+@dataclass
+class DanbooruSnapshot:
+    tags: set[str] = field(default_factory=set)              # character tag names
+    aliases: dict[str, str] = field(default_factory=dict)    # antecedent -> consequent (active)
+    wiki: dict[str, list[str]] = field(default_factory=dict)  # character title -> alt names
+    wiki_scope: set[str] = field(default_factory=set)        # titles whose wiki pages are tracked
+    cursors: dict[str, dict] = field(default_factory=dict)   # dataset -> {"id", "updated_at"}
+    settings: str = ""                                       # settings_fingerprint at last write
+    crawled_at: float = 0.0                                  # time of the last full crawl
+
+    @classmethod
+    def load(cls, path: Path) -> "DanbooruSnapshot | None":
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if data.get("version") != SNAPSHOT_VERSION:
+            return None
+        return cls(
+            tags=set(data["tags"]),
+            aliases=data["aliases"],
+            wiki=data["wiki"],
+            wiki_scope=set(data["wiki_scope"]),
+            cursors=data["cursors"],
+            settings=data.get("settings", ""),
+            crawled_at=data.get("crawled_at", 0.0),
+        )
+
+    def save(self, path: Path) -> None:
+        data = {
+            "version": SNAPSHOT_VERSION,
+            "tags": sorted(self.tags),
+            "aliases": self.aliases,
+            "wiki": self.wiki,
+            "wiki_scope": sorted(self.wiki_scope),
+            "cursors": self.cursors,
+            "settings": self.settings,
+            "crawled_at": self.crawled_at,
+        }
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        tmp.replace(path)
+
+    def apply_tags(self, records: list[dict]) -> set[str]:
+        """Merge tag records; returns the names whose membership changed."""
+        changed = set()
+        for tag in records:
+            name = tag.get("name")
+            if not name:
                 continue
-            if alt in mapping:
+            is_character = tag.get("category") == 4
+            if is_character and name not in self.tags:
+                self.tags.add(name)
+                changed.add(name)
+            elif not is_character and name in self.tags:
+                self.tags.discard(name)
+                changed.add(name)
+        self.cursors["tags"] = advance_cursor(self.cursors.get("tags", {}), records)
+        return changed
+
+    def apply_aliases(self, records: list[dict]) -> set[str]:
+        """Merge alias records (any status); returns the antecedents that changed."""
+        changed = set()
+        for alias in records:
+            antecedent = alias.get("antecedent_name")
+            consequent = alias.get("consequent_name")
+            if not antecedent or not consequent:
                 continue
-
-            mapping[alt] = final_name
-            added += 1
-
-    LOGGER.info(f"Added {added} wiki translation mappings")
+            if alias.get("status", "active") == "active":
+                if self.aliases.get(antecedent) != consequent:
+                    self.aliases[antecedent] = consequent
+                    changed.add(antecedent)
+            elif self.aliases.get(antecedent) == consequent:
+                del self.aliases[antecedent]
+                changed.add(antecedent)
+        self.cursors["aliases"] = advance_cursor(self.cursors.get("aliases", {}), records)
+        return changed
+
+    def apply_wiki(self, records: list[dict], advance: bool = True) -> set[str]:
+        """Merge wiki page records for tracked titles; returns the alt names affected."""
+        affected = set()
+        for wiki in records:
+            title = wiki.get("title")
+            if not title or title not in self.wiki_scope:
+                continue
+            names = [] if wiki.get("is_deleted") else wiki_alt_names(wiki)
+            old = self.wiki.get(title, [])
+            if names == old:
+                continue
+            affected.update(old)
+            affected.update(names)
+            if names:
+                self.wiki[title] = names
+            else:
+                self.wiki.pop(title, None)
+        if advance:
+            self.cursors["wiki"] = advance_cursor(self.cursors.get("wiki", {}), records)
+        return affected
+
+    def rescope_wiki(self, titles: set[str]) -> None:
+        """Track wiki pages for exactly these titles, forgetting the rest."""
+        for title in self.wiki_scope - titles:
+            self.wiki.pop(title, None)
+        self.wiki_scope = set(titles)
+
+
+class CharacterMapResolver:
+    """Resolves any mapping key from a snapshot, with the same precedence as a
+    full build: character tag > alias antecedent > wiki alt name."""
+
+    def __init__(self, snapshot: DanbooruSnapshot, config: Config) -> None:
+        self.snapshot = snapshot
+        self.skip_tags = config.skip_tags
+        self.base = build_mapping(
+            [{"name": name} for name in sorted(snapshot.tags)],
+            config.target_series, config.skip_tags, config.manual_overrides,
+        )
+        self.by_consequent: dict[str, set[str]] = {}
+        for antecedent, consequent in snapshot.aliases.items():
+            self.by_consequent.setdefault(consequent, set()).add(antecedent)
+        self.index_wiki()
+
+    def index_wiki(self) -> None:
+        """(Re)build the alt name index after the snapshot's wiki pages change."""
+        self.alt_titles: dict[str, list[str]] = {}
+        for title in sorted(self.snapshot.wiki):
+            for name in self.snapshot.wiki[title]:
+                self.alt_titles.setdefault(name, []).append(title)
+
+    def resolve(self, key: str) -> str | None:
+        if key in self.base:
+            return self.base[key]
+        consequent = self.snapshot.aliases.get(key)
+        if consequent in self.base and key not in self.skip_tags:
+            return self.base[consequent]
+        for title in self.alt_titles.get(key, ()):
+            if title in self.base:
+                return self.base[title]
+        return None
+
+    def keys_for(self, tag: str) -> set[str]:
+        """Every key whose value can derive from this character tag."""
+        return {tag} | self.by_consequent.get(tag, set()) | set(self.snapshot.wiki.get(tag, ()))
+
+    def full(self) -> dict[str, str]:
+        keys: set[str] = set(self.base)
+        for tag in self.base:
+            keys |= self.keys_for(tag)
+        mapping = {}
+        for key in sorted(keys):
+            value = self.resolve(key)
+            if value:
+                mapping[key] = value
+        return mapping
+
+    def update(self, mapping: dict[str, str], keys: set[str]) -> int:
+        """Re-resolve just these keys in place; returns how many entries changed."""
+        changed = 0
+        for key in keys:
+            value = self.resolve(key)
+            if mapping.get(key) == value:
+                continue
+            if value is None:
+                del mapping[key]
+            else:
+                mapping[key] = value
+            changed += 1
+        return changed
+
+
+def wiki_listings(titles: set[str]) -> list[Listing]:
+    """Wiki pages for just these titles, WIKI_TITLE_BATCH titles per query."""
+    ordered = sorted(titles)
+    return [
+        Listing(
+            f"wiki-{i // WIKI_TITLE_BATCH}", WIKI_PAGES.path,
+            {"search[title_space]": " ".join(ordered[i:i + WIKI_TITLE_BATCH]), "search[is_deleted]": "false"},
+        )
+        for i in range(0, len(ordered), WIKI_TITLE_BATCH)
+    ]
+
+
+async def _fetch_scoped_wiki(
+    crawler: DanbooruCrawler, snapshot: DanbooruSnapshot, resolver: CharacterMapResolver
+) -> set[str]:
+    """Fetch wiki pages for mapped titles not tracked yet; returns the alt names affected."""
+    titles = set(resolver.base)
+    missing = titles - snapshot.wiki_scope
+    snapshot.wiki_scope |= missing
+    affected: set[str] = set()
+    await crawler.consume_all([
+        (listing, lambda records: affected.update(snapshot.apply_wiki(records, advance=False)))
+        for listing in wiki_listings(missing)
+    ])
+    snapshot.rescope_wiki(titles)
+    resolver.index_wiki()
+    return affected
+
+
+async def _crawl_snapshot(config: Config) -> tuple[DanbooruSnapshot, CharacterMapResolver]:
+    started = datetime.datetime.now(datetime.timezone.utc)
+    snapshot = DanbooruSnapshot(crawled_at=time.time(), settings=settings_fingerprint(config))
+    async with DanbooruCrawler(checkpoint_dir=config.base_path / CHECKPOINT_DIR) as crawler:
+        await crawler.consume_all([
+            (CHARACTER_TAGS, snapshot.apply_tags),
+            (TAG_ALIASES, snapshot.apply_aliases),
+        ])
+        resolver = CharacterMapResolver(snapshot, config)
+        await _fetch_scoped_wiki(crawler, snapshot, resolver)
+    # Only mapped titles were fetched; wiki edits from here on come via the cursor.
+    snapshot.cursors["wiki"] = {"id": 0, "updated_at": started.isoformat()}
+    return snapshot, resolver
+
+
+def crawl_snapshot(config: Config) -> tuple[DanbooruSnapshot, CharacterMapResolver]:
+    """Full crawl into a fresh snapshot.
+
+    Tags and aliases are streamed into the snapshot page by page; wiki pages
+    are then fetched only for the titles the mapping uses, in batched title
+    queries, instead of downloading every wiki page on Danbooru.
+    """
+    snapshot, resolver = asyncio.run(_crawl_snapshot(config))
+    LOGGER.info(
+        f"Snapshot: {len(snapshot.tags)} character tags, {len(snapshot.aliases)} aliases, "
+        f"{len(snapshot.wiki)} of {len(snapshot.wiki_scope)} mapped wiki pages with alt names"
+    )
+    return snapshot, resolver
+
+
+async def _sync_snapshot(
+    snapshot: DanbooruSnapshot, config: Config
+) -> tuple[CharacterMapResolver, set[str]]:
+    changed_names: set[str] = set()
+    affected: set[str] = set()
+    async with DanbooruCrawler() as crawler:
+        await crawler.consume_all([
+            (changed_tags(snapshot.cursors.get("tags", {})),
+             lambda records: changed_names.update(snapshot.apply_tags(records))),
+            # No status filter: aliases that stopped being active must be dropped.
+            (Listing("aliases", TAG_ALIASES.path, changed_since_params(snapshot.cursors.get("aliases", {}))),
+             lambda records: affected.update(snapshot.apply_aliases(records))),
+            (changed_since(WIKI_PAGES, snapshot.cursors.get("wiki", {})),
+             lambda records: affected.update(snapshot.apply_wiki(records))),
+        ])
+        resolver = CharacterMapResolver(snapshot, config)
+        # Keys of changed tags are collected before wiki pages of tags that
+        # left the mapping are dropped from the snapshot.
+        for tag in changed_names:
+            affected |= resolver.keys_for(tag)
+        affected |= await _fetch_scoped_wiki(crawler, snapshot, resolver)
+    return resolver, affected
+
+
+def sync_snapshot(snapshot: DanbooruSnapshot, config: Config) -> tuple[CharacterMapResolver, set[str]]:
+    """Fetch records changed since the snapshot cursors and merge them.
+
+    Returns a resolver over the updated snapshot and every mapping key the
+    changes can affect. Wiki pages for titles that newly entered the mapping
+    are fetched here too.
+    """
+    return asyncio.run(_sync_snapshot(snapshot, config))
 
 
 def generate_character_map(config: Config) -> dict[str, str]:
-    target_series = config.target_series
-    skip_tags = config.skip_tags
-    manual_overrides = config.manual_overrides
-
-    tags = fetch_all_character_tags()
-    mapping = build_mapping(tags, target_series, skip_tags, manual_overrides)
-
-    aliases = fetch_all_tag_aliases()
-    apply_aliases(mapping, aliases, skip_tags)
-
-    wiki_pages = fetch_all_wiki_pages()
-    apply_wiki_translations(mapping, wiki_pages)
-
-    return mapping
+    _, resolver = crawl_snapshot(config)
+    return resolver.full()
 
 
 def write_character_map(mapping: dict[str, str], output_file: Path) -> None:
-    with open(output_file, "w", encoding="utf-8") as f:
+    tmp = output_file.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
         json.dump(mapping, f, indent=2, ensure_ascii=False)
+    tmp.replace(output_file)
+    compiled_map.build(output_file)
 
 
 def run_update(
     config: Config,
     output_file: Path | None = None,
+    full: bool = False,
 ) -> int:
+    """Refresh the character map, incrementally when a usable snapshot exists."""
     output_file = output_file or (config.base_path / DEFAULT_OUTPUT_FILE)
-    mapping = generate_character_map(config)
+    snapshot_file = config.base_path / SNAPSHOT_FILE
+    snapshot = None if full else DanbooruSnapshot.load(snapshot_file)
+    if snapshot is not None and time.time() - snapshot.crawled_at > FULL_CRAWL_DAYS * 86400:
+        snapshot = None
+
+    if snapshot is None:
+        LOGGER.info("Running full Danbooru crawl")
+        snapshot, resolver = crawl_snapshot(config)
+        mapping = resolver.full()
+    else:
+        resolver, affected = sync_snapshot(snapshot, config)
+        if settings_fingerprint(config) != snapshot.settings or not config.char_map:
+            # Target series / skip tags / overrides changed: every key may move.
+            mapping = resolver.full()
+        else:
+            mapping = dict(config.char_map.items())
+            changed = resolver.update(mapping, affected)
+            LOGGER.info(f"Incremental refresh: {len(affected)} keys checked, {changed} changed")
+
     write_character_map(mapping, output_file)
+    snapshot.settings = settings_fingerprint(config)
+    snapshot.save(snapshot_file)
     LOGGER.info(f"Written {len(mapping)} entries to {output_file}")
     return len(mapping)
 
 
 def main():
     config = Config(str(DEFAULT_CONFIG_DIR))
-    run_update(config)
+    run_update(config, full="--full" in sys.argv)
 
 
 if __name__ == "__main__":
@@ -1,9 +1,13 @@
+import asyncio
+import datetime
 import hashlib
 import hmac
 import json
+import logging
 import os
 import secrets
 import sys
+import time
 import urllib.parse
 from contextlib import asynccontextmanager
 from pathlib import Path
@@ -13,11 +17,15 @@ from fastapi import Cookie, Depends, FastAPI, Form, HTTPException, Query, Reques
 from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from tortoise import Tortoise
-from tortoise.functions import Count
+from tortoise.expressions import Q
 
 # Allow importing db.models when running standalone (outside the project root).
 sys.path.insert(0, str(Path(__file__).parent.parent))
-from db.models import Image  # noqa: E402
+from db.models import Image, ImageFacet  # noqa: E402
+from db.search import filter_search  # noqa: E402
+from config import COMPILED_MAPS  # noqa: E402
+from utils import compiled_map  # noqa: E402
+from web.config_store import ConfigStore  # noqa: E402
 
 # ---------------------------------------------------------------------------
 # Configuration
@@ -27,6 +35,8 @@ from db.models import Image  # noqa: E402
 # When launched from main.py it is a no-op (vars already set).
 load_dotenv(override=False)
 
+LOGGER = logging.getLogger(__name__)
+
 DB_PATH = os.getenv("SQLITE_PATH", "artbot.db")
 CONFIG_PATH = Path(os.getenv("CONFIG_PATH", "./configs"))
 PAGE_SIZE = 50
@@ -134,7 +144,17 @@ async def lifespan(_: FastAPI):
         conn = Tortoise.get_connection("default")
         await conn.execute_query("PRAGMA foreign_keys = ON;")
         await conn.execute_query("PRAGMA journal_mode = WAL;")
+        # Web workers share the database with the bot process; wait out its writes.
+        await conn.execute_query("PRAGMA busy_timeout = 5000;")
+    # Split deployment (main.run_split): this is a web worker and the bot lives
+    # in another process, reachable over its RPC socket.
+    rpc_socket = os.getenv("BOT_RPC_SOCKET")
+    if rpc_socket and get_backend() is None:
+        use_remote_bot(rpc_socket)
+    await open_config_stores()
     yield
+    if rpc_socket and get_bot() is None and get_backend() is not None:
+        await get_backend().close()
     if _tortoise_owned:
         await Tortoise.close_connections()
 
@@ -147,14 +167,23 @@ app = FastAPI(title="Art Bot Admin", lifespan=lifespan)
 templates = Jinja2Templates(directory=BASE_DIR / "templates")
 
 # Userscript API — bearer-token auth, NOT behind the admin session cookie.
-from web.api import ApiError, api_error_handler, router as api_router  # noqa: E402
+from web.api import ApiError, api_error_handler, get_backend, get_bot, router as api_router, use_remote_bot  # noqa: E402
 
 app.include_router(api_router)
 app.add_exception_handler(ApiError, api_error_handler)
 
 
-def build_page_url(page: int, platform: str, guild_id: str, search: str) -> str:
+def build_page_url(
+    page: int, platform: str, guild_id: str, search: str,
+    before: str = "", after: str = "", last: bool = False,
+) -> str:
     params: dict[str, str] = {"page": str(page)}
+    if before:
+        params["before"] = before
+    elif after:
+        params["after"] = after
+    elif last:
+        params["last"] = "1"
     if platform:
         params["platform"] = platform
     if guild_id:
@@ -223,16 +252,79 @@ def set_bot_config(config) -> None:
     _bot_config = config
 
 
-def save_config(name: str, data) -> None:
+def write_config(name: str, data) -> None:
     meta = CONFIGS[name]
     path = CONFIG_PATH / meta["file"]
     tmp = path.with_suffix(".tmp")
     with open(tmp, "w", encoding="utf-8") as f:
         json.dump(data, f, indent=2, ensure_ascii=False)
     tmp.replace(path)
-    # Reload the bot's in-memory config so changes take effect immediately.
+    if meta["file"] in COMPILED_MAPS:
+        compiled_map.build(path)
+
+
+_reload_tasks: set[asyncio.Task] = set()
+
+
+def reload_bot_config() -> None:
+    # Reload the changed file in the bot's config so it takes effect immediately.
     if _bot_config is not None:
-        _bot_config.reload_all()
+        _bot_config.reload()
+        return
+    backend = get_backend()
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    if backend is None:
+        return
+    # Web worker: ask the bot process (its config watcher would get there too, just later).
+    task = loop.create_task(backend.reload_config())
+    _reload_tasks.add(task)
+    task.add_done_callback(_reload_done)
+
+
+def _reload_done(task: asyncio.Task) -> None:
+    _reload_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        LOGGER.warning(f"Bot config reload failed: {task.exception()}")
+
+
+def save_config(name: str, data) -> None:
+    write_config(name, data)
+    reload_bot_config()
+
+
+_config_stores: dict[str, ConfigStore] = {}
+
+
+def _config_store_args(name: str) -> tuple:
+    return (
+        CONFIG_PATH / CONFIGS[name]["file"],
+        lambda data: write_config(name, data),
+        reload_bot_config,
+    )
+
+
+async def open_config_stores() -> None:
+    """Load every dict map's editor store in a worker thread, so no request
+    pays for parsing the JSON and replaying its journal."""
+    for name, meta in CONFIGS.items():
+        if meta["type"] == "dict" and name not in SETTINGS_FILES and name not in _config_stores:
+            _config_stores[name] = await ConfigStore.open(*_config_store_args(name))
+
+
+def config_store(name: str) -> ConfigStore:
+    """Indexed editor store for a dict-type map (see web/config_store.py).
+    Edits are journaled and written to the JSON file shortly after."""
+    store = _config_stores.get(name)
+    if store is None:
+        # Normally opened at startup (open_config_stores); this is the fallback.
+        store = _config_stores[name] = ConfigStore(*_config_store_args(name))
+        store.start()
+    else:
+        store.refresh()
+    return store
 
 
 # ---------------------------------------------------------------------------
@@ -298,6 +390,39 @@ async def root():
     return RedirectResponse("/images")
 
 
+# Aggregate stats come from the trigger-maintained image_facets summary table
+# (a handful of rows), cached briefly so a burst of page loads shares one read.
+STATS_CACHE_TTL = 10.0
+_stats_cache: tuple[float, list[dict]] | None = None
+
+
+async def _facet_rows() -> list[dict]:
+    global _stats_cache
+    now = time.monotonic()
+    if _stats_cache is not None and now - _stats_cache[0] < STATS_CACHE_TTL:
+        return _stats_cache[1]
+    rows = await ImageFacet.all().values("source_platform", "guild_id", "count")
+    _stats_cache = (now, rows)
+    return rows
+
+
+def _invalidate_stats() -> None:
+    global _stats_cache
+    _stats_cache = None
+
+
+def encode_cursor(posted_at: datetime.datetime, row_id: int) -> str:
+    return f"{posted_at.isoformat()}|{row_id}"
+
+
+def decode_cursor(cursor: str) -> tuple[datetime.datetime, int] | None:
+    posted_at, _, row_id = cursor.rpartition("|")
+    try:
+        return datetime.datetime.fromisoformat(posted_at), int(row_id)
+    except ValueError:
+        return None
+
+
 @app.get("/images", response_class=HTMLResponse, dependencies=[Depends(require_auth)])
 async def images_page(
     request: Request,
@@ -305,40 +430,67 @@ async def images_page(
     platform: str = Query(""),
     guild_id: str = Query(""),
     search: str = Query(""),
+    before: str = Query(""),
+    after: str = Query(""),
+    last: bool = Query(False),
 ):
-    qs = Image.all()
-    if platform:
-        qs = qs.filter(source_platform=platform)
+    """Keyset-paginated on (posted_at, id), newest first.
+
+    `before` pages towards older rows, `after` towards newer ones and `last`
+    jumps to the oldest page; `page` is only carried along for display.
+    """
+    guild_filter: int | None = None
     if guild_id.strip():
         try:
-            qs = qs.filter(guild_id=int(guild_id.strip()))
+            guild_filter = int(guild_id.strip())
         except ValueError:
             pass
-    if search.strip():
-        qs = qs.filter(source_url__icontains=search.strip())
-
-    total = await qs.count()
-    offset = (page - 1) * PAGE_SIZE
-    rows = await qs.order_by("-posted_at").offset(offset).limit(PAGE_SIZE)
 
-    stats_total = await Image.all().count()
-
-    platform_rows = (
-        await Image.all()
-        .annotate(count=Count("id"))
-        .group_by("source_platform")
-        .values("source_platform", "count")
-    )
-    stats_by_platform = {r["source_platform"]: r["count"] for r in platform_rows}
+    qs = Image.all()
+    if platform:
+        qs = qs.filter(source_platform=platform)
+    if guild_filter is not None:
+        qs = qs.filter(guild_id=guild_filter)
+    if search.strip():
+        qs = filter_search(qs, search.strip())
 
-    guild_ids = await Image.all().distinct().values_list("guild_id", flat=True)
-    stats_guilds = len(set(guild_ids))
+    facets = await _facet_rows()
+    if search.strip():
+        total = await qs.count()
+    else:
+        total = sum(
+            f["count"] for f in facets
+            if (not platform or f["source_platform"] == platform)
+            and (guild_filter is None or f["guild_id"] == guild_filter)
+        )
 
-    platform_list = sorted(
-        {r["source_platform"] for r in await Image.all().values("source_platform")}
-    )
+    before_key = decode_cursor(before) if before else None
+    after_key = decode_cursor(after) if after else None
+    if after_key is not None:
+        posted_at, row_id = after_key
+        rows = await (
+            qs.filter(Q(posted_at__gt=posted_at) | Q(posted_at=posted_at, id__gt=row_id))
+            .order_by("posted_at", "id").limit(PAGE_SIZE)
+        )
+        rows.reverse()
+    elif last:
+        rows = await qs.order_by("posted_at", "id").limit(total % PAGE_SIZE or PAGE_SIZE)
+        rows.reverse()
+    else:
+        if before_key is not None:
+            posted_at, row_id = before_key
+            qs = qs.filter(Q(posted_at__lt=posted_at) | Q(posted_at=posted_at, id__lt=row_id))
+        rows = await qs.order_by("-posted_at", "-id").limit(PAGE_SIZE)
+
+    stats_by_platform: dict[str, int] = {}
+    for f in facets:
+        stats_by_platform[f["source_platform"]] = stats_by_platform.get(f["source_platform"], 0) + f["count"]
+    stats_total = sum(stats_by_platform.values())
+    stats_guilds = len({f["guild_id"] for f in facets})
+    platform_list = sorted(stats_by_platform)
 
     total_pages = max(1, (total + PAGE_SIZE - 1) // PAGE_SIZE)
+    page = min(page, total_pages)
 
     return templates.TemplateResponse(
         request, "index.html",
@@ -366,6 +518,8 @@ async def images_page(
             "total": total,
             "page": page,
             "total_pages": total_pages,
+            "next_cursor": encode_cursor(rows[-1].posted_at, rows[-1].id) if rows and page < total_pages else "",
+            "prev_cursor": encode_cursor(rows[0].posted_at, rows[0].id) if rows and page > 1 else "",
             "filter_platform": platform,
             "filter_guild": guild_id,
             "filter_search": search,
@@ -375,7 +529,9 @@ async def images_page(
 
 @app.post("/images/{image_id}/delete", dependencies=[Depends(require_auth)])
 async def delete_image(image_id: int, request: Request):
+    # The bot drops it from its hash index snapshot when it next loads (Database._reconcile_snapshot).
     await Image.filter(id=image_id).delete()
+    _invalidate_stats()
     referer = request.headers.get("referer", "/images")
     return RedirectResponse(referer, status_code=303)
 
@@ -396,7 +552,7 @@ async def configs_overview(request: Request):
     for name, meta in CONFIGS.items():
         if name in SETTINGS_FILES:
             continue
-        data = load_config(name)
+        data = config_store(name) if meta["type"] == "dict" else load_config(name)
         items.append({
             "name": name, "label": meta["label"], "description": meta["description"],
             "type": meta["type"], "count": len(data),
@@ -421,23 +577,20 @@ async def config_view(
         return RedirectResponse("/settings", status_code=303)
 
     meta = CONFIGS[name]
-    data = load_config(name)
     saved = request.query_params.get("saved") == "1"
 
     if meta["type"] == "dict":
-        entries = list(data.items())
-        if search:
-            sl = search.lower()
-            entries = [(k, v) for k, v in entries if sl in k.lower() or sl in str(v).lower()]
-        total = len(entries)
+        store = config_store(name)
+        total = store.count(search)
         total_pages = max(1, (total + CONFIG_PAGE_SIZE - 1) // CONFIG_PAGE_SIZE)
         page = min(page, total_pages)
-        page_entries = entries[(page - 1) * CONFIG_PAGE_SIZE: page * CONFIG_PAGE_SIZE]
+        page_entries, _ = store.page(page, CONFIG_PAGE_SIZE, search)
         ctx = _config_ctx(name, {
-            "entries": page_entries, "total": total, "total_count": len(data),
+            "entries": page_entries, "total": total, "total_count": len(store),
             "page": page, "total_pages": total_pages, "search": search, "saved": saved,
         })
     elif meta["type"] == "list":
+        data = load_config(name)
         items = data
         if search:
             sl = search.lower()
@@ -446,6 +599,7 @@ async def config_view(
             "items": items, "total": len(data), "search": search, "saved": saved,
         })
     else:
+        data = load_config(name)
         ctx = _config_ctx(name, {
             "raw_content": json.dumps(data, indent=2, ensure_ascii=False),
             "saved": saved, "error": None,
@@ -459,13 +613,14 @@ async def config_add(name: str, key: str = Form(""), value: str = Form(""), item
     if name not in CONFIGS or name in SETTINGS_FILES:
         raise HTTPException(status_code=404)
     meta = CONFIGS[name]
-    data = load_config(name)
-    if meta["type"] == "dict" and key.strip():
-        data[key.strip()] = value.strip()
-        save_config(name, data)
-    elif meta["type"] == "list" and item.strip() and item.strip() not in data:
-        data.append(item.strip())
-        save_config(name, data)
+    if meta["type"] == "dict":
+        if key.strip():
+            config_store(name).set(key.strip(), value.strip())
+    elif meta["type"] == "list":
+        data = load_config(name)
+        if item.strip() and item.strip() not in data:
+            data.append(item.strip())
+            save_config(name, data)
     return RedirectResponse(f"/configs/{name}?saved=1", status_code=303)
 
 
@@ -479,12 +634,11 @@ async def config_edit_entry(
 ):
     if name not in CONFIGS or CONFIGS[name]["type"] != "dict" or name in SETTINGS_FILES:
         raise HTTPException(status_code=404)
-    data = load_config(name)
-    if old_key in data:
-        del data[old_key]
+    store = config_store(name)
+    if new_key.strip() != old_key:
+        store.delete(old_key)
     if new_key.strip():
-        data[new_key.strip()] = new_value.strip()
-    save_config(name, data)
+        store.set(new_key.strip(), new_value.strip())
     referer = request.headers.get("referer", f"/configs/{name}")
     return RedirectResponse(referer, status_code=303)
 
@@ -499,13 +653,13 @@ async def config_delete_entry(
     if name not in CONFIGS or name in SETTINGS_FILES:
         raise HTTPException(status_code=404)
     meta = CONFIGS[name]
-    data = load_config(name)
-    if meta["type"] == "dict" and key in data:
-        del data[key]
-        save_config(name, data)
-    elif meta["type"] == "list" and item in data:
-        data.remove(item)
-        save_config(name, data)
+    if meta["type"] == "dict":
+        config_store(name).delete(key)
+    elif meta["type"] == "list":
+        data = load_config(name)
+        if item in data:
+            data.remove(item)
+            save_config(name, data)
     referer = request.headers.get("referer", f"/configs/{name}")
     return RedirectResponse(referer, status_code=303)
 
@@ -545,7 +699,7 @@ def _bulk_diff(name: str, content: str) -> tuple[list, list, int]:
     parsed = json.loads(content)
     if not isinstance(parsed, dict):
         raise ValueError("JSON must be an object of \"key\": \"value\" pairs.")
-    current = load_config(name)
+    current = config_store(name)
     additions, conflicts, unchanged = [], [], 0
     for raw_key, raw_val in parsed.items():
         key = str(raw_key).strip()
@@ -594,21 +748,21 @@ async def config_bulk_apply(request: Request, name: str):
 
     # Only keys the user ticked are allowed to overwrite an existing value.
     overwrite_keys = set(form.getlist("overwrite_keys"))
-    data = load_config(name)
+    store = config_store(name)
+    changes = {}
     added = overwritten = 0
     for raw_key, raw_val in parsed.items():
         key = str(raw_key).strip()
         if not key:
             continue
         val = _normalize_value(raw_val)
-        if key not in data:
-            data[key] = val
+        if key not in store and key not in changes:
+            changes[key] = val
             added += 1
-        elif str(data[key]) != val and key in overwrite_keys:
-            data[key] = val
+        elif key in store and str(store[key]) != val and key in overwrite_keys:
+            changes[key] = val
             overwritten += 1
-    if added or overwritten:
-        save_config(name, data)
+    store.update(changes)
     return JSONResponse({"added": added, "overwritten": overwritten})
 
 
@@ -616,10 +770,7 @@ async def config_bulk_apply(request: Request, name: str):
 # Tagger routes
 # ---------------------------------------------------------------------------
 
-from base64 import b64encode  # noqa: E402
-
 from config import TAGGER_DEFAULTS  # noqa: E402
-from web.api import get_bot  # noqa: E402
 
 TAGGER_FIELDS: list[tuple[str, str]] = [
     ("gpu_space", "GPU space (tried first)"),
@@ -645,16 +796,24 @@ def _effective_tagger_settings() -> dict:
     return {**TAGGER_DEFAULTS, **load_config("tagger_settings")}
 
 
-def _tagger_ctx(extra: dict) -> dict:
-    bot = get_bot()
-    cooldown = bot.tagger.gpu_cooldown_remaining() if bot is not None else 0.0
+async def _bot_status() -> dict:
+    """bot_running / gpu_cooldown_min for the page header, from whichever backend is active."""
+    backend = get_backend()
+    status = await backend.status() if backend is not None else {"ready": False, "gpu_cooldown": 0.0}
+    cooldown = status["gpu_cooldown"]
+    return {
+        "bot_running": status["ready"],
+        "gpu_cooldown_min": int(cooldown // 60) + (1 if cooldown % 60 else 0),
+    }
+
+
+async def _tagger_ctx(extra: dict) -> dict:
     return {
         "active_page": "tagger",
         "db_path": DB_PATH,
         "settings": _effective_tagger_settings(),
         "fields": TAGGER_FIELDS,
-        "bot_running": bot is not None and bot.is_ready(),
-        "gpu_cooldown_min": int(cooldown // 60) + (1 if cooldown % 60 else 0),
+        **await _bot_status(),
         "test_result": None,
         "test_error": None,
         **extra,
@@ -664,16 +823,16 @@ def _tagger_ctx(extra: dict) -> dict:
 @app.get("/tagger", response_class=HTMLResponse, dependencies=[Depends(require_auth)])
 async def tagger_page(request: Request):
     saved = request.query_params.get("saved") == "1"
-    return templates.TemplateResponse(request, "tagger.html", _tagger_ctx({"saved": saved}))
+    return templates.TemplateResponse(request, "tagger.html", await _tagger_ctx({"saved": saved}))
 
 
 @app.post("/tagger/test", response_class=HTMLResponse, dependencies=[Depends(require_auth)])
 async def tagger_test(request: Request):
-    bot = get_bot()
-    if bot is None or not bot.is_ready():
+    backend = get_backend()
+    if backend is None or not await backend.ready():
         return templates.TemplateResponse(
             request, "tagger.html",
-            _tagger_ctx({"saved": False, "test_error": "The bot is not running, so model tests are unavailable."}),
+            await _tagger_ctx({"saved": False, "test_error": "The bot is not running, so model tests are unavailable."}),
             status_code=503,
         )
 
@@ -683,54 +842,20 @@ async def tagger_test(request: Request):
     if upload is None or not getattr(upload, "filename", ""):
         return templates.TemplateResponse(
             request, "tagger.html",
-            _tagger_ctx({"saved": False, "test_error": "Choose an image file to test."}),
+            await _tagger_ctx({"saved": False, "test_error": "Choose an image file to test."}),
             status_code=400,
         )
 
-    image_bytes = await upload.read()
-    name = upload.filename.lower()
-    if name.endswith(".png"):
-        mime = "image/png"
-    elif name.endswith(".webp"):
-        mime = "image/webp"
-    elif name.endswith(".gif"):
-        mime = "image/gif"
-    else:
-        mime = "image/jpeg"
-    image_input = {
-        "url": f"data:{mime};base64,{b64encode(image_bytes).decode('utf-8')}",
-        "is_stream": False,
-    }
-
     try:
-        result = await bot.tagger.predict(
-            image_input, instance=None if instance == "auto" else instance,
-        )
-    except Exception as err:  # noqa: BLE001
+        test_result = await backend.tagger_test(upload.filename, instance, blob=await upload.read())
+    except ApiError as err:
         return templates.TemplateResponse(
             request, "tagger.html",
-            _tagger_ctx({"saved": False, "test_error": f"Prediction failed: {err}"}),
-            status_code=502,
+            await _tagger_ctx({"saved": False, "test_error": err.message}),
+            status_code=err.status,
         )
-
-    charas = sorted({bot.config.char_map[t] for t in result.characters if t in bot.config.char_map})
-    series = next((bot.config.series_map[t] for t in result.copyrights if t in bot.config.series_map), "")
-    safety = bot.config.safety_map.get(result.rating, "") if result.rating else ""
-
-    test_result = {
-        "filename": upload.filename,
-        "instance": result.instance,
-        "space": result.space,
-        "elapsed": f"{result.elapsed:.1f}",
-        "fell_back": result.fell_back,
-        "categories": {
-            cat: [(tag, f"{prob * 100:.1f}") for tag, prob in tags]
-            for cat, tags in result.categories.items() if tags
-        },
-        "extracted": {"characters": charas, "series": series, "safety": safety},
-    }
     return templates.TemplateResponse(
-        request, "tagger.html", _tagger_ctx({"saved": False, "test_result": test_result}),
+        request, "tagger.html", await _tagger_ctx({"saved": False, "test_result": test_result}),
     )
 
 
@@ -747,16 +872,13 @@ def _effective_api_settings() -> dict:
     return {**API_DEFAULTS, **(raw if isinstance(raw, dict) else {})}
 
 
-def _settings_ctx(extra: dict) -> dict:
-    bot = get_bot()
-    cooldown = bot.tagger.gpu_cooldown_remaining() if bot is not None else 0.0
+async def _settings_ctx(extra: dict) -> dict:
     return {
         "active_page": "settings",
         "db_path": DB_PATH,
         "api": _effective_api_settings(),
         "tagger": _effective_tagger_settings(),
-        "bot_running": bot is not None and bot.is_ready(),
-        "gpu_cooldown_min": int(cooldown // 60) + (1 if cooldown % 60 else 0),
+        **await _bot_status(),
         "saved": None,
         "api_error": None,
         **extra,
@@ -766,7 +888,7 @@ def _settings_ctx(extra: dict) -> dict:
 @app.get("/settings", response_class=HTMLResponse, dependencies=[Depends(require_auth)])
 async def settings_page(request: Request):
     return templates.TemplateResponse(
-        request, "settings.html", _settings_ctx({"saved": request.query_params.get("saved")}),
+        request, "settings.html", await _settings_ctx({"saved": request.query_params.get("saved")}),
     )
 
 
@@ -778,7 +900,7 @@ async def settings_save_api(request: Request):
     if role and not role.isdigit():
         return templates.TemplateResponse(
             request, "settings.html",
-            _settings_ctx({
+            await _settings_ctx({
                 "api_error": "Poster role ID must be a numeric Discord ID (or left blank).",
                 "api": {"poster_role_id": role, "token_expiry_days": days},
             }),
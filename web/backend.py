@@ -0,0 +1,509 @@
+"""Everything the web app needs from the Discord bot, behind one interface.
+
+LocalBackend works on the bot object directly; it is used when the web app
+shares the bot's process and event loop (main.run_combined). In the split
+deployment (main.run_split, WEB_WORKERS > 0) the web app runs in separate
+uvicorn worker processes and gets a RemoteBackend, which forwards the same
+calls to the bot process over a Unix socket (services/rpc.py).
+
+Either way the work that needs the gateway — guild/member checks, detection
+jobs, posting, tagger tests — runs next to the bot, and every call takes and
+returns plain JSON data (plus raw image bytes), so the two are interchangeable.
+The HTTP side keeps token verification, request parsing and rendering.
+"""
+from __future__ import annotations
+
+import asyncio
+import secrets
+import time
+from base64 import b64encode
+from dataclasses import dataclass
+from pathlib import Path
+
+import discord
+
+from services import posting
+from services.jobs import Job, JobQueue
+from services.rpc import RpcClient, RpcError, RpcServer, RpcUnavailable
+from services.status import status_metrics
+from services.submissions import Submission, SubmissionStore
+from utils.resilience import upstream_metrics
+from web.errors import ApiError, api_error, job_error, raise_from_pipeline
+
+DETECTION_TIMEOUT = 90          # seconds the ML detection stage may take
+JOB_MAX_WAIT = 25               # seconds a job long-poll / SSE keepalive may block
+
+
+@dataclass
+class Poster:
+    user_id: int
+    guild: discord.Guild
+    name: str
+    member: discord.Member
+
+
+def _submission_response(sub: Submission) -> dict:
+    return {
+        "submission_id": sub.id,
+        "expires_at": int(sub.expires_at),
+        "detected": sub.detected,
+        "result": sub.result,
+    }
+
+
+def _image_mime(filename: str) -> str:
+    name = filename.lower()
+    if name.endswith(".png"):
+        return "image/png"
+    if name.endswith(".webp"):
+        return "image/webp"
+    if name.endswith(".gif"):
+        return "image/gif"
+    return "image/jpeg"
+
+
+class LocalBackend:
+    def __init__(self, bot) -> None:
+        self.bot = bot
+        # SQLite metadata + spooled images; survives restarts (services/submissions.py).
+        self.store = SubmissionStore()
+        self.jobs = JobQueue(on_error=job_error)
+
+    # -- status / admin --------------------------------------------------------
+
+    async def ready(self) -> bool:
+        return self.bot.is_ready()
+
+    async def status(self) -> dict:
+        return {
+            "ready": self.bot.is_ready(),
+            "gpu_cooldown": self.bot.tagger.gpu_cooldown_remaining(),
+            "startup": self.bot.startup.metrics,
+            "rest": self.bot.rest.metrics,
+            "status_updates": status_metrics(),
+            "upstreams": upstream_metrics(),
+        }
+
+    async def reload_config(self) -> list[str]:
+        return self.bot.config.reload()
+
+    async def tagger_test(self, filename: str, instance: str, blob: bytes) -> dict:
+        """Run one image through the tagger; the tagger page's test_result."""
+        image_input = {
+            "url": f"data:{_image_mime(filename)};base64,{b64encode(blob).decode('utf-8')}",
+            "is_stream": False,
+        }
+        try:
+            result = await self.bot.tagger.predict(image_input, instance=None if instance == "auto" else instance)
+        except Exception as err:  # noqa: BLE001
+            raise ApiError(502, "prediction_failed", f"Prediction failed: {err}")
+
+        config = self.bot.config
+        charas = sorted({config.char_map[t] for t in result.characters if t in config.char_map})
+        series = next((config.series_map[t] for t in result.copyrights if t in config.series_map), "")
+        safety = config.safety_map.get(result.rating, "") if result.rating else ""
+        return {
+            "filename": filename,
+            "instance": result.instance,
+            "space": result.space,
+            "elapsed": f"{result.elapsed:.1f}",
+            "fell_back": result.fell_back,
+            "categories": {
+                cat: [(tag, f"{prob * 100:.1f}") for tag, prob in tags]
+                for cat, tags in result.categories.items() if tags
+            },
+            "extracted": {"characters": charas, "series": series, "safety": safety},
+        }
+
+    # -- auth ------------------------------------------------------------------
+
+    async def _resolve_poster(self, user_id: int, guild_id: int) -> Poster:
+        """Live guild-membership + poster-role check shared by every auth path."""
+        if not self.bot.is_ready():
+            raise ApiError(503, "api_unavailable", "The bot is not running.")
+        guild = self.bot.get_guild(guild_id)
+        if guild is None:
+            raise ApiError(403, "unknown_guild", "The bot is no longer in that server.")
+
+        # Event-maintained cache: no REST round-trip unless the member is unknown.
+        cached = await self.bot.posters.get(guild, user_id)
+        if cached.member is None:
+            raise ApiError(403, "not_member", "You are no longer a member of that server.")
+
+        role_id = self.bot.config.poster_role_id
+        if role_id is None:
+            raise ApiError(403, "not_configured", "No poster role is configured; ask an admin.")
+        if not cached.has_role(role_id):
+            raise ApiError(403, "not_poster", "You aren't allowed to post art! (Missing the poster role.)")
+
+        member = cached.member
+        return Poster(user_id=user_id, guild=guild, name=member.display_name, member=member)
+
+    async def poster(self, user_id: int, guild_id: int) -> dict:
+        poster = await self._resolve_poster(user_id, guild_id)
+        return {
+            "guild_name": poster.guild.name,
+            "user_name": poster.name,
+            "token_expiry_days": self.bot.config.token_expiry_days,
+        }
+
+    async def meta(self, user_id: int, guild_id: int) -> dict:
+        poster = await self._resolve_poster(user_id, guild_id)
+        safety_levels = sorted(self.bot.config.safety_levels)
+        # Only list forums the member can actually see — the userscript dropdown
+        # must not leak channels hidden from them.
+        forums = [
+            {"id": str(channel.id), "name": channel.name}
+            for channel in poster.guild.channels
+            if isinstance(channel, discord.ForumChannel)
+            and any(channel.name.endswith(f"-{safety}") for safety in safety_levels)
+            and channel.permissions_for(poster.member).view_channel
+        ]
+        forums.sort(key=lambda f: f["name"])
+        return {
+            "guild_id": str(poster.guild.id),
+            "guild_name": poster.guild.name,
+            "forums": forums,
+            "safety_levels": safety_levels,
+        }
+
+    # -- submissions -----------------------------------------------------------
+
+    async def _get_submission(self, sid: str, poster: Poster) -> Submission:
+        sub = await self.store.get(sid)
+        if sub is None or sub.user_id != poster.user_id:
+            raise ApiError(404, "submission_not_found", "Unknown or expired submission — submit again.")
+        return sub
+
+    async def _run_submission(
+        self,
+        job: Job,
+        poster: Poster,
+        platform: str,
+        link: str,
+        payload: dict,
+        upload: Path | None,
+        image_filename: str | None,
+    ) -> dict:
+        """Job body for POST /submissions: fetch -> hash -> dedup -> detection.
+
+        Runs on a JobQueue worker; progress goes to job.progress, the same steps
+        the Discord commands show in their status message. An uploaded image
+        arrives as a file spooled by the web side (web/uploads.py); the job owns
+        it and either moves it into the submission spool or deletes it.
+        """
+        try:
+            return await self._detect(job, poster, platform, link, payload, upload, image_filename)
+        finally:
+            if upload is not None:
+                upload.unlink(missing_ok=True)
+
+    async def _detect(
+        self,
+        job: Job,
+        poster: Poster,
+        platform: str,
+        link: str,
+        payload: dict,
+        upload: Path | None,
+        image_filename: str | None,
+    ) -> dict:
+        bot = self.bot
+        idem_key = payload.get("idempotency_key")
+        try:
+            if platform == "pixiv":
+                image_num = payload.get("image_num")
+                image_num = int(image_num) if image_num else None
+                post_data, hq_image, image_name, analysis, embed_fallback, _ = await posting.fetch_and_validate_image(
+                    bot, link, poster.guild, image_num, on_status=job.progress,
+                )
+            else:
+                image_num = None
+                post_data = {
+                    "url": link,
+                    "author_handle": payload.get("author_handle", "unknown"),
+                    "author_name": payload.get("author_name", ""),
+                    "text": payload.get("text", ""),
+                }
+                image_name = image_filename
+                try:
+                    image_bytes = await asyncio.to_thread(upload.read_bytes)
+                except OSError:
+                    raise ApiError(400, "bad_request", "The uploaded image is gone — submit again.")
+                hq_image, analysis, embed_fallback = await posting.validate_uploaded_image(
+                    bot, image_bytes, image_name, poster.guild, on_status=job.progress,
+                )
+
+            try:
+                charas_model, series, safety = await asyncio.wait_for(
+                    posting.tags_model_pass(bot, hq_image, image_name, on_status=job.progress, analysis=analysis),
+                    timeout=DETECTION_TIMEOUT,
+                )
+            except asyncio.TimeoutError:
+                raise ApiError(504, "detection_timeout", "Character detection took too long — try again.")
+
+            if platform == "pixiv":
+                charas_extra, series_extra = posting.tags_pixiv_pass(bot.config, post_data)
+            else:
+                charas_extra, series_extra = posting.tags_text_pass(bot.config, post_data.get("text", ""))
+            characters = sorted(charas_model | charas_extra)
+            if series_extra:
+                series = series_extra
+        except ApiError:
+            raise
+        except Exception as err:
+            raise_from_pipeline(err)
+
+        forum = posting.find_forum_by_name(poster.guild, series, safety)
+        if forum is not None and not forum.permissions_for(poster.member).view_channel:
+            forum = None  # never suggest a forum the member can't see
+
+        sub = Submission(
+            id=secrets.token_urlsafe(16),
+            user_id=poster.user_id,
+            guild_id=poster.guild.id,
+            platform=platform,
+            link=link,
+            image_num=image_num,
+            post_data=post_data,
+            image_name=image_name,
+            image_size=0,
+            hashes=analysis.hashes,
+            embed_fallback=embed_fallback,
+            detected={
+                "characters": characters,
+                "series": series,
+                "safety": safety,
+                "forum": {"id": str(forum.id), "name": forum.name} if forum else None,
+            },
+            created_at=time.time(),
+            analysis=analysis.to_dict(),
+        )
+        if upload is not None:
+            await self.store.put(sub, source=upload)  # rename; the bytes are already on disk
+        else:
+            await self.store.put(sub, hq_image.getvalue())
+        if idem_key:
+            await self.store.remember_idempotent(poster.user_id, idem_key, sub.id)
+        return _submission_response(sub)
+
+    async def submit(
+        self,
+        user_id: int,
+        guild_id: int,
+        payload: dict,
+        upload_path: str | None = None,
+        filename: str | None = None,
+    ) -> tuple[int, dict]:
+        """Queue detection for an already-validated request; (HTTP status, body).
+        Takes ownership of the spooled upload at upload_path, if any."""
+        upload = Path(upload_path) if upload_path else None
+        try:
+            return await self._submit(user_id, guild_id, payload, upload, filename)
+        except BaseException:
+            if upload is not None:
+                upload.unlink(missing_ok=True)
+            raise
+
+    async def _submit(
+        self,
+        user_id: int,
+        guild_id: int,
+        payload: dict,
+        upload: Path | None,
+        filename: str | None,
+    ) -> tuple[int, dict]:
+        poster = await self._resolve_poster(user_id, guild_id)
+        await self.store.maybe_sweep()
+        platform = payload.get("platform", "")
+        link = (payload.get("url") or "").strip()
+        idem_key = payload.get("idempotency_key")
+
+        # Idempotent replay: a retry of an already-processed submit returns the
+        # original outcome instead of re-running detection (or worse, re-posting).
+        if idem_key:
+            replay = None
+            entry = await self.store.get_idempotent(poster.user_id, idem_key)
+            if entry is not None:
+                if entry.result is not None:
+                    replay = 200, entry.result
+                else:
+                    existing = await self.store.get(entry.submission_id) if entry.submission_id else None
+                    if existing is not None:
+                        replay = 200, _submission_response(existing)
+            if replay is None:
+                running = self.jobs.by_key(poster.user_id, idem_key)
+                if running is not None:
+                    replay = 202, running.snapshot()
+            if replay is not None:
+                if upload is not None:
+                    upload.unlink(missing_ok=True)
+                return replay
+
+        job = self.jobs.submit(
+            poster.user_id,
+            lambda job: self._run_submission(job, poster, platform, link, payload, upload, filename),
+            idempotency_key=idem_key,
+        )
+        return 202, job.snapshot()
+
+    async def job(self, user_id: int, guild_id: int, job_id: str, wait: float = 0, version: int = -1) -> dict:
+        """Job snapshot, optionally held up to JOB_MAX_WAIT until it changes past version."""
+        poster = await self._resolve_poster(user_id, guild_id)
+        job = self.jobs.get(job_id, poster.user_id)
+        if job is None:
+            raise ApiError(404, "job_not_found", "Unknown or expired job — submit again.")
+        if wait > 0 and not job.finished:
+            await job.wait(version, min(wait, JOB_MAX_WAIT))
+        return job.snapshot()
+
+    async def submission(self, user_id: int, guild_id: int, sid: str) -> dict:
+        poster = await self._resolve_poster(user_id, guild_id)
+        return _submission_response(await self._get_submission(sid, poster))
+
+    async def discard(self, user_id: int, guild_id: int, sid: str) -> dict:
+        poster = await self._resolve_poster(user_id, guild_id)
+        # Under the confirm lock: a confirm in flight finishes (or fails) first.
+        async with self.store.lock(sid):
+            sub = await self._get_submission(sid, poster)
+            if sub.result is not None:
+                # Already posted — keep the row so a retried confirm replays it.
+                return {"discarded": False, "result": sub.result}
+            await self.store.discard(sub.id)
+        return {"discarded": True}
+
+    async def confirm(self, user_id: int, guild_id: int, sid: str, body: dict) -> dict:
+        poster = await self._resolve_poster(user_id, guild_id)
+        await self.store.maybe_sweep()
+        sub = await self._get_submission(sid, poster)
+
+        characters = (body.get("characters") or "").strip()
+        if not characters:
+            raise ApiError(400, "bad_request", "Missing 'characters'.")
+        try:
+            forum_id = int(body.get("forum_id"))
+        except (TypeError, ValueError):
+            raise ApiError(400, "forum_not_found", "Missing or invalid 'forum_id'.")
+        forum = poster.guild.get_channel(forum_id)
+        # Same error for "doesn't exist" and "hidden from you" so hidden channel
+        # ids can't be probed.
+        if not isinstance(forum, discord.ForumChannel) or not forum.permissions_for(poster.member).view_channel:
+            raise ApiError(400, "forum_not_found", "That forum channel does not exist.")
+
+        async with self.store.lock(sid):
+            # Re-read under the lock: a concurrent confirm may have just posted.
+            sub = await self._get_submission(sid, poster)
+            if sub.result is not None:
+                # Double click / retried confirm after success — never post twice.
+                return sub.result
+
+            try:
+                threads, _, _ = await posting.find_character_threads(forum, characters, rest=self.bot.rest)
+                try:
+                    img = await self.store.read_image(sub)
+                except KeyError:
+                    raise ApiError(404, "submission_not_found", "Unknown or expired submission — submit again.")
+                links_text, post_id = await posting.create_embed_and_send(
+                    self.bot, sub.link, sub.post_data, threads, poster.name, poster.guild.id, forum.name,
+                    sub.embed_fallback, img, sub.image_name, sub.hashes, sub.image_num, sub.platform,
+                )
+            except ApiError:
+                raise
+            except Exception as err:
+                # Submission is kept so the userscript can adjust fields and retry.
+                raise_from_pipeline(err)
+
+            result = {
+                "thread_links": [line[2:] for line in links_text.split("\n") if line.startswith("- ")],
+                "note": next((line for line in links_text.split("\n") if line.startswith("**NOTE:")), None),
+                "post_id": post_id,
+                "forum_url": forum.jump_url,
+            }
+            # Keep the outcome (and under the idempotency key), drop the (large) image.
+            await self.store.complete(sub, result)
+        return result
+
+
+# Methods callable over RPC; everything else on LocalBackend stays private.
+RPC_METHODS = (
+    "ready", "status", "reload_config", "tagger_test",
+    "poster", "meta", "submit", "job", "submission", "discard", "confirm",
+)
+
+
+def serve(backend: LocalBackend, path: str) -> RpcServer:
+    """RPC server exposing backend to web workers (see main.run_split)."""
+    return RpcServer(
+        path,
+        {name: getattr(backend, name) for name in RPC_METHODS},
+        on_error=lambda err: api_error(err).to_dict(),
+    )
+
+
+class RemoteBackend:
+    """LocalBackend's interface, forwarded to the bot process."""
+
+    def __init__(self, path: str) -> None:
+        self.client = RpcClient(path)
+
+    async def _call(self, method: str, blob: bytes | None = None, **params):
+        try:
+            return await self.client.call(method, blob=blob, **params)
+        except RpcError as err:
+            raise ApiError.from_dict(err.payload) from None
+        except RpcUnavailable:
+            raise ApiError(503, "api_unavailable", "The bot is not running.") from None
+
+    async def ready(self) -> bool:
+        try:
+            return await self._call("ready")
+        except ApiError:
+            return False
+
+    async def status(self) -> dict:
+        try:
+            return await self._call("status")
+        except ApiError:
+            return {"ready": False, "gpu_cooldown": 0.0}
+
+    async def reload_config(self) -> list[str]:
+        return await self._call("reload_config")
+
+    async def tagger_test(self, filename: str, instance: str, blob: bytes) -> dict:
+        return await self._call("tagger_test", blob=blob, filename=filename, instance=instance)
+
+    async def poster(self, user_id: int, guild_id: int) -> dict:
+        return await self._call("poster", user_id=user_id, guild_id=guild_id)
+
+    async def meta(self, user_id: int, guild_id: int) -> dict:
+        return await self._call("meta", user_id=user_id, guild_id=guild_id)
+
+    async def submit(
+        self,
+        user_id: int,
+        guild_id: int,
+        payload: dict,
+        upload_path: str | None = None,
+        filename: str | None = None,
+    ) -> tuple[int, dict]:
+        # The upload is passed by path: workers and the bot share the spool directory.
+        status, body = await self._call(
+            "submit", user_id=user_id, guild_id=guild_id, payload=payload,
+            upload_path=upload_path, filename=filename,
+        )
+        return status, body
+
+    async def job(self, user_id: int, guild_id: int, job_id: str, wait: float = 0, version: int = -1) -> dict:
+        return await self._call("job", user_id=user_id, guild_id=guild_id, job_id=job_id, wait=wait, version=version)
+
+    async def submission(self, user_id: int, guild_id: int, sid: str) -> dict:
+        return await self._call("submission", user_id=user_id, guild_id=guild_id, sid=sid)
+
+    async def discard(self, user_id: int, guild_id: int, sid: str) -> dict:
+        return await self._call("discard", user_id=user_id, guild_id=guild_id, sid=sid)
+
+    async def confirm(self, user_id: int, guild_id: int, sid: str, body: dict) -> dict:
+        return await self._call("confirm", user_id=user_id, guild_id=guild_id, sid=sid, body=body)
+
+    async def close(self) -> None:
+        await self.client.close()
@@ -0,0 +1,355 @@
+"""In-memory, indexed view of one dict-type config file for the web editor.
+
+The JSON file stays the source of truth for the bot. The store keeps it
+parsed in memory with:
+
+  * a sorted key list (case-insensitive; a SortedList, so an edit is
+    O(log n) rather than a list memmove), so a page is a slice;
+  * a trigram index over "key value" (lowercased), so a search only verifies
+    the entries that contain every trigram of the query.
+
+Edits apply in memory and are appended to <file>.journal (one JSON line per
+operation) instead of rewriting the file. A compaction rewrites the JSON from
+memory, truncates the journal and rebuilds the trigram postings if many
+entries went stale. It runs COMPACT_DELAY after the last edit, or right away
+once JOURNAL_MAX operations are pending. A journal left behind by a crash is
+replayed on load. Files written by anything else (the Danbooru refresh,
+/update commands) are noticed by stat and re-read, with pending journal
+operations applied on top.
+
+Several web workers (main.run_split) may edit the same file. They share the
+journal, appending under an flock on <file>.lock, and a compaction holds that
+lock while it writes: if another process compacted in the meantime or left
+edits in the journal, the compacting store first reloads the file and replays
+the whole journal, so no worker's edit is overwritten by another's.
+"""
+from __future__ import annotations
+
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import secrets
+from array import array
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable
+
+from sortedcontainers import SortedList
+
+COMPACT_DELAY = 2.0     # seconds of quiet before pending edits are written out
+JOURNAL_MAX = 1000      # pending operations that force a compaction
+MIN_TRIGRAM = 3
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _trigrams(text: str) -> set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _sort_key(key: str) -> tuple[str, str]:
+    return key.lower(), key
+
+
+class ConfigStore:
+    def __init__(
+        self,
+        path: Path,
+        on_compact: Callable[[dict], None],
+        after_compact: Callable[[], None] | None = None,
+    ) -> None:
+        """on_compact(data) writes the full map to path (runs in a worker thread);
+        after_compact() runs on the event loop once the file is in place."""
+        self.path = path
+        self.journal_path = path.with_suffix(".journal")
+        self.lock_path = path.with_suffix(".lock")
+        self._source = secrets.token_hex(4)   # tags this store's journal entries
+        self._lock_fd: int | None = None      # held file lock, during a compaction
+        self.on_compact = on_compact
+        self.after_compact = after_compact
+        self._write_lock = asyncio.Lock()
+        self.generation = 0
+        self._pending: list[dict] = []
+        self._compact_task: asyncio.Task | None = None
+        self._search_cache: tuple[str, int, list[str]] | None = None
+        self._replayed = self._load()
+
+    @classmethod
+    async def open(
+        cls,
+        path: Path,
+        on_compact: Callable[[dict], None],
+        after_compact: Callable[[], None] | None = None,
+    ) -> ConfigStore:
+        """Build a store with the parse and journal replay off the event loop."""
+        store = await asyncio.to_thread(cls, path, on_compact, after_compact)
+        store.start()
+        return store
+
+    def start(self) -> None:
+        """Write out a journal replayed on load; call once the store is in use."""
+        if self._replayed:
+            self._replayed = 0
+            self._schedule_compaction(0)
+
+    # -- loading / indexes ---------------------------------------------------
+
+    def _file_stamp(self) -> tuple[int, int] | None:
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load(self) -> int:
+        """Read the file and replay the journal on top; returns the number of replayed ops."""
+        stamp = self._file_stamp()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        self.data: dict[str, str] = data if isinstance(data, dict) else {}
+        self._stamp = stamp
+        self._rebuild_index()
+
+        replay = self._read_journal()
+        for op in replay:
+            self._apply(op)
+        return len(replay)
+
+    def _read_journal(self) -> list[dict]:
+        ops = []
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        ops.append(json.loads(line))
+                    except ValueError:
+                        break  # torn final line from a crash
+        except OSError:
+            pass
+        return ops
+
+    def _rebuild_index(self) -> None:
+        self._sorted = SortedList(_sort_key(k) for k in self.data)
+        self._ids: dict[str, int] = {}
+        self._entries: list[tuple[str, str] | None] = []
+        self._grams: dict[str, array] = {}
+        self._stale = 0
+        for key, value in self.data.items():
+            self._index(key, value)
+        self.generation += 1
+
+    def _index(self, key: str, value) -> None:
+        entry_id = len(self._entries)
+        self._entries.append((key, value))
+        self._ids[key] = entry_id
+        for gram in _trigrams(f"{key.lower()}\n{str(value).lower()}"):
+            postings = self._grams.get(gram)
+            if postings is None:
+                postings = self._grams[gram] = array("I")
+            postings.append(entry_id)
+
+    def _unindex(self, key: str) -> None:
+        # Postings are left in place and skipped at query time until compaction.
+        self._entries[self._ids.pop(key)] = None
+        self._stale += 1
+
+    def refresh(self) -> None:
+        """Re-read the file if something else rewrote it."""
+        if self._file_stamp() != self._stamp:
+            LOGGER.info(f"{self.path.name} changed on disk; reloading editor index")
+            if self._load() and not self._pending:
+                self._schedule_compaction(COMPACT_DELAY)  # edits another process left behind
+
+    # -- reads ---------------------------------------------------------------
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.data
+
+    def __getitem__(self, key: str):
+        return self.data[key]
+
+    def get(self, key: str, default=None):
+        return self.data.get(key, default)
+
+    def count(self, search: str = "") -> int:
+        return len(self.search(search)) if search else len(self.data)
+
+    def search(self, text: str) -> list[str]:
+        """Keys whose key or value contains text (case-insensitive), sorted."""
+        needle = text.lower()
+        cached = self._search_cache
+        if cached and cached[0] == needle and cached[1] == self.generation:
+            return cached[2]
+        if len(needle) < MIN_TRIGRAM:
+            hits = [key for _, key in self._sorted
+                    if needle in key.lower() or needle in str(self.data[key]).lower()]
+        else:
+            postings = []
+            for gram in _trigrams(needle):
+                found = self._grams.get(gram)
+                if found is None:
+                    postings = []
+                    break
+                postings.append(found)
+            hits = []
+            if postings:
+                postings.sort(key=len)
+                candidates = set(postings[0])
+                for other in postings[1:]:
+                    candidates.intersection_update(other)
+                    if not candidates:
+                        break
+                for entry_id in candidates:
+                    entry = self._entries[entry_id]
+                    if entry and (needle in entry[0].lower() or needle in str(entry[1]).lower()):
+                        hits.append(entry[0])
+                hits.sort(key=_sort_key)
+        self._search_cache = (needle, self.generation, hits)
+        return hits
+
+    def page(self, page: int, size: int, search: str = "") -> tuple[list[tuple[str, str]], int]:
+        """One page of (key, value) in key order, and the number of matching entries."""
+        start = (page - 1) * size
+        if search:
+            keys = self.search(search)
+            return [(k, self.data[k]) for k in keys[start:start + size]], len(keys)
+        return [(k, self.data[k]) for _, k in self._sorted.islice(start, start + size)], len(self._sorted)
+
+    # -- writes --------------------------------------------------------------
+
+    def _apply(self, op: dict) -> None:
+        key = op["key"]
+        if key in self.data:
+            self._unindex(key)
+            if op["op"] == "del":
+                del self.data[key]
+                self._sorted.remove(_sort_key(key))
+        elif op["op"] == "set":
+            self._sorted.add(_sort_key(key))
+        if op["op"] == "set":
+            self.data[key] = op["value"]
+            self._index(key, op["value"])
+        self.generation += 1
+
+    def _record(self, ops: list[dict]) -> None:
+        for op in ops:
+            op["src"] = self._source
+            self._apply(op)
+        with self._journal_lock():
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(op, ensure_ascii=False) + "\n" for op in ops))
+        self._pending.extend(ops)
+        self._schedule_compaction(0 if len(self._pending) >= JOURNAL_MAX else COMPACT_DELAY)
+
+    def set(self, key: str, value: str) -> None:
+        self._record([{"op": "set", "key": key, "value": value}])
+
+    def delete(self, key: str) -> None:
+        if key in self.data:
+            self._record([{"op": "del", "key": key}])
+
+    def update(self, items: dict[str, str]) -> None:
+        if items:
+            self._record([{"op": "set", "key": k, "value": v} for k, v in items.items()])
+
+    # -- cross-process locking -----------------------------------------------
+
+    def _open_lock(self) -> int:
+        return os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    @contextmanager
+    def _journal_lock(self):
+        if self._lock_fd is not None:
+            yield  # our own compaction holds the lock; nobody else can append
+            return
+        fd = self._open_lock()
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    async def _acquire_file_lock(self) -> None:
+        fd = self._open_lock()
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                await asyncio.sleep(0.05)
+        self._lock_fd = fd
+
+    def _release_file_lock(self) -> None:
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    # -- compaction ----------------------------------------------------------
+
+    def _schedule_compaction(self, delay: float) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.compact_now()  # no loop (startup / scripts): write synchronously
+            return
+        if self._compact_task and not self._compact_task.done():
+            self._compact_task.cancel()
+        self._compact_task = loop.create_task(self._compact_later(delay))
+
+    def _merge(self) -> tuple[dict, int]:
+        """With the file lock held: bring memory up to file + whole journal.
+        Returns the map to write and how many journal entries it covers."""
+        ops = self._read_journal()
+        foreign = any(op.get("src") != self._source for op in ops)
+        if foreign or self._file_stamp() != self._stamp:
+            self._load()
+        return dict(self.data), len(ops)
+
+    async def _compact_later(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        self._compact_task = None  # edits from here on schedule a fresh compaction
+        async with self._write_lock:
+            await self._acquire_file_lock()
+            try:
+                data, done = self._merge()
+                await asyncio.to_thread(self.on_compact, data)
+                self._finish_compaction(done)
+            finally:
+                self._release_file_lock()
+        if self.after_compact:
+            self.after_compact()
+
+    def compact_now(self) -> None:
+        fd = self._open_lock()
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            self._lock_fd = fd
+            data, done = self._merge()
+            self.on_compact(data)
+            self._finish_compaction(done)
+        finally:
+            self._lock_fd = None
+            os.close(fd)
+        if self.after_compact:
+            self.after_compact()
+
+    def _finish_compaction(self, done: int) -> None:
+        self._stamp = self._file_stamp()
+        # Only entries appended (by this process) while the file was being written remain.
+        self._pending = self._read_journal()[done:]
+        tmp = self.journal_path.with_suffix(".journal.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("".join(json.dumps(op, ensure_ascii=False) + "\n" for op in self._pending))
+        tmp.replace(self.journal_path)
+        if not self._pending:
+            self.journal_path.unlink(missing_ok=True)
+        if self._stale > len(self._entries) // 2:
+            self._rebuild_index()
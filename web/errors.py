@@ -0,0 +1,58 @@
+"""Userscript API errors — every error body is flat JSON: {"code": ..., "message": ...}.
+
+Shared by the routes (web/api.py) and the bot-side backend (web/backend.py),
+which raises them in whichever process runs the pipeline.
+"""
+from __future__ import annotations
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+import exception
+from services import posting
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, code: str, message: str, **extra):
+        self.status = status
+        self.code = code
+        self.message = message
+        self.extra = extra
+
+    def to_dict(self) -> dict:
+        """The flat error body plus the HTTP status it maps to."""
+        return {"status": self.status, "code": self.code, "message": self.message, **self.extra}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ApiError":
+        extra = {k: v for k, v in data.items() if k not in ("status", "code", "message")}
+        return cls(data.get("status", 500), data.get("code", "internal_error"), data.get("message", ""), **extra)
+
+
+async def api_error_handler(_: Request, err: ApiError) -> JSONResponse:
+    return JSONResponse({"code": err.code, "message": err.message, **err.extra}, status_code=err.status)
+
+
+def api_error(err: Exception) -> ApiError:
+    """Translate a posting-pipeline exception into an ApiError."""
+    if isinstance(err, ApiError):
+        return err
+    status, code, message = posting.error_payload(err)
+    extra = {}
+    if isinstance(err, exception.ThreadsNotFound):
+        original = str(getattr(err, "original", ""))
+        extra["missing"] = [line[2:] for line in original.split("\n") if line.startswith("- ")]
+    if isinstance(err, exception.DuplicateImageFound):
+        original = str(getattr(err, "original", ""))
+        if original.startswith("Post: "):
+            extra["existing_post"] = original.removeprefix("Post: ")
+    return ApiError(status, code, message, **extra)
+
+
+def raise_from_pipeline(err: Exception):
+    raise api_error(err) from err
+
+
+def job_error(err: Exception) -> dict:
+    """JobQueue on_error hook: the flat error body plus the HTTP status it maps to."""
+    return api_error(err).to_dict()
@@ -0,0 +1,201 @@
+"""Streaming multipart parser for userscript image submissions.
+
+Starlette's request.form() buffers the whole upload before the route sees it,
+and reading it back with upload.read() holds another full copy in memory.
+Here the request body is fed chunk by chunk to python-multipart instead:
+
+  * a Content-Length over the limit is refused before the body is read;
+  * the image part goes straight to a file under <spool>/incoming while the
+    byte count is checked, so an oversized upload stops at the limit;
+  * its first bytes are checked against known image signatures, so a non-image
+    is refused after a few bytes rather than 50MB;
+  * the small JSON "payload" field is kept in memory, with its own cap.
+
+The spooled file is handed to the backend by path; SubmissionStore.put moves
+it into the submission spool once detection succeeds.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import secrets
+from dataclasses import dataclass
+from pathlib import Path
+
+try:
+    from python_multipart.exceptions import FormParserError
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.exceptions import FormParserError
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from services.submissions import DEFAULT_SPOOL_DIR, UPLOAD_SUBDIR
+from web.errors import ApiError
+
+UPLOAD_DIR = Path(os.getenv("SUBMISSION_SPOOL_DIR") or DEFAULT_SPOOL_DIR) / UPLOAD_SUBDIR
+MAX_PAYLOAD_BYTES = 64 * 1024   # the JSON "payload" field
+FORM_OVERHEAD = 16 * 1024       # boundaries and part headers on top of the two fields
+SNIFF_BYTES = 12
+
+# (offset, signature) pairs that identify the formats Discord will embed.
+IMAGE_SIGNATURES: tuple[tuple[int, bytes], ...] = (
+    (0, b"\xff\xd8\xff"),           # JPEG
+    (0, b"\x89PNG\r\n\x1a\n"),      # PNG
+    (0, b"GIF87a"),
+    (0, b"GIF89a"),
+    (8, b"WEBP"),                   # RIFF....WEBP
+)
+
+
+def looks_like_image(head: bytes) -> bool:
+    return any(head[offset:offset + len(sig)] == sig for offset, sig in IMAGE_SIGNATURES)
+
+
+@dataclass
+class SpooledUpload:
+    path: Path
+    filename: str
+    size: int
+
+    def discard(self) -> None:
+        self.path.unlink(missing_ok=True)
+
+
+class _SubmissionForm:
+    """python-multipart callbacks collecting the payload field and spooling the image."""
+
+    def __init__(self, max_image_bytes: int) -> None:
+        self.max_image_bytes = max_image_bytes
+        self.payload = bytearray()
+        self.upload: SpooledUpload | None = None
+        self.error: ApiError | None = None
+        self._headers: dict[bytes, bytes] = {}
+        self._field = b""
+        self._value = b""
+        self._part: str | None = None
+        self._head = bytearray()
+        self._chunks: list[bytes] = []   # image bytes waiting to be written
+        self._file = None
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self._part_begin,
+            "on_header_field": self._header_field,
+            "on_header_value": self._header_value,
+            "on_header_end": self._header_end,
+            "on_headers_finished": self._headers_finished,
+            "on_part_data": self._part_data,
+        }
+
+    def _fail(self, err: ApiError) -> None:
+        if self.error is None:
+            self.error = err
+
+    def _part_begin(self) -> None:
+        self._headers = {}
+        self._part = None
+
+    def _header_field(self, data: bytes, start: int, end: int) -> None:
+        self._field += data[start:end]
+
+    def _header_value(self, data: bytes, start: int, end: int) -> None:
+        self._value += data[start:end]
+
+    def _header_end(self) -> None:
+        self._headers[self._field.lower()] = self._value
+        self._field = self._value = b""
+
+    def _headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        if name == "image" and self.upload is None:
+            filename = options.get(b"filename", b"").decode("utf-8", "replace")
+            path = UPLOAD_DIR / f"{secrets.token_urlsafe(12)}.part"
+            self.upload = SpooledUpload(path=path, filename=os.path.basename(filename) or "upload.jpg", size=0)
+            self._part = "image"
+        elif name == "payload":
+            self._part = "payload"
+        else:
+            self._part = None  # unknown fields are skipped
+
+    def _part_data(self, data: bytes, start: int, end: int) -> None:
+        if self.error is not None:
+            return
+        chunk = data[start:end]
+        if self._part == "payload":
+            self.payload += chunk
+            if len(self.payload) > MAX_PAYLOAD_BYTES:
+                self._fail(ApiError(413, "too_large", "'payload' field is too large."))
+        elif self._part == "image":
+            self.upload.size += len(chunk)
+            if self.upload.size > self.max_image_bytes:
+                self._fail(ApiError(413, "too_large", "Image exceeds the 50MB upload limit."))
+                return
+            if len(self._head) < SNIFF_BYTES:
+                self._head += chunk[:SNIFF_BYTES - len(self._head)]
+                if len(self._head) >= SNIFF_BYTES and not looks_like_image(bytes(self._head)):
+                    self._fail(ApiError(415, "unsupported_image", "Uploaded file is not a JPEG, PNG, GIF or WebP image."))
+                    return
+            self._chunks.append(chunk)
+
+    async def flush(self) -> None:
+        """Write out image data collected from the last body chunk."""
+        if not self._chunks or self.error is not None:
+            return
+        data, self._chunks = b"".join(self._chunks), []
+        if self._file is None:
+            UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+            self._file = await asyncio.to_thread(open, self.upload.path, "wb")
+        await asyncio.to_thread(self._file.write, data)
+
+    async def close(self) -> None:
+        if self._file is not None:
+            await asyncio.to_thread(self._file.close)
+            self._file = None
+
+    def finish(self) -> None:
+        if self.error is None and self.upload is not None and self.upload.size:
+            if len(self._head) < SNIFF_BYTES and not looks_like_image(bytes(self._head)):
+                self._fail(ApiError(415, "unsupported_image", "Uploaded file is not a JPEG, PNG, GIF or WebP image."))
+
+
+async def read_submission_form(request, max_image_bytes: int) -> tuple[bytes, SpooledUpload]:
+    """Stream a multipart submission: (raw payload field, spooled image).
+
+    Raises ApiError for oversized, malformed or non-image uploads; nothing is
+    left on disk in that case.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise ApiError(400, "bad_request", "Expected a multipart/form-data body with a boundary.")
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_image_bytes + MAX_PAYLOAD_BYTES + FORM_OVERHEAD:
+        raise ApiError(413, "too_large", "Image exceeds the 50MB upload limit.")
+
+    form = _SubmissionForm(max_image_bytes)
+    parser = MultipartParser(boundary, form.callbacks())
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            await form.flush()
+            if form.error is not None:
+                break
+        else:
+            parser.finalize()
+            form.finish()
+    except FormParserError:
+        form._fail(ApiError(400, "bad_request", "Malformed multipart body."))
+    finally:
+        await form.close()
+
+    if form.error is None:
+        if form.upload is None or not form.payload:
+            form._fail(ApiError(400, "bad_request", "Multipart submissions need 'image' and 'payload' fields."))
+        elif not form.upload.size:
+            form._fail(ApiError(400, "bad_request", "Uploaded image is empty."))
+    if form.error is not None:
+        if form.upload is not None:
+            form.upload.discard()
+        raise form.error
+    return bytes(form.payload), form.upload